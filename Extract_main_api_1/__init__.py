@@ -1,112 +1,45 @@
 import logging
 import os
-import tempfile
 import azure.functions as func
-import requests
-import json
-from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient
-from util.common_func import convert_timestamp_to_myt_date
-from typing import Tuple, Dict, Any, Optional, List, Union
-
-
-def fetch_data_api(website_url: str) -> Optional[Tuple[List[Dict[str, Any]]]]:
-    """
-    Fetches JSON data from a given API URL, processes it, and returns specific parts.
-
-    Args:
-        website_url (str): The URL of the API endpoint to fetch data from.
-
-    Returns:
-        Optional[Tuple[List[Dict[str, Any]], ...]]: A tuple containing lists of dictionaries
-        for 'events', 'teams', 'elements', and 'element_types' if successful.
-        Returns None if an error occurs during the API call or data processing.
-    """
-    try:
-        player_team_detail_url = website_url
-        response = requests.get(player_team_detail_url, stream=True, timeout=2)
-        response.raise_for_status()
-        data = response.json()
-        processed_data = remove_key_in_position(data)
-        return processed_data["events"], processed_data["teams"], processed_data["elements"], processed_data["element_types"]
-    except Exception as e:
-        logging.error(f"An error occured: {e}")
-        return None
-    
-
-def remove_key_in_position(position_data: Dict[str, Any]) -> Dict[str, Any]:
+from util.common_func import validate_file_date
+from util.extractor import extract_endpoints
+from util.column_profiles import parse_column_profiles
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from typing import Tuple, Dict, Any, List, Optional
+
+"""
+Extracts endpoints of the registry in util.endpoint_registry into the landing folder. bootstrap_static is extracted
+by default. Other endpoints are extracted with the endpoints parameter or the ExtractorEndpoints setting,
+e.g. endpoints=bootstrap_static,fixtures,event_live. Every landing data source of an endpoint becomes its own
+raw_fpl_<data_source>_<ingest_date>_<timestamp>.json file.
+Wide data sources can be landed with fewer fields with the column_profiles parameter or the ExtractorColumnProfiles
+setting, e.g. column_profiles=minimal or column_profiles=player_metadata:analytics. See util.column_profiles.
+"""
+
+DEFAULT_ENDPOINTS = 'bootstrap_static'
+
+
+def extract_bootstrap_static(ingest_date: str, storage, column_profiles: Optional[Dict[str, str]] = None, rows_by_source: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> Dict[str, Tuple[str, List[Dict[str, Any]]]]:
     """
-    Removes the "sub_positions_locked" key from each dictionary
-    within the "element_types" list in the input data.
+    Extracts events, teams, players and positions from bootstrap-static API and uploads each of them
+    as a JSONL file into the landing folder.
 
     Args:
-        position_data (Dict[str, Any]): A dictionary expected to contain an
-                                        "element_types" key, whose value is
-                                        a list of dictionaries.
+        ingest_date (str): The ingest date to be used in the file name. Date format should be ddMMyyyy.
+        storage: The storage backend from util.storage.
+        column_profiles (Optional[Dict[str, str]]): Column profile keyed by data source. Every field is landed when not supplied.
+        rows_by_source (Optional[Dict[str, List[Dict[str, Any]]]]): Rows of bootstrap-static fetched before, landed
+                                                                    instead of calling the API again.
 
     Returns:
-        Dict[str, Any]: The modified dictionary after removing the specified key.
-                        Returns the original dictionary if "element_types" key
-                        is not found or if its value is not a list.
-    """
-    for position in position_data["element_types"]:
-        del position["sub_positions_locked"]
-    return position_data
-
-    
-
-def create_json_data(file_path: str, file_name_json: str, data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> None:
+        Dict[str, Tuple[str, List[Dict[str, Any]]]]: Landing file name and rows for each metadata
+        (e.g., {"player_metadata": ("raw_fpl_player_metadata_....json", [...])}). Empty if the API call fails.
     """
-    Writes data to a file in JSON Lines (JSONL) format. Each item in the data
-    (or the data itself if it's a single dictionary) is written as a separate
-    JSON object followed by a newline.
+    return extract_endpoints(ingest_date, storage, ['bootstrap_static'], column_profiles=column_profiles, rows_by_source=rows_by_source)
 
-    Args:
-        file_path (str): The directory path where the file will be created (e.g., "data/output").
-        file_name_json (str): The name of the JSON file (e.g., "output.jsonl").
-        data (Union[Dict[str, Any], List[Dict[str, Any]]]): The data to write.
-            Can be a single dictionary or a list of dictionaries.
-    """
-    full_file_path = os.path.join(file_path, file_name_json)
-    data_to_write = data if isinstance(data, list) else [data]
-
-    with open(full_file_path, "w") as file:
-        for item in data_to_write:
-            json_line = json.dumps(item)
-            file.write(json_line + '\n')
-            
-    logging.info(f"{file_path} data is created")
-
-
-def create_blob_directory(local_filepath: str, file_name_json: str, storage_account_url: str, storage_account_container: str) -> bool:
-    """
-    Uploads a local file to a specified 'landing' directory within an Azure Blob Storage container.
-
-    Args:
-        local_filepath (str): The local directory path where the file is located (e.g., "C:/data/output").
-        file_name_json (str): The name of the file to upload (e.g., "my_data.json").
-        storage_account_url (str): The URL of the Azure Storage account (e.g., "https://youraccount.blob.core.windows.net").
-        storage_account_container (str): The name of the target container in Blob Storage (e.g., "raw-data").
-
-    Returns:
-        bool: True if the file was successfully uploaded, False otherwise.
-    """
-    try:
-        default_credential = DefaultAzureCredential()
-        blob_service_client = BlobServiceClient(storage_account_url, credential=default_credential)
-        container_client = blob_service_client.get_container_client(storage_account_container)
-        landing_file_upload_path = f"landing/{file_name_json}"
-        full_local_file_path = os.path.join(local_filepath, file_name_json)
-        blob_client = container_client.get_blob_client(landing_file_upload_path)
-        with open(full_local_file_path, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True)
-        logging.info(f"File has been uploaded to {landing_file_upload_path}")
-        return True
-    except Exception as e:
-        logging.error(f"An error occured: {str(e)}")
-
-   
 
+@profile_invocation
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Python HTTP trigger function processed a request.")
 
@@ -116,28 +49,24 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
         if not ingest_date:
             return func.HttpResponse(
-                "No parameter supplied. Please provide a 'ingest_date' based on the file to be ingested. Date format should be YYYYMMDD",
+                "No parameter supplied. Please provide a 'ingest_date' based on the file to be ingested. Date format should be ddMMyyyy",
                 status_code=400
             )
-        
-        storage_account_url = os.getenv("StorageAccountUrl")
-        logging.info(f"{storage_account_url}")
-        storage_account_container = os.getenv("StorageAccountContainer")
-        logging.info(f"{storage_account_container}")
-        if not storage_account_url or not storage_account_container:
-            raise ValueError("Storage account URL or container not set in environment variables")
-        
-        url_list = "https://fantasy.premierleague.com/api/bootstrap-static/"
-        metadata = ["events_metadata", "team_metadata", "player_metadata", "position_metadata"]
-        local_filepath = tempfile.gettempdir()
-        data = fetch_data_api(url_list)
-        if data:
-                zipped_api = zip(metadata, data)
-                for attribute_name,data in zipped_api:
-                    current_timestamp = convert_timestamp_to_myt_date()
-                    file_name_json = f"raw_fpl_{attribute_name}_{ingest_date}_{current_timestamp}.json"
-                    create_json_data(local_filepath, file_name_json, data)
-                    create_blob_directory(local_filepath, file_name_json, storage_account_url, storage_account_container)
+
+        try:
+            validate_file_date(ingest_date)
+        except ValueError as e:
+            return func.HttpResponse(str(e), status_code=400)
+
+        try:
+            column_profiles = parse_column_profiles(req.params.get('column_profiles') or os.getenv("ExtractorColumnProfiles"))
+        except ValueError as e:
+            return func.HttpResponse(str(e), status_code=400)
+
+        endpoints = (req.params.get('endpoints') or os.getenv("ExtractorEndpoints") or DEFAULT_ENDPOINTS).split(',')
+        landing_files = extract_endpoints(ingest_date, get_storage(), endpoints, column_profiles=column_profiles)
+        if not landing_files:
+            return func.HttpResponse(f"No data extracted from endpoints {endpoints}.", status_code=500)
         return func.HttpResponse(f"Data from external API ingested successfully.", status_code=200)
     except Exception as e:
-        return func.HttpResponse(f"An error occured: {str(e)}", status_code=500)
\ No newline at end of file
+        return func.HttpResponse(f"An error occured: {str(e)}", status_code=500)
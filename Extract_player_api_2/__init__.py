@@ -1,181 +1,526 @@
 import logging
-import tempfile
 import azure.functions as func
-import requests
 import os
 import json
-from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient, ContainerClient, BlobPrefix
-from util.common_func import convert_timestamp_to_myt_date
-from typing import Tuple, Dict, Any, Optional, List, Union
+import uuid
+from util.common_func import convert_timestamp_to_myt_date, create_season_value, validate_file_date
+from util.compression import compress, decompress, get_content_encoding, get_landing_file_name
+from util.extractor import fetch_endpoints, find_latest_landing_path
+from util.instrumentation import instrument, record_metrics
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from util.async_storage import read_many, delete_many
+from util.work_queue import BindingQueue, LocalQueue
+from util.fixture_cache import apply_finished_fixture_cache, save_finished_fixture_cache
+from typing import Tuple, Dict, Any, Optional, List
 
+"""
+Player history is extracted in one invocation (mode=single) or fanned out across instances (mode=fan_out).
+In fan-out mode the player IDs are split into shards and one queue message is sent per shard. Every shard is
+processed by Extract_player_shard_2, which writes a partial file to work/player_history/<run_id>/. The shard
+worker that finds every partial file merges them into the landing file and removes the work folder.
 
-def download_blob(storage_account_url: str, container_name: str, local_temp_file_path: str, source_blob_path: str) -> bool:
+In single mode the players are extracted in checkpoints of PlayerHistoryCheckpointSize players. Rows of every
+checkpoint are flushed to work/player_history/checkpoint_<ingest_date>/ with a progress cursor of extracted and
+failed player IDs, so a rerun of the ingest date resumes from the last checkpoint and only requests the players left,
+including players whose request has failed. A player failing in PlayerHistoryMaxAttempts runs is left out.
+
+Rows of finished fixtures that are already in the finished fixture cache (util.fixture_cache) are left out of the
+landing file, so the daily file only holds the current gameweek. use_cache=false writes the whole season.
+"""
+
+PLAYER_METADATA_PREFIX = 'raw_fpl_player_metadata_'
+EVENTS_METADATA_PREFIX = 'raw_fpl_events_metadata_'
+PLAYER_HISTORY_WORK_FOLDER = 'work/player_history'
+DEFAULT_SHARD_SIZE = 100
+DEFAULT_SHARD_WORKERS = 4
+DEFAULT_CHECKPOINT_SIZE = 100
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+@instrument('read')
+def download_landing_metadata(storage, file_prefixes: List[str]) -> Dict[str, Optional[List[Dict[str, Any]]]]:
     """
-    Downloads a blob from Azure Blob Storage to a specified local temporary file path.
+    Downloads the latest landing file of each prefix in parallel and returns its rows.
 
     Args:
-        storage_account_url (str): The URL of the Azure Storage account (e.g., "https://youraccount.blob.core.windows.net").
-        container_name (str): The name of the container where the blob resides.
-        local_temp_file_path (str): The full local path, including the filename, where the blob will be saved.
-                                    (e.g., "C:/temp/downloaded_data.json").
-        source_blob_path (str): The full path of the blob within the container (e.g., "landing/my_data.json").
+        storage: The storage backend from util.storage (ADLS2 container, local folder or memory).
+        file_prefixes (List[str]): The prefixes of the file names (e.g., ["raw_fpl_player_metadata_"]).
 
     Returns:
-        bool: True if the blob was successfully downloaded, False otherwise.
+        Dict[str, Optional[List[Dict[str, Any]]]]: Rows of the latest file keyed by prefix. None if there is no file with the prefix.
     """
-    try:
-        default_credential = DefaultAzureCredential()
-        blob_service_client = BlobServiceClient(storage_account_url, credential=default_credential)
-        container_client = blob_service_client.get_container_client(container_name)
-        blob_client = container_client.get_blob_client(source_blob_path)
+    landing_paths = storage.list('landing')
+    file_names = {file_prefix: get_blob_name(storage, file_prefix, landing_paths) for file_prefix in file_prefixes}
+    found_prefixes = [file_prefix for file_prefix, file_name in file_names.items() if file_name is not None]
 
-        # Reference - https://learn.microsoft.com/en-us/azure/storage/blobs/storage-blob-download-python
-        with open(local_temp_file_path, "wb") as local_file:
-            blob_data = blob_client.download_blob()
-            local_file.write(blob_data.readall())
+    blob_data = read_many(storage, [f"landing/{file_names[file_prefix]}" for file_prefix in found_prefixes])
+    record_metrics(bytes=sum(len(data) for data in blob_data))
 
-        logging.info(f"File {source_blob_path} has been downloaded locally")
+    landing_metadata = {file_prefix: None for file_prefix in file_prefixes}
+    for file_prefix, data in zip(found_prefixes, blob_data):
+        landing_metadata[file_prefix] = [json.loads(line) for line in decompress(data).decode().splitlines() if line.strip()]
+        logging.info(f"File landing/{file_names[file_prefix]} has been downloaded")
 
-        return True
-    except Exception as e:
-        logging.error(f"An error occured: {str(e)}")
-        return False
-    
+    return landing_metadata
 
-def read_local_file(local_temp_file_path: str) -> Union[List[Dict[str, Any]], None]:
+
+def fetch_current_season_history(player_metadata: List[Dict[str, Any]], failed_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
     """
-    Reads a local JSONL file, extracts player IDs, fetches player summary data from an API,
-    and returns current season historical fixture data for all players.
+    Fetches player summary data from element-summary endpoint for each player concurrently and returns current season
+    historical fixture data for all players.
 
     Args:
-        local_temp_file_path (str): The full path to the local JSONL file
-                                    containing player ID information.
+        player_metadata (List[Dict[str, Any]]): Player rows from bootstrap-static containing player IDs.
+        failed_ids (Optional[List[int]]): When supplied, IDs of players whose request has failed are added.
 
     Returns:
-        Union[List[Dict[str, Any]], None]: A list of dictionaries, where each dictionary
-                                            represents a player's past fixture data for the
-                                            current season. Returns None if any error occurs
-                                            during file reading or API calls.
+        List[Dict[str, Any]]: A list of dictionaries, where each dictionary represents a player's
+                              past fixture data for the current season, in the order of player_metadata.
     """
-    player_result = []
-    try:
-        with open(local_temp_file_path, "r") as json_file:
-            main_json_file = [json.loads(line) for line in json_file] 
-
-        for id_player in main_json_file:
-                player_id = id_player.get("id")
-                url = f"https://fantasy.premierleague.com/api/element-summary/{player_id}/"
-                response = requests.get(url, timeout=60)
-                if response.status_code == 200:
-                    player_data = response.json()
-                    current_season_past_fixture = player_data["history"]
-                    player_result.extend(current_season_past_fixture)
-                    logging.info(f"Player id - {player_id} is extracted")
-
-        logging.info("Current season history player data has been extracted")
-    
-        return player_result
-    except Exception as e:
-        logging.error(f"Error in read_local_file: {str(e)}")
-        raise
+    player_ids = [id_player.get("id") for id_player in player_metadata]
+    failed_requests = {}
+    rows_by_source = fetch_endpoints(['element_summary'], ids={'element_summary': player_ids}, data_sources=['current_season_history'], failed_ids=failed_requests)
+    if failed_ids is not None:
+        failed_ids.extend(failed_requests.get('element_summary', []))
+    logging.info(f"Current season history player data of {len(player_ids)} players has been extracted")
+
+    return rows_by_source['current_season_history']
+
+
+def get_blob_name(storage, file_prefix: str = PLAYER_METADATA_PREFIX, landing_paths: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Finds the latest file in the landing folder of the storage backend starting with a specific prefix
+    (by default 'raw_fpl_player_metadata_'), and returns its name without the 'landing/' prefix.
+
+    Args:
+        storage: The storage backend from util.storage.
+        file_prefix (str): The prefix of the file name.
+        landing_paths (Optional[List[str]]): Paths already listed from the landing folder. The folder is listed when not supplied.
+
+    Returns:
+        Optional[str]: The name of the latest file by its ddMMyyyy date (e.g., "raw_fpl_player_metadata_25052025_2025-05-25 10:00:00.json"),
+                       or None if no file with a valid date is found.
+    """
+    if landing_paths is None:
+        landing_paths = storage.list('landing')
+    landing_path = find_latest_landing_path(landing_paths, file_prefix)
+    if landing_path is None:
+        return None
+
+    logging.info(f"File name: {landing_path}")
+    return landing_path.removeprefix("landing/")
 
 
-def create_file_and_upload(all_dict: List[Dict[str, Any]], player_id_local_file_path: str, storage_account_url: str, container_name: str, destination_blob_path: str) -> bool:
+def read_events_metadata(storage) -> Optional[List[Dict[str, Any]]]:
     """
-    Writes a list of dictionaries to a local JSON Lines (JSONL) file and then uploads
-    that file to Azure Blob Storage.
+    Reads gameweek rows from the latest events metadata file in the landing folder.
 
     Args:
-        all_dict (List[Dict[str, Any]]): A list of dictionaries to be written to the local file.
-        player_id_local_file_path (str): The full local path, including the filename,
-                                          where the JSONL file will be created.
-                                          (e.g., "C:/temp/players.jsonl").
-        storage_account_url (str): The URL of the Azure Storage account
-                                   (e.g., "https://youraccount.blob.core.windows.net").
-        container_name (str): The name of the target container in Blob Storage.
-        destination_blob_path (str): The full path for the blob within the container
-                                     (e.g., "processed_data/players.jsonl").
+        storage: The storage backend from util.storage.
 
     Returns:
-        bool: True if the file was successfully created locally and uploaded, False otherwise.
+        Optional[List[Dict[str, Any]]]: Rows of events. None if there is no events metadata file.
     """
-    with open(player_id_local_file_path, "w") as local_file_player_id:
-        for item in all_dict:
-            json_line = json.dumps(item)
-            local_file_player_id.write(json_line + '\n')
-        logging.info(f"{player_id_local_file_path} is created")
+    return download_landing_metadata(storage, [EVENTS_METADATA_PREFIX])[EVENTS_METADATA_PREFIX]
 
-    default_credential = DefaultAzureCredential()
-    blob_service_client = BlobServiceClient(storage_account_url, credential=default_credential)
-    container_client = blob_service_client.get_container_client(container_name)
-    blob_client = container_client.get_blob_client(destination_blob_path)
-    with open(f"{player_id_local_file_path}", "rb") as data:
-        blob_client.upload_blob(data, overwrite=True)
 
+def remove_cached_fixture_rows(ingest_date: str, storage, rows: List[Dict[str, Any]], events: Optional[List[Dict[str, Any]]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[Tuple[int, int], Dict[str, Any]]]]:
+    """
+    Removes rows of fixtures already in the finished fixture cache.
+
+    Args:
+        ingest_date (str): The ingest date used to find the season of the cache.
+        storage: The storage backend from util.storage.
+        rows (List[Dict[str, Any]]): Current season history rows of all players.
+        events (Optional[List[Dict[str, Any]]]): Rows of events. The latest events metadata file is read when not supplied.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], Optional[Dict[Tuple[int, int], Dict[str, Any]]]]: Rows to be written to landing and
+        the cache to be saved once the landing file is written. The cache is None when nothing is newly finished.
+    """
+    if events is None:
+        events = read_events_metadata(storage)
+    return apply_finished_fixture_cache(storage, create_season_value(ingest_date), rows, events)
+
+
+@instrument('write')
+def upload_player_history(storage, content: bytes, ingest_date: str, file_name: str, use_cache: bool, events: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Uploads merged current season history rows as the landing file, compressed with LandingCompression.
+    Rows of cached finished fixtures are left out when use_cache is True, and the cache is saved once the file is written.
+
+    Args:
+        storage: The storage backend from util.storage.
+        content (bytes): JSONL rows of every player.
+        ingest_date (str): The ingest date used to find the season of the cache.
+        file_name (str): The landing file name.
+        use_cache (bool): Leave out rows of cached finished fixtures.
+        events (Optional[List[Dict[str, Any]]]): Rows of events. The latest events metadata file is read when not supplied.
+
+    Returns:
+        List[Dict[str, Any]]: The rows written to the landing file.
+    """
+    rows = [json.loads(line) for line in content.decode().splitlines() if line.strip()]
+    fixture_cache = None
+    if use_cache:
+        rows, fixture_cache = remove_cached_fixture_rows(ingest_date, storage, rows, events)
+        content = "".join(json.dumps(item) + '\n' for item in rows).encode()
+
+    destination_blob_path = f"landing/{file_name}"
+    landing_content = compress(content)
+    storage.write_bytes(destination_blob_path, landing_content, content_encoding=get_content_encoding())
+    if fixture_cache is not None:
+        save_finished_fixture_cache(storage, create_season_value(ingest_date), fixture_cache)
+    record_metrics(bytes=len(landing_content))
     logging.info(f"Current season history data has been uploaded to {destination_blob_path}")
 
+    return rows
+
+
+def get_checkpoint_folder(ingest_date: str) -> str:
+    return f"{PLAYER_HISTORY_WORK_FOLDER}/checkpoint_{ingest_date}"
 
-def get_blob_name(storage_account_url: str, container_name: str) -> Optional[str]:
+
+def read_checkpoint(storage, ingest_date: str) -> Dict[str, Any]:
     """
-    Connects to Azure Blob Storage, lists blobs starting with a specific prefix
-    ('landing/raw_fpl_player_metadata_'), and returns the name of the *last* found blob
-    after stripping the 'landing/' prefix.
+    Reads the progress cursor of the checkpointed extraction of an ingest date, or starts a new one.
 
     Args:
-        storage_account_url (str): The URL of the Azure Storage account
-                                   (e.g., "https://youraccount.blob.core.windows.net").
-        container_name (str): The name of the container (file system) to search within.
+        storage: The storage backend from util.storage.
+        ingest_date (str): The ingest date of the extraction.
 
     Returns:
-        Optional[str]: The extracted name of the last matching blob (e.g., "raw_fpl_player_metadata_20250525.json"),
-                       or None if no matching blob is found or an error occurs.
+        Dict[str, Any]: The cursor with landing file name, number of part files, extracted player IDs and
+                        failed runs keyed by player ID.
     """
-    default_credential = DefaultAzureCredential()
-    blob_service_client = BlobServiceClient(storage_account_url, credential=default_credential)
-    container_client = blob_service_client.get_container_client(container=container_name)
+    progress_path = f"{get_checkpoint_folder(ingest_date)}/progress.json"
+    if storage.exists(progress_path):
+        checkpoint = json.loads(storage.read_bytes(progress_path))
+        logging.info(f"Resuming player history of {ingest_date} from checkpoint {checkpoint['parts']} with {len(checkpoint['completed_ids'])} players extracted")
+        return checkpoint
 
-    blob_list = container_client.list_blob_names(name_starts_with=f'landing/raw_fpl_player_metadata_')
+    current_timestamp = convert_timestamp_to_myt_date()
+    return {
+        'ingest_date': ingest_date,
+        'file_name': get_landing_file_name(f"raw_fpl_current_season_history_{ingest_date}_{current_timestamp}.json"),
+        'parts': 0,
+        'completed_ids': [],
+        'failed_attempts': {}
+    }
 
-    for blob in blob_list:
-        logging.info(f"File name: {blob}")
-        blob_name = blob.split("landing/")[-1]
 
-    return blob_name
+@instrument('write')
+def write_checkpoint(storage, checkpoint: Dict[str, Any], rows: List[Dict[str, Any]], player_ids: List[int], failed_ids: List[int]) -> None:
+    """
+    Flushes the rows of a checkpoint as a part file, then updates the progress cursor. When a run stops between
+    the two writes, the players of the checkpoint are requested again and the part file is overwritten.
 
-    
-    
+    Args:
+        storage: The storage backend from util.storage.
+        checkpoint (Dict[str, Any]): The progress cursor from read_checkpoint. It is updated in place.
+        rows (List[Dict[str, Any]]): Rows of the players extracted in this checkpoint.
+        player_ids (List[int]): Players requested in this checkpoint.
+        failed_ids (List[int]): Players whose request has failed.
+    """
+    checkpoint_folder = get_checkpoint_folder(checkpoint['ingest_date'])
+    part_content = "".join(json.dumps(item) + '\n' for item in rows).encode()
+    storage.write_bytes(f"{checkpoint_folder}/part_{checkpoint['parts']:05d}.json", part_content)
+
+    failed_ids = set(failed_ids)
+    failed_attempts = checkpoint['failed_attempts']
+    for player_id in player_ids:
+        if player_id in failed_ids:
+            failed_attempts[str(player_id)] = failed_attempts.get(str(player_id), 0) + 1
+        else:
+            failed_attempts.pop(str(player_id), None)
+            checkpoint['completed_ids'].append(player_id)
+    checkpoint['parts'] += 1
+    storage.write_bytes(f"{checkpoint_folder}/progress.json", json.dumps(checkpoint).encode())
+    record_metrics(rows=len(rows), bytes=len(part_content))
+    logging.info(f"Checkpoint {checkpoint['parts']} of player history has been written with {len(checkpoint['completed_ids'])} players extracted")
+
+
+def extract_current_season_history(ingest_date: str, storage, player_metadata: Optional[List[Dict[str, Any]]] = None, events: Optional[List[Dict[str, Any]]] = None, use_cache: bool = True, checkpoint_size: Optional[int] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Extracts current season history of all players in checkpoints and uploads it as a JSONL file into the landing folder.
+    Rows of finished fixtures that have been extracted before are left out when use_cache is True.
+
+    Args:
+        ingest_date (str): The ingest date to be used in the file name. Date format should be ddMMyyyy.
+        storage: The storage backend from util.storage.
+        player_metadata (Optional[List[Dict[str, Any]]]): Player rows from bootstrap-static. When not supplied,
+                                                          the latest player metadata file is downloaded from landing folder.
+        events (Optional[List[Dict[str, Any]]]): Rows of events from bootstrap-static. When not supplied,
+                                                 the latest events metadata file is read from landing folder.
+        use_cache (bool): Leave out rows of cached finished fixtures. When False, the whole season is written.
+        checkpoint_size (Optional[int]): Players per checkpoint. PlayerHistoryCheckpointSize is used when not supplied.
+
+    Returns:
+        Tuple[str, List[Dict[str, Any]]]: The landing file name and the current season history rows.
+
+    Raises:
+        ValueError: When ingest_date is not ddMMyyyy, or requests of some players have failed. The checkpoint is kept,
+                    so a rerun only retries them.
+    """
+    validate_file_date(ingest_date)
+    if player_metadata is None:
+        # Events metadata needed by the cache is downloaded together with player metadata
+        file_prefixes = [PLAYER_METADATA_PREFIX] + ([EVENTS_METADATA_PREFIX] if use_cache and events is None else [])
+        landing_metadata = download_landing_metadata(storage, file_prefixes)
+        player_metadata = landing_metadata[PLAYER_METADATA_PREFIX]
+        if player_metadata is None:
+            raise ValueError("No player metadata file in landing folder")
+        events = landing_metadata.get(EVENTS_METADATA_PREFIX, events)
+
+    checkpoint_size = checkpoint_size or int(os.getenv("PlayerHistoryCheckpointSize") or DEFAULT_CHECKPOINT_SIZE)
+    max_attempts = int(os.getenv("PlayerHistoryMaxAttempts") or DEFAULT_MAX_ATTEMPTS)
+    checkpoint = read_checkpoint(storage, ingest_date)
+
+    completed_ids = set(checkpoint['completed_ids'])
+    pending_ids = [
+        player["id"] for player in player_metadata
+        if player["id"] not in completed_ids and checkpoint['failed_attempts'].get(str(player["id"]), 0) < max_attempts
+    ]
+    logging.info(f"{len(pending_ids)} of {len(player_metadata)} players to be extracted in checkpoints of {checkpoint_size} players")
+
+    for player_ids in create_shards(pending_ids, checkpoint_size):
+        failed_requests = {}
+        rows_by_source = fetch_endpoints(['element_summary'], ids={'element_summary': player_ids}, data_sources=['current_season_history'], failed_ids=failed_requests)
+        write_checkpoint(storage, checkpoint, rows_by_source['current_season_history'], player_ids, failed_requests.get('element_summary', []))
+
+    retry_ids = [player_id for player_id, attempts in checkpoint['failed_attempts'].items() if attempts < max_attempts]
+    if retry_ids:
+        error_msg = f"Requests of {len(retry_ids)} players failed: {', '.join(retry_ids[:20])}. Rerun ingest date {ingest_date} to retry them from the checkpoint"
+        logging.error(error_msg)
+        raise ValueError(error_msg)
+    if checkpoint['failed_attempts']:
+        logging.error(f"Players {', '.join(checkpoint['failed_attempts'])} failed in {max_attempts} runs and are left out of {checkpoint['file_name']}")
+
+    checkpoint_folder = get_checkpoint_folder(ingest_date)
+    part_paths = [f"{checkpoint_folder}/part_{part_index:05d}.json" for part_index in range(checkpoint['parts'])]
+    merged_content = b"".join(read_many(storage, part_paths))
+    current_season_history_rows = upload_player_history(storage, merged_content, ingest_date, checkpoint['file_name'], use_cache, events)
+    delete_many(storage, part_paths + [f"{checkpoint_folder}/progress.json"])
+
+    return checkpoint['file_name'], current_season_history_rows
+
+
+def read_player_ids(storage) -> List[int]:
+    """
+    Reads player IDs from the latest player metadata file in the landing folder.
+
+    Args:
+        storage: The storage backend from util.storage.
+
+    Returns:
+        List[int]: The player IDs.
+    """
+    player_metadata = download_landing_metadata(storage, [PLAYER_METADATA_PREFIX])[PLAYER_METADATA_PREFIX]
+    if player_metadata is None:
+        raise ValueError("No player metadata file in landing folder")
+
+    return [player["id"] for player in player_metadata]
+
+
+def create_shards(player_ids: List[int], shard_size: int) -> List[List[int]]:
+    """
+    Splits player IDs into shards of at most shard_size players.
+
+    Args:
+        player_ids (List[int]): The player IDs.
+        shard_size (int): Maximum number of players per shard.
+
+    Returns:
+        List[List[int]]: Player IDs of each shard.
+    """
+    if shard_size < 1:
+        raise ValueError(f"Shard size must be at least 1, got {shard_size}")
+    return [player_ids[index:index + shard_size] for index in range(0, len(player_ids), shard_size)]
+
+
+def get_work_folder(run_id: str) -> str:
+    return f"{PLAYER_HISTORY_WORK_FOLDER}/{run_id}"
+
+
+def fan_out_player_history(ingest_date: str, storage, work_queue, shard_size: int, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Splits the player IDs into shards, writes the run manifest and sends one queue message per shard.
+
+    Args:
+        ingest_date (str): The ingest date to be used in the file name. Date format should be ddMMyyyy.
+        storage: The storage backend from util.storage.
+        work_queue: BindingQueue or LocalQueue from util.work_queue.
+        shard_size (int): Maximum number of players per shard.
+        use_cache (bool): Leave out rows of cached finished fixtures when the shards are merged.
+
+    Returns:
+        Dict[str, Any]: The run manifest with run_id, landing file name and number of shards.
+    """
+    validate_file_date(ingest_date)
+    player_ids = read_player_ids(storage)
+    if not player_ids:
+        raise ValueError("No player ID found in player metadata file")
+
+    shards = create_shards(player_ids, shard_size)
+    current_timestamp = convert_timestamp_to_myt_date()
+    manifest = {
+        'run_id': f"{ingest_date}_{uuid.uuid4().hex[:12]}",
+        'ingest_date': ingest_date,
+        'file_name': get_landing_file_name(f"raw_fpl_current_season_history_{ingest_date}_{current_timestamp}.json"),
+        'shard_count': len(shards),
+        'use_cache': use_cache
+    }
+    storage.write_bytes(f"{get_work_folder(manifest['run_id'])}/manifest.json", json.dumps(manifest).encode())
+
+    work_queue.send_messages([
+        {'run_id': manifest['run_id'], 'shard_index': shard_index, 'player_ids': shard}
+        for shard_index, shard in enumerate(shards)
+    ])
+    work_queue.flush()
+    logging.info(f"Player history run {manifest['run_id']} fanned out {len(player_ids)} players into {len(shards)} shards")
+
+    return manifest
+
+
+@instrument('write')
+def process_player_shard(message: Dict[str, Any], storage) -> Optional[str]:
+    """
+    Extracts current season history of the players of one shard and writes it as a partial file. Players whose
+    request has failed are written to a failed file of the shard. The shard worker that writes the last partial
+    file also runs the fan-in.
+
+    Args:
+        message (Dict[str, Any]): Queue message with run_id, shard_index and player_ids.
+        storage: The storage backend from util.storage.
+
+    Returns:
+        Optional[str]: The landing file name if the fan-in has been done by this shard, otherwise None.
+    """
+    run_id = message['run_id']
+    shard_index = message['shard_index']
+    failed_ids = []
+    player_result = fetch_current_season_history([{"id": player_id} for player_id in message['player_ids']], failed_ids)
+
+    if failed_ids:
+        storage.write_bytes(f"{get_work_folder(run_id)}/failed_{shard_index:05d}.json", json.dumps(failed_ids).encode())
+        logging.warning(f"Requests of {len(failed_ids)} players of shard {shard_index} of player history run {run_id} failed")
+    part_content = "".join(json.dumps(item) + '\n' for item in player_result).encode()
+    storage.write_bytes(f"{get_work_folder(run_id)}/part_{shard_index:05d}.json", part_content)
+    record_metrics(rows=len(player_result), bytes=len(part_content))
+    logging.info(f"Shard {shard_index} of player history run {run_id} has been written with {len(player_result)} rows")
+
+    return fan_in_player_history(run_id, storage)
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+
+@instrument('write')
+def fan_in_player_history(run_id: str, storage) -> Optional[str]:
+    """
+    Merges partial files into the current season history landing file once every shard has reported in,
+    then removes the work folder of the run. The fan-in is claimed by renaming the manifest, so only one shard
+    worker merges a run. Players whose request has failed in a shard are listed in the log.
+
+    Args:
+        run_id (str): The run of the fan-out.
+        storage: The storage backend from util.storage.
+
+    Returns:
+        Optional[str]: The landing file name. None if some shards are still running or the run is already merged.
+    """
+    work_folder = get_work_folder(run_id)
+    manifest_path = f"{work_folder}/manifest.json"
+    if not storage.exists(manifest_path):
+        logging.info(f"Player history run {run_id} has already been merged")
+        return None
+
+    manifest = json.loads(storage.read_bytes(manifest_path))
+    part_paths = sorted(path for path in storage.list(work_folder) if os.path.basename(path).startswith('part_'))
+    if len(part_paths) < manifest['shard_count']:
+        logging.info(f"Player history run {run_id} has {len(part_paths)} of {manifest['shard_count']} shards")
+        return None
+
+    # Rename fails for every shard worker but the first one, so a run is never merged twice
+    claim_path = f"{work_folder}/fan_in.json"
+    try:
+        storage.rename(manifest_path, claim_path)
+    except Exception:
+        if storage.exists(manifest_path):
+            raise
+        logging.info(f"Player history run {run_id} is merged by another shard")
+        return None
+
+    try:
+        merged_content = b"".join(read_many(storage, part_paths))
+        upload_player_history(storage, merged_content, manifest['ingest_date'], manifest['file_name'], manifest.get('use_cache', False))
+    except Exception:
+        # The claim is released, so the retry of the shard message runs the fan-in again
+        storage.rename(claim_path, manifest_path)
+        raise
+    logging.info(f"Current season history data of {manifest['shard_count']} shards has been merged")
+
+    failed_paths = [path for path in storage.list(work_folder) if os.path.basename(path).startswith('failed_')]
+    failed_ids = [player_id for content in read_many(storage, failed_paths) for player_id in json.loads(content)]
+    if failed_ids:
+        logging.error(f"Requests of players {', '.join(str(player_id) for player_id in failed_ids)} failed and are left out of {manifest['file_name']}")
+
+    delete_many(storage, part_paths + failed_paths + [claim_path])
+
+    return manifest['file_name']
+
+
+def create_work_queue(shardqueue: Optional[func.Out] = None):
+    """
+    Return the queue used to fan out shards. WorkQueueBackend=local runs the shard workers in this process.
+    """
+    if os.getenv("WorkQueueBackend", "azure") == 'local':
+        return LocalQueue()
+    return BindingQueue(shardqueue)
+
+
+@profile_invocation
+def main(req: func.HttpRequest, shardqueue: func.Out[List[str]]) -> func.HttpResponse:
     logging.info("Python HTTP trigger function processed a request.")
 
     try:
         ingest_date = req.params.get('ingest_date')
+        mode = req.params.get('mode', 'single')
 
         if not ingest_date:
             return func.HttpResponse(
-                "No parameter supplied. Please provide a 'ingest_date' based on the file to be ingested. Date format should be YYYYMMDD",
+                "No parameter supplied. Please provide a 'ingest_date' based on the file to be ingested. Date format should be ddMMyyyy",
                 status_code=400
             )
-        
-        current_timestamp = convert_timestamp_to_myt_date()
-        
-        storage_account_url = os.getenv("StorageAccountUrl")
-        storage_account_container = os.getenv("StorageAccountContainer")
-        player_metadata_file_name = get_blob_name(storage_account_url, storage_account_container)
-        current_season_history_file_name = f"raw_fpl_current_season_history_{ingest_date}_{current_timestamp}.json"
-        source_blob_path = f"landing/{player_metadata_file_name}"
-        destination_blob_path = f"landing/{current_season_history_file_name}"
-        
-        local_file_path = tempfile.gettempdir()
-        local_temp_file_path = os.path.join(local_file_path, player_metadata_file_name)
-        player_id_local_file_path = os.path.join(local_file_path, current_season_history_file_name)
-    
-        download_blob(storage_account_url, storage_account_container, local_temp_file_path, source_blob_path)
-        current_season_history_dict = read_local_file(local_temp_file_path)
-        create_file_and_upload(current_season_history_dict, player_id_local_file_path, storage_account_url, storage_account_container, destination_blob_path)
-    
-        return func.HttpResponse(f"Process Completed", status_code=200)
+        elif mode not in ('single', 'fan_out'):
+            return func.HttpResponse(
+                "Wrong 'mode' parameter supplied. Input could be either single or fan_out",
+                status_code=400
+            )
+
+        try:
+            validate_file_date(ingest_date)
+        except ValueError as e:
+            return func.HttpResponse(str(e), status_code=400)
+
+        storage = get_storage()
+        use_cache = (req.params.get('use_cache') or os.getenv("PlayerHistoryCacheEnabled", 'true')).lower() == 'true'
+        if mode == 'single':
+            extract_current_season_history(ingest_date, storage, use_cache=use_cache)
+            return func.HttpResponse(f"Process Completed", status_code=200)
+
+        shard_size = int(req.params.get('shard_size') or os.getenv("PlayerHistoryShardSize") or DEFAULT_SHARD_SIZE)
+        work_queue = create_work_queue(shardqueue)
+        manifest = fan_out_player_history(ingest_date, storage, work_queue, shard_size, use_cache)
+
+        if not isinstance(work_queue, LocalQueue):
+            # Shards are processed asynchronously by Extract_player_shard_2
+            return func.HttpResponse(json.dumps(manifest), status_code=202, mimetype="application/json")
+
+        worker_count = int(req.params.get('workers') or os.getenv("PlayerHistoryShardWorkers") or DEFAULT_SHARD_WORKERS)
+        work_queue.run_workers(lambda message: process_player_shard(message, storage), worker_count)
+        if work_queue.poison_messages:
+            raise RuntimeError(f"{len(work_queue.poison_messages)} shards of player history run {manifest['run_id']} failed")
+
+        return func.HttpResponse(json.dumps(manifest), status_code=200, mimetype="application/json")
     
     except Exception as e:
         return func.HttpResponse(f"An error occured: {str(e)}", status_code=500)
\ No newline at end of file
@@ -0,0 +1,21 @@
+import logging
+import azure.functions as func
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from Extract_player_api_2 import process_player_shard
+
+"""
+Queue triggered worker of the player history fan-out. Every message holds one shard of player IDs.
+An exception fails the invocation, so the message is retried by the queue and moved to the poison queue
+after maxDequeueCount attempts.
+"""
+
+
+@profile_invocation
+def main(msg: func.QueueMessage) -> None:
+    message = msg.get_json()
+    logging.info(f"Processing shard {message['shard_index']} of player history run {message['run_id']}, dequeue count {msg.dequeue_count}")
+
+    landing_file_name = process_player_shard(message, get_storage())
+    if landing_file_name:
+        logging.info(f"Player history run {message['run_id']} has been merged into {landing_file_name}")
@@ -0,0 +1,277 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, Tuple
+import azure.functions as func
+from util.storage import get_storage
+from util.lazy_import import lazy_import
+from util.instrumentation import instrument
+from util.profiling import profile_invocation
+
+duckdb = lazy_import('duckdb')
+pa = lazy_import('pyarrow')
+pq = lazy_import('pyarrow.parquet')
+deltalake = lazy_import('deltalake')
+
+"""
+This code is to run allow-listed analytical queries over silver and gold delta tables with DuckDB.
+The DuckDB connection, registered table views and credentials are kept in module scope, so they are reused
+across invocations on a warm instance. Table views are only re-registered when the delta table version changes.
+"""
+
+# View name registered in DuckDB and the path of delta table in ADLS2
+QUERY_TABLES = {
+    'current_season_history': 'silver/current_season_history',
+    'player_metadata': 'silver/player_metadata',
+    'team_metadata': 'silver/team_metadata',
+    'position_metadata': 'silver/position_metadata',
+    'cdz2_player_profile': 'silver/cdz2_player_profile',
+    'player_form': 'gold/player_form'
+}
+
+# Add new query below. Parameters are bound by DuckDB and never formatted into the SQL text.
+ALLOWED_QUERIES = {
+    'player_form': {
+        'sql': """
+            SELECT *
+            FROM player_form
+            WHERE season = $season AND element = $element
+            ORDER BY round
+        """,
+        'tables': ['player_form'],
+        'parameters': {'season': str, 'element': int}
+    },
+    'top_form_players': {
+        'sql': """
+            SELECT element, round, points_last_n, minutes_last_n, expected_goals_per_90_last_n, expected_assists_per_90_last_n, bps_trend
+            FROM player_form
+            WHERE season = $season AND round = $round
+            ORDER BY points_last_n DESC
+            LIMIT $limit
+        """,
+        'tables': ['player_form'],
+        'parameters': {'season': str, 'round': int, 'limit': int}
+    },
+    'player_history': {
+        'sql': """
+            SELECT *
+            FROM current_season_history
+            WHERE season = $season AND element = $element
+            ORDER BY round, fixture
+        """,
+        'tables': ['current_season_history'],
+        'parameters': {'season': str, 'element': int}
+    },
+    'team_squad': {
+        'sql': """
+            SELECT id, web_name, singular_name, now_cost, status
+            FROM cdz2_player_profile
+            WHERE season = $season AND name = $team_name
+            ORDER BY singular_name, now_cost DESC
+        """,
+        'tables': ['cdz2_player_profile'],
+        'parameters': {'season': str, 'team_name': str}
+    }
+}
+
+OUTPUT_FORMATS = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+DEFAULT_VIEW_REFRESH_SECONDS = 300
+RECORD_BATCH_SIZE = 65536
+
+_connection = None
+_connection_lock = threading.Lock()
+# View name -> {'table': DeltaTable, 'version': int, 'checked_at': float}
+_registered_views: Dict[str, Dict[str, Any]] = {}
+
+
+def get_connection() -> 'duckdb.DuckDBPyConnection':
+    """
+    Return the DuckDB connection of this instance. The connection is created on first use.
+
+    Returns:
+        duckdb.DuckDBPyConnection: In-memory DuckDB connection.
+    """
+    global _connection
+    if _connection is None:
+        _connection = duckdb.connect(database=':memory:')
+        logging.info("Created DuckDB connection")
+    return _connection
+
+
+def register_table_view(connection: 'duckdb.DuckDBPyConnection', view_name: str, azure_path: str, storage_options: dict) -> None:
+    """
+    Register a delta table as a DuckDB view. A registered view is reused until the refresh interval has passed,
+    after which the delta log is checked incrementally and the view is re-registered only if the version has changed.
+
+    Args:
+        connection (duckdb.DuckDBPyConnection): DuckDB connection.
+        view_name (str): The name of the view. Must be a key in QUERY_TABLES.
+        azure_path (str): The ADLS2 path of the container.
+        storage_options (dict): Credentials to access ADLS2.
+    """
+    refresh_seconds = float(os.getenv("DuckDbViewRefreshSeconds", DEFAULT_VIEW_REFRESH_SECONDS))
+    now = time.monotonic()
+    registered_view = _registered_views.get(view_name)
+
+    if registered_view is not None:
+        if now - registered_view['checked_at'] < refresh_seconds:
+            return
+        delta_table = registered_view['table']
+        delta_table.update_incremental()
+        registered_view['checked_at'] = now
+        if delta_table.version() == registered_view['version']:
+            logging.info(f"View {view_name} is up to date at version {registered_view['version']}")
+            return
+    else:
+        delta_table = deltalake.DeltaTable(f"{azure_path}/{QUERY_TABLES[view_name]}", storage_options=storage_options)
+
+    connection.register(view_name, delta_table.to_pyarrow_dataset())
+    _registered_views[view_name] = {'table': delta_table, 'version': delta_table.version(), 'checked_at': now}
+    logging.info(f"Registered view {view_name} at version {delta_table.version()}")
+
+
+def parse_query_parameters(query_name: str, params: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Validate and convert request parameters for an allow-listed query.
+
+    Args:
+        query_name (str): The name of the query in ALLOWED_QUERIES.
+        params (Dict[str, str]): The request parameters.
+
+    Returns:
+        Dict[str, Any]: Query parameters converted to the declared data type.
+    """
+    if query_name not in ALLOWED_QUERIES:
+        error_msg = f"Query - '{query_name}' does not exists. Allowed queries are {sorted(ALLOWED_QUERIES)}"
+        logging.error(error_msg)
+        raise ValueError(error_msg)
+
+    query_parameters = {}
+    for parameter_name, parameter_type in ALLOWED_QUERIES[query_name]['parameters'].items():
+        value = params.get(parameter_name)
+        if value is None:
+            raise ValueError(f"Parameter '{parameter_name}' is required for query '{query_name}'")
+        try:
+            query_parameters[parameter_name] = parameter_type(value)
+        except ValueError:
+            raise ValueError(f"Parameter '{parameter_name}' for query '{query_name}' should be {parameter_type.__name__}")
+
+    return query_parameters
+
+
+@instrument('read')
+def run_query(query_name: str, query_parameters: Dict[str, Any], azure_path: str, storage_options: dict) -> Tuple['pa.RecordBatchReader', Dict[str, float]]:
+    """
+    Run an allow-listed query and return its result as record batches.
+
+    Args:
+        query_name (str): The name of the query in ALLOWED_QUERIES.
+        query_parameters (Dict[str, Any]): Query parameters.
+        azure_path (str): The ADLS2 path of the container.
+        storage_options (dict): Credentials to access ADLS2.
+
+    Returns:
+        Tuple[pa.RecordBatchReader, Dict[str, float]]: Query result and timing in milliseconds for each step.
+    """
+    query = ALLOWED_QUERIES[query_name]
+    connection = get_connection()
+
+    start_time = time.perf_counter()
+    for view_name in query['tables']:
+        register_table_view(connection, view_name, azure_path, storage_options)
+    register_time = time.perf_counter()
+
+    result = connection.execute(query['sql'], query_parameters).fetch_arrow_table()
+    query_time = time.perf_counter()
+
+    timing = {
+        'register_ms': (register_time - start_time) * 1000,
+        'query_ms': (query_time - register_time) * 1000
+    }
+
+    return result.to_reader(max_chunksize=RECORD_BATCH_SIZE), timing
+
+
+@instrument('transform')
+def serialize_result(result: 'pa.RecordBatchReader', output_format: str) -> Tuple[bytes, int]:
+    """
+    Serialize query result record batches to Arrow IPC stream or Parquet.
+
+    Args:
+        result (pa.RecordBatchReader): Query result.
+        output_format (str): Either arrow or parquet.
+
+    Returns:
+        Tuple[bytes, int]: Serialized result and number of rows.
+    """
+    sink = pa.BufferOutputStream()
+    row_count = 0
+
+    if output_format == 'arrow':
+        with pa.ipc.new_stream(sink, result.schema) as writer:
+            for batch in result:
+                writer.write_batch(batch)
+                row_count += batch.num_rows
+    else:
+        with pq.ParquetWriter(sink, result.schema) as writer:
+            for batch in result:
+                writer.write_batch(batch)
+                row_count += batch.num_rows
+
+    return sink.getvalue().to_pybytes(), row_count
+
+
+@profile_invocation
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Python HTTP trigger function processed a request.")
+
+    query_name = req.params.get('query')
+    output_format = req.params.get('format', 'arrow')
+
+    if not query_name:
+        return func.HttpResponse(
+            f"No parameter supplied. Please provide a 'query' parameter. Input could be either {' or '.join(sorted(ALLOWED_QUERIES))}",
+            status_code=400
+        )
+    elif output_format not in OUTPUT_FORMATS:
+        return func.HttpResponse(
+            "Wrong 'format' parameter supplied. Input could be either arrow or parquet",
+            status_code=400
+        )
+
+    try:
+        query_parameters = parse_query_parameters(query_name, req.params)
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
+    try:
+        # Storage backend caches its credentials, DuckDB connection is shared by all invocations on this instance
+        storage = get_storage()
+        with _connection_lock:
+            result, timing = run_query(query_name, query_parameters, storage.root_uri, storage.storage_options)
+
+        serialize_start_time = time.perf_counter()
+        body, row_count = serialize_result(result, output_format)
+        timing['serialize_ms'] = (time.perf_counter() - serialize_start_time) * 1000
+
+        logging.info(f"Query {query_name} returned {row_count} rows, {len(body)} bytes. Timing: {timing}")
+
+        return func.HttpResponse(
+            body=body,
+            status_code=200,
+            mimetype=OUTPUT_FORMATS[output_format],
+            headers={
+                'X-Query-Name': query_name,
+                'X-Row-Count': str(row_count),
+                'X-Register-Time-Ms': f"{timing['register_ms']:.1f}",
+                'X-Query-Time-Ms': f"{timing['query_ms']:.1f}",
+                'X-Serialize-Time-Ms': f"{timing['serialize_ms']:.1f}"
+            }
+        )
+    except Exception as e:
+        return func.HttpResponse(f"An error occured: {str(e)}", status_code=500)
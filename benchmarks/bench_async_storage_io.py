@@ -0,0 +1,105 @@
+"""
+Benchmark and verify the async storage I/O layer (util.async_storage).
+
+The same files are written, listed, read, moved and deleted once with one operation in flight, the way the
+synchronous clients work, and once with --concurrency operations in flight. Content read back is compared with
+the content written, so a run also verifies the async clients end to end. With --connection-string the adls
+backend runs against that account or a local Azurite emulator, e.g.
+
+    azurite --silent --location /tmp/azurite
+    StorageHierarchicalNamespace=false python benchmarks/bench_async_storage_io.py --connection-string UseDevelopmentStorage=true
+
+Azurite has no dfs endpoint, so rename falls back to copy and delete with StorageHierarchicalNamespace=false.
+Without --connection-string the local backend is used in a temporary folder.
+
+Usage:
+    python benchmarks/bench_async_storage_io.py --files 200 --size-kb 64 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCHMARK_FOLDER = 'benchmark/async_storage_io'
+
+
+def create_storage(connection_string: str, container_name: str):
+    from util.storage import AdlsStorage, LocalStorage
+    if not connection_string:
+        return LocalStorage(tempfile.mkdtemp(prefix='fpl_async_storage_'))
+
+    from azure.core.exceptions import ResourceExistsError
+    from azure.storage.blob import BlobServiceClient
+    try:
+        BlobServiceClient.from_connection_string(connection_string).create_container(container_name)
+    except ResourceExistsError:
+        pass
+    return AdlsStorage(None, container_name, connection_string=connection_string)
+
+
+def run_round_trip(storage, files: dict, concurrency: int) -> dict:
+    from util.async_storage import run_storage_io
+
+    async def round_trip(async_storage) -> dict:
+        timings = {}
+        start_time = time.perf_counter()
+        await asyncio.gather(*(async_storage.write_bytes(path, data) for path, data in files.items()))
+        timings['write'] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        listed_paths = await async_storage.list(f"{BENCHMARK_FOLDER}/landing")
+        timings['list'] = time.perf_counter() - start_time
+        if sorted(listed_paths) != sorted(files):
+            raise AssertionError(f"Listed {len(listed_paths)} files, expected {len(files)}")
+
+        start_time = time.perf_counter()
+        contents = await asyncio.gather(*(async_storage.read_bytes(path) for path in files))
+        timings['read'] = time.perf_counter() - start_time
+        if list(contents) != list(files.values()):
+            raise AssertionError("Content read back differs from content written")
+
+        archive_paths = [path.replace('/landing/', '/archive/') for path in files]
+        start_time = time.perf_counter()
+        await asyncio.gather(*(async_storage.rename(path, archive_path) for path, archive_path in zip(files, archive_paths)))
+        timings['rename'] = time.perf_counter() - start_time
+        if await async_storage.list(f"{BENCHMARK_FOLDER}/landing"):
+            raise AssertionError("Files are left in landing after rename")
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(async_storage.delete(path) for path in archive_paths))
+        timings['delete'] = time.perf_counter() - start_time
+        return timings
+
+    return run_storage_io(storage, round_trip, concurrency=concurrency)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size-kb', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--connection-string', default=None)
+    parser.add_argument('--container', default='fpl-benchmark')
+    args = parser.parse_args()
+
+    storage = create_storage(args.connection_string, args.container)
+    files = {
+        f"{BENCHMARK_FOLDER}/landing/raw_fpl_benchmark_{index:05d}.json": os.urandom(args.size_kb * 1024)
+        for index in range(args.files)
+    }
+    print(f"{type(storage).__name__}: {args.files} files of {args.size_kb} KB")
+
+    results = {concurrency: run_round_trip(storage, files, concurrency) for concurrency in [1, args.concurrency]}
+    print(f"{'operation':<10} {'1 in flight ms':>16} {f'{args.concurrency} in flight ms':>18} {'speedup':>8}")
+    for operation in results[1]:
+        sequential_ms = results[1][operation] * 1000
+        concurrent_ms = results[args.concurrency][operation] * 1000
+        print(f"{operation:<10} {sequential_ms:>16.1f} {concurrent_ms:>18.1f} {sequential_ms / max(concurrent_ms, 1e-6):>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
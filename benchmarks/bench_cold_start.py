@@ -0,0 +1,85 @@
+"""
+Benchmark cold start import time of every function and fail when a function exceeds the cold start budget.
+
+Each function module is imported in a fresh interpreter, the way the Functions host loads it on a cold instance.
+The median over --repeat runs is compared with the budget. The heaviest top-level packages imported by the module
+are reported from python -X importtime, so a dependency that is imported eagerly again shows up immediately.
+
+Usage:
+    python benchmarks/bench_cold_start.py --budget-ms 500
+    python benchmarks/bench_cold_start.py --functions landing_to_staging_3 --repeat 5
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = 500
+IMPORTTIME_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def list_functions() -> list:
+    return sorted(
+        name for name in os.listdir(REPO_ROOT)
+        if os.path.isfile(os.path.join(REPO_ROOT, name, 'function.json'))
+    )
+
+
+def measure_import(function_name: str) -> tuple:
+    code = f"import time; start_time = time.perf_counter(); import {function_name}; print((time.perf_counter() - start_time) * 1000)"
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+
+    # Cumulative time of packages imported directly by the function module. Imports done by the interpreter
+    # at startup are listed before site and are skipped.
+    package_time_us = Counter()
+    startup_done = False
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if not match:
+            continue
+        module_name = match.group(4)
+        depth = (len(match.group(3)) - 1) // 2
+        if not startup_done:
+            startup_done = module_name == 'site'
+        elif depth == 1 and module_name.split('.')[0] != function_name:
+            package_time_us[module_name.split('.')[0]] += int(match.group(2))
+
+    return float(completed.stdout.strip().splitlines()[-1]), package_time_us
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--functions', nargs='+', default=None)
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv("ColdStartBudgetMs", DEFAULT_BUDGET_MS)))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=3)
+    args = parser.parse_args()
+
+    over_budget = []
+    print(f"{'function':<45} {'import ms':>10} {'budget ms':>10}  heaviest imports")
+    for function_name in args.functions or list_functions():
+        measurements = [measure_import(function_name) for _ in range(args.repeat)]
+        import_ms = statistics.median(measurement[0] for measurement in measurements)
+        heaviest = ', '.join(
+            f"{package} {time_us / 1000:.0f} ms"
+            for package, time_us in measurements[-1][1].most_common(args.top)
+        )
+        status = '' if import_ms <= args.budget_ms else '  OVER BUDGET'
+        print(f"{function_name:<45} {import_ms:>10.1f} {args.budget_ms:>10.0f}  {heaviest}{status}")
+        if import_ms > args.budget_ms:
+            over_budget.append(function_name)
+
+    if over_budget:
+        print(f"Cold start budget of {args.budget_ms:.0f} ms exceeded by {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
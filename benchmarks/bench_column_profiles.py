@@ -0,0 +1,87 @@
+"""
+Benchmark bytes, parse time and hashing cost of player_metadata per column profile (util.column_profiles).
+
+Rows look like elements of bootstrap-static with every field of the silver player_metadata conversion, or are read
+from an existing landing file with --input. For every profile the rows are projected and compressed the way
+util.extractor lands them, parsed and stringified the way landing_to_staging_3 reads them, and hashed the way
+current_season_history_landing_to_bronze_3 detects changed rows.
+
+Usage:
+    python benchmarks/bench_column_profiles.py --rows 800 --repeat 20
+    python benchmarks/bench_column_profiles.py --input landing/raw_fpl_player_metadata_17022025.json.gz
+"""
+import argparse
+import inspect
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROFILES = ['full', 'analytics', 'minimal']
+
+
+def create_player_rows(rows: int) -> list:
+    from current_season_history_bronze_to_silver_4 import convert_column_datatype_player_metadata
+    dtypes = dict(re.findall(r"'(\w+)': pl\.(\w+)", inspect.getsource(convert_column_datatype_player_metadata)))
+    random.seed(0)
+    values = {
+        'Int64': lambda: random.randint(0, 5000),
+        'Float64': lambda: f"{random.uniform(0, 100):.1f}",
+        'String': lambda: random.choice(['a', 'Mohamed Salah', 'null', '2025-02-17', 'True'])
+    }
+    return [
+        {field: values[dtype]() for field, dtype in dtypes.items() if field != 'ingest_date'}
+        for _ in range(rows)
+    ]
+
+
+def median_ms(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=800)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--input', default=None)
+    args = parser.parse_args()
+
+    import polars as pl
+    from util.column_profiles import project_rows
+    from util.compression import compress, decompress
+
+    if args.input:
+        with open(args.input, 'rb') as input_file:
+            rows = [json.loads(line) for line in decompress(input_file.read()).decode().splitlines() if line.strip()]
+    else:
+        rows = create_player_rows(args.rows)
+
+    print(f"player_metadata: {len(rows)} rows, {len({field for row in rows for field in row})} fields")
+    print(f"{'profile':<10} {'fields':>7} {'landing bytes':>14} {'parse ms':>9} {'hash ms':>8}")
+    for profile in PROFILES:
+        projected_rows, _ = project_rows(rows, 'player_metadata', profile)
+        content = compress("".join(json.dumps(row) + '\n' for row in projected_rows).encode())
+
+        def parse():
+            dataset = pl.read_ndjson(BytesIO(decompress(content)), infer_schema_length=None)
+            return dataset.with_columns([pl.col(column).fill_null("null").cast(pl.Utf8) for column in dataset.columns])
+
+        dataset = parse()
+        parse_ms = median_ms(parse, args.repeat)
+        hash_ms = median_ms(lambda: dataset.with_columns(pl.struct(dataset.columns).hash().alias("row_hash")), args.repeat)
+        print(f"{profile:<10} {dataset.width:>7} {len(content):>14} {parse_ms:>9.2f} {hash_ms:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
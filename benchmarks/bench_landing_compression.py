@@ -0,0 +1,115 @@
+"""
+Benchmark bytes moved and decode time of landing files per compression format.
+
+Rows look like element-summary history, or are read from an existing landing file with --input. For every format
+the landing file is compressed the way the extract functions write it, then decoded the way landing_to_staging_3
+reads it (decompress and polars read_ndjson). With --api-url, the bytes received on the wire are also measured for
+an uncompressed and a negotiated compressed response of the same API call.
+
+Usage:
+    python benchmarks/bench_landing_compression.py --rows 25000
+    python benchmarks/bench_landing_compression.py --input landing/raw_fpl_current_season_history_17022025.json.gz
+    python benchmarks/bench_landing_compression.py --api-url https://fantasy.premierleague.com/api/bootstrap-static/
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FORMATS = ['none', 'gzip', 'zstd']
+
+
+def create_history_content(rows: int) -> bytes:
+    random.seed(0)
+    lines = []
+    for row_id in range(rows):
+        lines.append(json.dumps({
+            'element': row_id // 25 + 1, 'fixture': row_id % 380 + 1, 'opponent_team': random.randint(1, 20),
+            'total_points': random.randint(0, 15), 'was_home': random.random() < 0.5,
+            'kickoff_time': f"2025-02-{row_id % 28 + 1:02d}T15:00:00Z", 'team_h_score': random.randint(0, 5),
+            'team_a_score': random.randint(0, 5), 'round': row_id % 38 + 1, 'minutes': random.choice([0, 90, 67, 23]),
+            'goals_scored': random.randint(0, 2), 'assists': random.randint(0, 2), 'clean_sheets': random.randint(0, 1),
+            'goals_conceded': random.randint(0, 4), 'own_goals': 0, 'penalties_saved': 0, 'penalties_missed': 0,
+            'yellow_cards': random.randint(0, 1), 'red_cards': 0, 'saves': random.randint(0, 6), 'bonus': random.randint(0, 3),
+            'bps': random.randint(-5, 60), 'influence': f"{random.uniform(0, 80):.1f}", 'creativity': f"{random.uniform(0, 80):.1f}",
+            'threat': f"{random.uniform(0, 80):.1f}", 'ict_index': f"{random.uniform(0, 20):.1f}", 'starts': random.randint(0, 1),
+            'expected_goals': f"{random.uniform(0, 1):.2f}", 'expected_assists': f"{random.uniform(0, 1):.2f}",
+            'expected_goal_involvements': f"{random.uniform(0, 2):.2f}", 'expected_goals_conceded': f"{random.uniform(0, 3):.2f}",
+            'value': random.randint(40, 150), 'transfers_balance': random.randint(-50000, 50000),
+            'selected': random.randint(0, 5000000), 'transfers_in': random.randint(0, 100000),
+            'transfers_out': random.randint(0, 100000), 'modified': False
+        }))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def measure_format(content: bytes, compression: str, repeat: int) -> dict:
+    import polars as pl
+    from util.compression import compress, decompress
+
+    compress_ms, decode_ms = [], []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        landing_content = compress(content, compression)
+        compress_ms.append((time.perf_counter() - start_time) * 1000)
+
+        start_time = time.perf_counter()
+        pl.read_ndjson(BytesIO(decompress(landing_content)))
+        decode_ms.append((time.perf_counter() - start_time) * 1000)
+
+    return {
+        'format': compression,
+        'bytes': len(landing_content),
+        'ratio': len(content) / len(landing_content),
+        'compress_ms': statistics.median(compress_ms),
+        'decode_ms': statistics.median(decode_ms)
+    }
+
+
+def measure_api_transfer(url: str) -> None:
+    import requests
+    from util.compression import API_HEADERS, get_transfer_size
+
+    print(f"\n{'accept-encoding':<20} {'content-encoding':<18} {'wire bytes':>12} {'decoded bytes':>14} {'ms':>8}")
+    for headers in [{'Accept-Encoding': 'identity'}, API_HEADERS]:
+        start_time = time.perf_counter()
+        response = requests.get(url, headers=headers, stream=True, timeout=30)
+        decoded_size = len(response.content)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        print(f"{headers['Accept-Encoding']:<20} {response.headers.get('Content-Encoding', 'identity'):<18} "
+              f"{get_transfer_size(response):>12} {decoded_size:>14} {elapsed_ms:>8.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=25000)
+    parser.add_argument('--input', default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--api-url', default=None)
+    args = parser.parse_args()
+
+    if args.input:
+        from util.compression import decompress
+        with open(args.input, 'rb') as input_file:
+            content = decompress(input_file.read())
+    else:
+        content = create_history_content(args.rows)
+
+    row_count = len(content.splitlines())
+    print(f"Uncompressed JSONL: {len(content)} bytes, {row_count} rows")
+    print(f"{'format':<8} {'bytes':>12} {'ratio':>8} {'compress ms':>12} {'decode ms':>10}")
+    for compression in FORMATS:
+        result = measure_format(content, compression, args.repeat)
+        print(f"{result['format']:<8} {result['bytes']:>12} {result['ratio']:>8.1f} {result['compress_ms']:>12.1f} {result['decode_ms']:>10.1f}")
+
+    if args.api_url:
+        measure_api_transfer(args.api_url)
+
+
+if __name__ == '__main__':
+    main()
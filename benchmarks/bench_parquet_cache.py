@@ -0,0 +1,94 @@
+"""
+Benchmark and verify the local parquet cache of delta reads (util.parquet_cache).
+
+A delta table of --files appends is read with pl.read_delta, then once with an empty cache and --repeat times with
+a warm cache. Every cached read is compared with pl.read_delta, so a run also verifies partition columns and
+schema evolution of the cached reads. With --connection-string the table is written to that account or a local
+Azurite emulator, e.g.
+
+    azurite --silent --location /tmp/azurite
+    python benchmarks/bench_parquet_cache.py --connection-string UseDevelopmentStorage=true
+
+Without --connection-string the local backend is used in a temporary folder and the cache is forced on, which
+measures the overhead of the cache rather than the download it saves.
+
+Usage:
+    python benchmarks/bench_parquet_cache.py --files 50 --rows 20000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCHMARK_TABLE = 'benchmark/parquet_cache'
+
+
+def write_table(storage, files: int, rows: int) -> None:
+    import polars as pl
+    table_path = storage.table_uri(BENCHMARK_TABLE)
+    for index in range(files):
+        dataset = pl.DataFrame({
+            'element': range(index * rows, (index + 1) * rows),
+            'total_points': [index % 15] * rows,
+            'season': ['2024/2025' if index % 2 else '2025/2026'] * rows
+        })
+        if index >= files // 2:
+            dataset = dataset.with_columns(pl.lit(index).alias('added_column'))
+        dataset.write_delta(
+            table_path,
+            mode="append",
+            storage_options=storage.storage_options,
+            delta_write_options={"partition_by": ["season"], "schema_mode": "merge"}
+        )
+
+
+def timed(function):
+    start_time = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - start_time) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--connection-string', default=None)
+    parser.add_argument('--container', default='fpl-benchmark')
+    args = parser.parse_args()
+
+    os.environ['ParquetCacheDir'] = tempfile.mkdtemp(prefix='fpl_parquet_cache_')
+    import polars as pl
+    import util.parquet_cache as parquet_cache
+    from bench_async_storage_io import create_storage
+
+    storage = create_storage(args.connection_string, args.container)
+    if not args.connection_string:
+        parquet_cache.is_cached_backend = lambda storage: True
+    write_table(storage, args.files, args.rows)
+
+    expected, read_delta_ms = timed(lambda: pl.read_delta(storage.table_uri(BENCHMARK_TABLE), storage_options=storage.storage_options))
+    cold, cold_ms = timed(lambda: parquet_cache.read_delta_cached(storage, BENCHMARK_TABLE))
+    warm_ms = []
+    for _ in range(args.repeat):
+        warm, elapsed_ms = timed(lambda: parquet_cache.read_delta_cached(storage, BENCHMARK_TABLE))
+        warm_ms.append(elapsed_ms)
+        if not warm.sort('element').equals(expected.sort('element')):
+            raise AssertionError("Cached read differs from pl.read_delta")
+    if not cold.sort('element').equals(expected.sort('element')):
+        raise AssertionError("Cold cached read differs from pl.read_delta")
+
+    stats = parquet_cache.get_parquet_cache().get_stats()
+    print(f"{type(storage).__name__}: {args.files} files, {expected.height} rows")
+    print(f"{'read':<22} {'ms':>10}")
+    print(f"{'pl.read_delta':<22} {read_delta_ms:>10.1f}")
+    print(f"{'cache cold':<22} {cold_ms:>10.1f}")
+    print(f"{'cache warm (median)':<22} {sorted(warm_ms)[len(warm_ms) // 2]:>10.1f}")
+    print(f"hit rate {stats['hit_rate']}, {stats['bytes_downloaded']} bytes downloaded, {stats['bytes_saved']} bytes saved")
+
+
+if __name__ == '__main__':
+    main()
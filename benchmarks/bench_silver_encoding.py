@@ -0,0 +1,122 @@
+"""
+Benchmark storage size, scan time and join memory of silver current_season_history before and after
+util.silver_encoding.
+
+before - flags, manager counts and row_inserted_timestamp as strings, season as pl.String in memory
+after  - typed columns of get_silver_types, season and status as pl.Enum and team name as pl.Categorical in memory
+
+Both tables are written with write_delta into a temporary folder. Scan time is the median of a season filter and
+group-by over the table, join memory is the estimated size of history rows joined with player and team rows on
+element and team, and group-by time is the median of the gameweek aggregation of player_form_silver_to_gold_5.
+
+Usage:
+    python benchmarks/bench_silver_encoding.py --players 800 --rounds 38 --seasons 3 --repeat 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEAMS = ['Arsenal', 'Aston Villa', 'Bournemouth', 'Brentford', 'Brighton', 'Chelsea', 'Crystal Palace', 'Everton',
+         'Fulham', 'Ipswich', 'Leicester', 'Liverpool', 'Man City', 'Man Utd', 'Newcastle', "Nott'm Forest",
+         'Southampton', 'Spurs', 'West Ham', 'Wolves']
+
+
+def create_legacy_history(players: int, rounds: int, seasons: int) -> 'pl.DataFrame':
+    import polars as pl
+    random.seed(0)
+    rows = players * rounds * seasons
+    manager_columns = ['mng_clean_sheets', 'mng_draw', 'mng_goals_scored', 'mng_loss', 'mng_underdog_draw', 'mng_underdog_win', 'mng_win']
+    return pl.DataFrame({
+        'element': [index % players for index in range(rows)],
+        'round': [(index // players) % rounds + 1 for index in range(rows)],
+        'season': [f"{2022 + index // (players * rounds)}/{2023 + index // (players * rounds)}" for index in range(rows)],
+        'total_points': [random.randint(-2, 20) for _ in range(rows)],
+        'minutes': [random.choice([0, 45, 90]) for _ in range(rows)],
+        'was_home': [random.choice(['True', 'False']) for _ in range(rows)],
+        'modified': ['False'] * rows,
+        **{column: ['null'] * rows for column in manager_columns},
+        'row_inserted_timestamp': [f"2024-{random.randint(8, 12):02d}-{random.randint(10, 28)} 10:15:{random.randint(10, 59)}" for _ in range(rows)]
+    })
+
+
+def create_players(players: int) -> 'pl.DataFrame':
+    import polars as pl
+    return pl.DataFrame({
+        'id': range(players),
+        'status': [random.choice(['a', 'a', 'a', 'd', 'i', 'u']) for _ in range(players)],
+        'team': [index % len(TEAMS) for index in range(players)]
+    })
+
+
+def create_teams() -> 'pl.DataFrame':
+    import polars as pl
+    return pl.DataFrame({'id': range(len(TEAMS)), 'name': TEAMS})
+
+
+def folder_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names if name.endswith('.parquet'))
+
+
+def median_ms(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=800)
+    parser.add_argument('--rounds', type=int, default=38)
+    parser.add_argument('--seasons', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    import polars as pl
+    from util.silver_encoding import convert_silver_types, encode_categories
+
+    legacy = create_legacy_history(args.players, args.rounds, args.seasons)
+    typed = convert_silver_types(legacy, 'current_season_history')
+    players = create_players(args.players)
+    teams = create_teams()
+    folder = tempfile.mkdtemp(prefix='fpl_silver_encoding_')
+    season = legacy.get_column('season').max()
+
+    print(f"current_season_history: {legacy.height} rows, {args.seasons} seasons")
+    print(f"{'layout':<8} {'parquet bytes':>14} {'scan ms':>8} {'group-by ms':>12} {'join MB':>8}")
+    for layout, dataset, encode in [('before', legacy, lambda df: df), ('after', typed, encode_categories)]:
+        table_path = os.path.join(folder, layout)
+        dataset.write_delta(table_path, delta_write_options={"partition_by": ["season"]})
+
+        def scan():
+            return encode(
+                pl.scan_delta(table_path)
+                .filter(pl.col('season') == season)
+                .select(['element', 'round', 'season', 'total_points', 'minutes', 'was_home', 'row_inserted_timestamp'])
+                .collect()
+            )
+
+        history = scan()
+        scan_ms = median_ms(scan, args.repeat)
+        group_by_ms = median_ms(
+            lambda: history.sort('row_inserted_timestamp').group_by(['season', 'element', 'round']).agg(pl.col('total_points').sum()),
+            args.repeat
+        )
+        joined = (
+            history
+            .join(encode(players), left_on='element', right_on='id', how='left')
+            .join(encode(teams), left_on='team', right_on='id', how='left')
+        )
+        print(f"{layout:<8} {folder_size(table_path):>14} {scan_ms:>8.1f} {group_by_ms:>12.1f} {joined.estimated_size('mb'):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark peak memory of bronze to silver load for current_season_history against number of rows.
+
+Each measurement runs in a fresh process against local delta tables, so peak RSS of one run does not
+leak into the next one. The in-memory path reads the whole bronze table into a dataframe, the streaming
+path processes record batches under StreamingMemoryBudgetMb.
+
+Usage:
+    python benchmarks/bench_streaming_memory.py --rows 100000 200000 400000 800000 --memory-budget-mb 64
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FILE_DATE = '17022025'
+ROWS_PER_BRONZE_COMMIT = 100_000
+
+# Bronze stores every column of element-summary history as string
+HISTORY_COLUMNS = [
+    'element', 'fixture', 'opponent_team', 'total_points', 'was_home', 'kickoff_time', 'team_h_score', 'team_a_score',
+    'round', 'minutes', 'goals_scored', 'assists', 'clean_sheets', 'goals_conceded', 'own_goals', 'penalties_saved',
+    'penalties_missed', 'yellow_cards', 'red_cards', 'saves', 'bonus', 'bps', 'influence', 'creativity', 'threat',
+    'ict_index', 'starts', 'expected_goals', 'expected_assists', 'expected_goal_involvements', 'expected_goals_conceded',
+    'value', 'transfers_balance', 'selected', 'transfers_in', 'transfers_out', 'modified', 'ingest_date',
+    'mng_clean_sheets', 'mng_draw', 'mng_goals_scored', 'mng_loss', 'mng_underdog_draw', 'mng_underdog_win', 'mng_win'
+]
+
+
+def create_bronze_table(table_path: str, rows: int) -> None:
+    import polars as pl
+
+    for offset in range(0, rows, ROWS_PER_BRONZE_COMMIT):
+        batch_rows = min(ROWS_PER_BRONZE_COMMIT, rows - offset)
+        row_id = pl.int_range(offset, offset + batch_rows, eager=True)
+        bronze_df = pl.DataFrame({
+            column: (row_id % 97).cast(pl.String) for column in HISTORY_COLUMNS
+        }).with_columns([
+            pl.lit("2025-02-17T15:00:00").alias("kickoff_time"),
+            pl.lit("true").alias("was_home"),
+            pl.lit(FILE_DATE).alias("ingest_date"),
+            pl.lit("null").alias("mng_win")
+        ])
+        bronze_df.write_delta(table_path, mode="append")
+
+
+def run_in_memory(bronze_path: str, silver_path: str) -> None:
+    import polars as pl
+    from current_season_history_bronze_to_silver_4 import convert_column_datatype_current_season_history, add_season_to_dataset
+
+    bronze_df = pl.read_delta(bronze_path).filter(pl.col("ingest_date") == FILE_DATE)
+    silver_df = add_season_to_dataset(convert_column_datatype_current_season_history(bronze_df), FILE_DATE)
+    silver_df.write_delta(silver_path, mode="append")
+
+
+def run_streaming(bronze_path: str, silver_path: str, memory_budget_mb: int) -> None:
+    from current_season_history_bronze_to_silver_4 import stream_new_bronze_data_to_silver
+
+    stream_new_bronze_data_to_silver(FILE_DATE, {}, bronze_path, silver_path, 'current_season_history', memory_budget_mb * 1024 * 1024)
+
+
+def measure(mode: str, bronze_path: str, silver_path: str, memory_budget_mb: int) -> None:
+    import polars  # noqa: F401
+    import deltalake  # noqa: F401
+    import current_season_history_bronze_to_silver_4  # noqa: F401
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = time.perf_counter()
+    if mode == 'in_memory':
+        run_in_memory(bronze_path, silver_path)
+    else:
+        run_streaming(bronze_path, silver_path, memory_budget_mb)
+    elapsed = time.perf_counter() - start_time
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f"{(peak_kb - baseline_kb) / 1024:.1f} {peak_kb / 1024:.1f} {elapsed:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 200_000, 400_000, 800_000])
+    parser.add_argument('--memory-budget-mb', type=int, default=64)
+    parser.add_argument('--modes', nargs='+', default=['in_memory', 'streaming'])
+    parser.add_argument('--measure', nargs=3, metavar=('MODE', 'BRONZE', 'SILVER'), help=argparse.SUPPRESS)
+    parser.add_argument('--create', nargs=2, metavar=('BRONZE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.create:
+        create_bronze_table(args.create[0], int(args.create[1]))
+        return
+    if args.measure:
+        measure(*args.measure, memory_budget_mb=args.memory_budget_mb)
+        return
+
+    script = os.path.abspath(__file__)
+    print(f"{'rows':>10} {'mode':>10} {'peak delta MB':>14} {'peak RSS MB':>12} {'seconds':>8}")
+    for rows in args.rows:
+        work_dir = tempfile.mkdtemp(prefix='bench_streaming_')
+        try:
+            bronze_path = os.path.join(work_dir, 'bronze')
+            subprocess.run([sys.executable, script, '--create', bronze_path, str(rows)], check=True)
+            for mode in args.modes:
+                silver_path = os.path.join(work_dir, f'silver_{mode}')
+                output = subprocess.run(
+                    [sys.executable, script, '--measure', mode, bronze_path, silver_path, '--memory-budget-mb', str(args.memory_budget_mb)],
+                    check=True, capture_output=True, text=True
+                ).stdout.split()
+                print(f"{rows:>10} {mode:>10} {output[0]:>14} {output[1]:>12} {output[2]:>8}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,39 +1,90 @@
+import hashlib
 import logging
-import os
-import polars as pl
+import time
+from concurrent.futures import ThreadPoolExecutor
 import azure.functions as func
-from util.common_func import create_storage_options
+from util.lazy_import import lazy_import
+from util.instrumentation import instrument, record_delta_version
+from util.delta_writer import open_delta_table, write_delta_table
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from util.silver_encoding import align_silver_table
+from util.common_func import create_season_value
 from datetime import datetime
 
+pl = lazy_import('polars')
+deltalake = lazy_import('deltalake')
 
-def read_data(credential, ingest_date, data_source, layer):
-    container_name = os.getenv("StorageAccountContainer")
-    StorageAccountName = os.getenv("StorageAccountName")
-    azure_path = f"abfss://{container_name}@{StorageAccountName}.dfs.core.windows.net/{layer}/{data_source}"
-    logging.info(f"Reading {azure_path}")
-    dataset = pl.read_delta(azure_path, storage_options=credential)
-    data_df = dataset.filter(pl.col("ingest_date") == ingest_date)
-    logging.info(f"Created {data_source} dataset for ingest date = {ingest_date}")
-    return data_df
 
+# Columns selected from each bronze table and the join key columns to be normalized to integer
+PROFILE_SOURCE_TABLES = {
+    'player_metadata': {
+        'columns': ["id", "element_type", "team", "web_name", "now_cost", "status", "can_select", "birth_date", "team_join_date"],
+        'key_columns': ["id", "element_type", "team"]
+    },
+    'position_metadata': {
+        'columns': ["id", "singular_name"],
+        'key_columns': ["id"]
+    },
+    'team_metadata': {
+        'columns': ["id", "name"],
+        'key_columns': ["id"]
+    }
+}
 
-def create_season_value(file_date):
-    year = int(file_date[4:])
-    month = int(file_date[2:4])
-
-    month_a_list = [8,9,10,11,12]
 
-    if month in month_a_list:
-        year_a = int(year) + 1
-        actual_season = str(year) + '/' + str(year_a)
-        logging.info(f"Actual season: {actual_season}")
-        return actual_season
+def scan_data(credential, ingest_date, data_source, layer, columns, key_columns, source_frame=None):
+    azure_path = get_storage().table_uri(f"{layer}/{data_source}")
+    start_time = time.perf_counter()
+    if source_frame is None:
+        logging.info(f"Scanning {azure_path}")
+        source_dataset = pl.scan_delta(azure_path, storage_options=credential)
     else:
-        actual_year = int(year) - 1
-        actual_season = str(actual_year) + '/' + str(year)
-        logging.info(f"Actual season: {actual_season}")
-        return actual_season
-    
+        # Rows handed over in memory by the previous stage of the pipeline orchestrator
+        logging.info(f"Using {source_frame.height} {data_source} rows from memory")
+        source_dataset = source_frame.lazy()
+    dataset = (
+        source_dataset
+        .filter(pl.col("ingest_date") == ingest_date)
+        .select([
+            pl.col(column).cast(pl.Int64) if column in key_columns else pl.col(column)
+            for column in columns
+        ])
+    )
+    metadata_ms = (time.perf_counter() - start_time) * 1000
+    logging.info(f"Created {data_source} scan for ingest date = {ingest_date} in {metadata_ms:.1f} ms")
+    return dataset, metadata_ms
+
+
+def scan_source_tables(credential, ingest_date, layer, source_frames=None):
+    source_frames = source_frames or {}
+    # Delta log of each table is loaded concurrently. Parquet files are only read when the joined plan is collected.
+    with ThreadPoolExecutor(max_workers=len(PROFILE_SOURCE_TABLES)) as executor:
+        futures = {
+            data_source: executor.submit(scan_data, credential, ingest_date, data_source, layer, table['columns'], table['key_columns'], source_frames.get(data_source))
+            for data_source, table in PROFILE_SOURCE_TABLES.items()
+        }
+        scans = {data_source: future.result() for data_source, future in futures.items()}
+
+    datasets = {data_source: scan[0] for data_source, scan in scans.items()}
+    metadata_timing = {data_source: scan[1] for data_source, scan in scans.items()}
+    return datasets, metadata_timing
+
+
+@instrument('read')
+def collect_with_scan_timing(lazy_dataset, metadata_timing):
+    dataset, profile = lazy_dataset.profile()
+    node_timing = {row["node"]: (row["end"] - row["start"]) / 1000 for row in profile.iter_rows(named=True)}
+
+    # Projection of each table is fused with its parquet scan in the profile output
+    for data_source, table in PROFILE_SOURCE_TABLES.items():
+        scan_ms = node_timing.get(f"select({', '.join(table['columns'])})")
+        scan_ms_text = "n/a" if scan_ms is None else f"{scan_ms:.1f} ms"
+        logging.info(f"Scan time for {data_source} - metadata: {metadata_timing[data_source]:.1f} ms, scan: {scan_ms_text}")
+
+    logging.info(f"Collected player profile dataset with {dataset.height} rows")
+    return dataset
+
 
 def add_season_to_dataset(dataset, season_year):
     #season = create_season_value(season_year)
@@ -44,8 +95,8 @@ def add_season_to_dataset(dataset, season_year):
     # Add new columns
     result = dataset.with_columns([
         pl.lit(season_year).alias('season'),
-        pl.lit(datetime.now()).dt.strftime('%Y-%m-%d %H:%M:%S').alias('inserted_timestamp'),
-        pl.lit(datetime.now()).dt.strftime('%Y-%m-%d %H:%M:%S').alias('updated_timestamp')
+        pl.lit(datetime.now()).cast(pl.Datetime("us")).alias('inserted_timestamp'),
+        pl.lit(datetime.now()).cast(pl.Datetime("us")).alias('updated_timestamp')
     ])
     
     logging.info(f"Add season column - {season_year} to dataset")
@@ -63,6 +114,7 @@ def join_multiple_dataset(dataset_1, dataset_2, dataset_3):
     return result_latest
 
 
+@instrument('transform')
 def data_quality(dataset_4):
     dtype_mapping = {
         'id': pl.String,
@@ -81,15 +133,20 @@ def data_quality(dataset_4):
 
     datetime_cols = {'birth_date', 'team_join_date', 'inserted_timestamp', 'updated_timestamp'}
 
+    string_cols = {col_name for col_name, dtype in dataset_4.schema.items() if dtype == pl.String}
+
     df = dataset_4.with_columns([
         (
             pl.col(col_name)
             .replace("null", None)
             .str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S", strict=False)
-            if col_name in datetime_cols else
+            if col_name in datetime_cols and col_name in string_cols else
             pl.col(col_name)
             .replace("null", None)
             .cast(dtype)
+            if col_name in string_cols else
+            pl.col(col_name)
+            .cast(dtype)
         ).alias(col_name)
         for col_name, dtype in dtype_mapping.items()
     ])
@@ -99,40 +156,168 @@ def data_quality(dataset_4):
     return df
 
 
-def write_bronze_to_silver(dataset, storage_options, container_name, adls_url, layer, data_source):
+@instrument('write', dataset_arg='dataset')
+def write_bronze_to_silver(dataset, storage_options, azure_path, layer, data_source):
     try:
         #write_deltalake(f"abfss://{container_name}@{adls_url}.dfs.core.windows.net/{layer}/{data_source}", dataset, storage_options=storage_options, mode='overwrite', engine='rust', schema_mode='overwrite', schema=column)
-        dataset.write_delta(
-            f"abfss://{container_name}@{adls_url}.dfs.core.windows.net/{layer}/{data_source}",
-            mode="append",
-            storage_options=storage_options
-        )
+        table_path = f"{azure_path}/{layer}/{data_source}"
+        align_silver_table(table_path, storage_options, data_source)
+        version = write_delta_table(dataset, table_path, storage_options, mode="append")
+        record_delta_version(version)
         logging.info(f"Dataset has been inserted into {layer} layer")
     except Exception as e:
         logging.error(f"An error occured: {str(e)}")
+        raise
+
+
+# Attributes tracked for changes in scd2 mode. A new version of a player is opened when any of these changes.
+SCD2_TRACKED_COLUMNS = ["now_cost", "status", "name", "singular_name", "can_select"]
+
+PROFILE_COLUMNS = ["id", "web_name", "name", "singular_name", "now_cost", "status", "can_select", "birth_date", "team_join_date", "season", "inserted_timestamp", "updated_timestamp"]
+
+
+def add_row_hash(dataset):
+    # md5 is used instead of polars hash because the fingerprint is persisted and must be stable across polars versions
+    tracked_values = pl.concat_str(
+        [pl.col(col_name).cast(pl.String).fill_null("null") for col_name in SCD2_TRACKED_COLUMNS],
+        separator="|"
+    )
+    return dataset.with_columns(
+        tracked_values.map_batches(
+            lambda values: pl.Series([hashlib.md5(value.encode()).hexdigest() for value in values], dtype=pl.String),
+            return_dtype=pl.String
+        ).alias("row_hash")
+    )
+
+
+def read_current_profile(table_path, storage_options, season):
+    try:
+        deltalake.DeltaTable(table_path, storage_options=storage_options)
+    except deltalake.exceptions.TableNotFoundError:
+        logging.info(f"Delta table {table_path} does not exist yet")
+        return None
 
+    current_df = (
+        pl.scan_delta(table_path, storage_options=storage_options)
+        .filter((pl.col("is_current") == True) & (pl.col("season") == season))
+        .select(["id", "row_hash"])
+        .collect()
+    )
+    logging.info(f"Read {current_df.height} current player profile rows for season {season}")
+    return current_df
 
+
+def create_scd2_source(dataset, current_df):
+    profile_df = add_row_hash(dataset).with_columns([
+        pl.lit(True).alias("is_current"),
+        pl.col("inserted_timestamp").alias("valid_from"),
+        pl.lit(None, dtype=pl.Datetime("us")).alias("valid_to")
+    ])
+
+    new_df = profile_df.join(current_df, on="id", how="anti")
+    changed_df = profile_df.join(current_df, on="id", how="inner", suffix="_current").filter(
+        pl.col("row_hash") != pl.col("row_hash_current")
+    ).drop("row_hash_current")
+    logging.info(f"Player profile changes - new: {new_df.height}, changed: {changed_df.height}, unchanged: {profile_df.height - new_df.height - changed_df.height}")
+
+    # Rows with merge_key close the current version of a changed player or insert a new player.
+    # Rows without merge_key never match and insert the new version of a changed player.
+    return pl.concat([
+        pl.concat([new_df, changed_df]).with_columns(pl.col("id").alias("merge_key")),
+        changed_df.with_columns(pl.lit(None, dtype=pl.String).alias("merge_key"))
+    ])
+
+
+@instrument('write', dataset_arg='dataset')
+def merge_scd2_profile(dataset, storage_options, azure_path, layer, data_source):
+    table_path = f"{azure_path}/{layer}/{data_source}"
+    season = dataset.select(pl.col("season").first()).item()
+    align_silver_table(table_path, storage_options, data_source)
+    current_df = read_current_profile(table_path, storage_options, season)
+
+    if current_df is None:
+        initial_df = add_row_hash(dataset).with_columns([
+            pl.lit(True).alias("is_current"),
+            pl.col("inserted_timestamp").alias("valid_from"),
+            pl.lit(None, dtype=pl.Datetime("us")).alias("valid_to")
+        ])
+        version = write_delta_table(initial_df, table_path, storage_options, mode="append")
+        record_delta_version(version)
+        logging.info(f"Created {layer} {data_source} with {initial_df.height} current player profile rows")
+        return
+
+    source_df = create_scd2_source(dataset, current_df)
+    if source_df.is_empty():
+        logging.info(f"No player profile changes to be merged into {layer} {data_source}")
+        return
+
+    insert_columns = {col_name: f"s.{col_name}" for col_name in source_df.columns if col_name != "merge_key"}
+    # Merged through the table object, which holds the version of the merge commit afterwards
+    delta_table = open_delta_table(table_path, storage_options)
+    merge_result = (
+        source_df.write_delta(
+            delta_table,
+            mode="merge",
+            storage_options=storage_options,
+            delta_merge_options={
+                "predicate": "t.id = s.merge_key AND t.season = s.season AND t.is_current = true",
+                "source_alias": "s",
+                "target_alias": "t"
+            }
+        )
+        .when_matched_update(
+            updates={
+                "is_current": "false",
+                "valid_to": "s.valid_from",
+                "updated_timestamp": "s.updated_timestamp"
+            },
+            predicate="t.row_hash != s.row_hash"
+        )
+        .when_not_matched_insert(updates=insert_columns)
+        .execute()
+    )
+    record_delta_version(delta_table.version())
+    logging.info(f"Merged player profile changes into {layer} {data_source}: {merge_result}")
+
+
+def run_player_profile(ingest_date, storage, season=None, load_mode='snapshot', source_frames=None):
+    storage_options = storage.storage_options
+    silver_layer = 'silver'
+    data_source_type = 'cdz2_player_profile'
+    season = season or create_season_value(ingest_date)
+    source_datasets, metadata_timing = scan_source_tables(storage_options, ingest_date, layer='bronze', source_frames=source_frames)
+    latest_dataset_plan = join_multiple_dataset(source_datasets['player_metadata'], source_datasets['position_metadata'], source_datasets['team_metadata'])
+    latest_dataset = collect_with_scan_timing(latest_dataset_plan, metadata_timing)
+    latest_dataset_2 = add_season_to_dataset(latest_dataset, season)
+    latest_dataset_3 = data_quality(latest_dataset_2)
+    df_reordered = latest_dataset_3.select(PROFILE_COLUMNS)
+    if load_mode == 'scd2':
+        merge_scd2_profile(df_reordered, storage_options, storage.root_uri, silver_layer, f"{data_source_type}_scd2")
+    else:
+        write_bronze_to_silver(df_reordered, storage_options, storage.root_uri, silver_layer, data_source_type)
+    return df_reordered
+
+
+@profile_invocation
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Python HTTP trigger function processed a request.")
+
+    ingest_date = req.params.get('ingest_date')
+
+    if not ingest_date:
+        return func.HttpResponse(
+            "No parameter supplied. Please provide a 'ingest_date' based on the file to be ingested. Date format should be ddMMyyyy",
+            status_code=400
+        )
+    elif req.params.get('load_mode', 'snapshot') not in ('snapshot', 'scd2'):
+        return func.HttpResponse(
+            "Wrong 'load_mode' parameter supplied. Input could be either snapshot or scd2",
+            status_code=400
+        )
+
     try:
-        adls_url = os.getenv("StorageAccountName")
-        container_name = os.getenv("StorageAccountContainer")
-        silver_layer = 'silver'
-        data_source_type = 'cdz2_player_profile'
-        ingest_date = '17022025'
-        password = create_storage_options(os.getenv('KeyVault'))
-        season = create_season_value(ingest_date)
-        df_player_metadata = read_data(password, ingest_date, data_source='player_metadata', layer='bronze')
-        df_player_metadata_select = df_player_metadata.select(["id", "element_type", "team", "web_name", "now_cost", "status", "can_select", "birth_date", "team_join_date"])
-        df_position_metadata = read_data(password, ingest_date, data_source='position_metadata', layer='bronze')
-        df_position_metadata_select = df_position_metadata.select(["id", "singular_name"])
-        df_team_metadata = read_data(password, ingest_date, data_source='team_metadata', layer='bronze')
-        df_team_metadata_select = df_team_metadata.select(["id", "name"])
-        latest_dataset = join_multiple_dataset(df_player_metadata_select, df_position_metadata_select, df_team_metadata_select)
-        latest_dataset_2 = add_season_to_dataset(latest_dataset, season)
-        latest_dataset_3 = data_quality(latest_dataset_2)
-        df_reordered = latest_dataset_3.select(["id", "web_name", "name", "singular_name", "now_cost", "status", "can_select", "birth_date", "team_join_date", "season", "inserted_timestamp", "updated_timestamp"])
-        write_bronze_to_silver(df_reordered, password, container_name, adls_url, silver_layer, data_source_type)
+        load_mode = req.params.get('load_mode', 'snapshot')
+        run_player_profile(ingest_date, get_storage(), req.params.get('season'), load_mode)
         return func.HttpResponse(f"Process Completed", status_code=200)
     except Exception as e:
         return func.HttpResponse(f"An error occured: {str(e)}", status_code=500)
\ No newline at end of file
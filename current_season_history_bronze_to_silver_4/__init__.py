@@ -1,27 +1,35 @@
-from deltalake import DeltaTable, write_deltalake
-import duckdb
 from datetime import datetime
-import polars as pl
 import azure.functions as func
 import logging
-from util.common_func import create_storage_options
+from util.lazy_import import lazy_import
+from util.watermark import create_watermark_app_id, get_watermark, commit_watermark, create_watermark_commit_properties, read_delta_changes, scan_files_added_since
+from util.streaming import DEFAULT_MEMORY_BUDGET_MB, calculate_batch_size, scan_batches, transform_batches, write_batches_to_delta
+from util.instrumentation import instrument, record_delta_version
+from util.delta_writer import write_delta_table
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from util.parquet_cache import read_delta_cached
+from util.data_quality import QUALITY_RULES, QualityCollector, load_reference_values, validate_dataset, write_quality_results
+from util.silver_encoding import align_silver_table, convert_silver_types, decode_categories
+from util.common_func import create_season_value
 import os
-import pandas as pd
 
+pl = lazy_import('polars')
+ds = lazy_import('pyarrow.dataset')
+deltalake = lazy_import('deltalake')
 
-def read_bronze_file(ingest_date, credential, layer, data_source):
-    container_name = os.getenv("StorageAccountContainer")
-    StorageAccountName = os.getenv("StorageAccountName")
-    azure_path = f"abfss://{container_name}@{StorageAccountName}.dfs.core.windows.net/{layer}/{data_source}"
-    logging.info(f"Reading {azure_path}")
-    dataset = pl.read_delta(azure_path, storage_options=credential)
+
+def read_bronze_file(ingest_date, credential, layer, data_source, version=None):
+    storage = get_storage()
+    logging.info(f"Reading {storage.table_uri(f'{layer}/{data_source}')}")
+    dataset = read_delta_cached(storage, f"{layer}/{data_source}", version=version)
     data_df = dataset.filter(pl.col("ingest_date") == ingest_date)
     logging.info(f"Created {data_source} dataset for ingest date = {ingest_date}")
     return data_df
 
 
 def get_list_column(credential, data_source):
-    adls_path = f"abfss://fantasy-premier-league@azfarsadev.dfs.core.windows.net/bronze/{data_source}"
+    adls_path = get_storage().table_uri(f"bronze/{data_source}")
     dataset_schema = pl.read_delta(source=adls_path, storage_options=credential).schema
     dataset_odict = dataset_schema.keys()
     dataset_list = list(dataset_odict)
@@ -29,8 +37,8 @@ def get_list_column(credential, data_source):
     return dataset_list
 
 
-def convert_column_datatype_current_season_history(df):
-    dtype_mapping = {
+def get_current_season_history_dtypes():
+    return {
         'element': pl.Int64,
         'fixture': pl.Int64,
         'opponent_team': pl.Int64,
@@ -78,6 +86,10 @@ def convert_column_datatype_current_season_history(df):
         'mng_win': pl.String
     }
 
+
+def convert_column_datatype_current_season_history(df):
+    dtype_mapping = get_current_season_history_dtypes()
+
     df = df.with_columns([
         pl.col(col_name).replace("null", None).cast(dtype)
         for col_name, dtype in dtype_mapping.items()
@@ -196,8 +208,9 @@ def convert_column_datatype_player_metadata(df):
         'team_join_date': pl.String
     }
 
+    # Fields left out by a column profile at extraction are 'null' in bronze
     df = df.with_columns([
-        pl.col(col_name).cast(dtype)
+        pl.col(col_name).cast(dtype) if dtype == pl.String else pl.col(col_name).replace("null", None).cast(dtype)
         for col_name, dtype in dtype_mapping.items()
     ])
 
@@ -271,34 +284,130 @@ def convert_column_datatype_team_metadata(df):
 
 
 
-def write_bronze_to_silver(dataset, storage_options, container_name, adls_url, layer, data_source):
+@instrument('write', dataset_arg='dataset')
+def write_bronze_to_silver(dataset, storage_options, azure_path, layer, data_source, commit_properties=None):
     try:
         #write_deltalake(f"abfss://{container_name}@{adls_url}.dfs.core.windows.net/{layer}/{data_source}", dataset, storage_options=storage_options, mode='overwrite', engine='rust', schema_mode='overwrite', schema=column)
-        dataset.write_delta(
-            f"abfss://{container_name}@{adls_url}.dfs.core.windows.net/{layer}/{data_source}",
+        delta_write_options = {"commit_properties": commit_properties} if commit_properties else None
+        table_path = f"{azure_path}/{layer}/{data_source}"
+        version = write_delta_table(
+            decode_categories(dataset),
+            table_path,
+            storage_options,
             mode="append",
-            storage_options=storage_options
+            delta_write_options=delta_write_options
         )
+        record_delta_version(version)
         logging.info(f"Dataset has been inserted into {layer} layer")
     except Exception as e:
         logging.error(f"An error occured: {str(e)}")
-
-
-def create_season_value(file_date):
-    year = int(file_date[4:])
-    month = int(file_date[2:4])
-
-    month_a_list = [8,9,10,11,12]
-
-    if month in month_a_list:
-        year_a = year + 1
-        actual_season = str(year) + '/' + str(year_a)
-        return actual_season
+        raise
+
+
+@instrument('transform')
+def convert_column_datatype(df, data_source):
+    # Flags, manager counts and timestamps kept as strings by the conversions are typed by convert_silver_types
+    if data_source == 'current_season_history':
+        return convert_silver_types(convert_column_datatype_current_season_history(df), data_source)
+    elif data_source == 'player_metadata':
+        return convert_silver_types(convert_column_datatype_player_metadata(df), data_source)
+    elif data_source == 'position_metadata':
+        return convert_silver_types(convert_column_datatype_position_metadata(df), data_source)
+    elif data_source == 'team_metadata':
+        return convert_silver_types(convert_column_datatype_team_metadata(df), data_source)
+
+
+@instrument('write')
+def stream_new_bronze_data_to_silver(file_date, credential, bronze_path, silver_path, data_source, memory_budget_bytes):
+    """
+    Load bronze rows that have not been loaded into silver yet in record batches under a memory budget.
+    Each batch goes through the same datatype conversion, data quality rules and season column as the in-memory path.
+    Unique rules are only checked within a batch.
+
+    Args:
+        file_date (str): The file date to be processed when there is no watermark.
+        credential (dict): Credentials to access ADLS2.
+        bronze_path (str): The path of the bronze delta table.
+        silver_path (str): The path of the silver delta table.
+        data_source (str): The value of data source to be processed.
+        memory_budget_bytes (int): Memory budget for the batches in flight.
+
+    Returns:
+        bool: True if rows have been written into silver, False if there is no new bronze data.
+    """
+    app_id = create_watermark_app_id('silver', data_source)
+    watermark = get_watermark(silver_path, app_id, credential)
+    bronze_table = deltalake.DeltaTable(bronze_path, storage_options=credential)
+    bronze_version = bronze_table.version()
+
+    if watermark is None:
+        bronze_dataset = bronze_table.to_pyarrow_dataset()
+        scan_filter = ds.field("ingest_date") == file_date
+    elif bronze_version <= watermark:
+        logging.info(f"No new version in {bronze_path}. Current version {bronze_version}, watermark {watermark}")
+        return False
     else:
-        actual_year = year - 1
-        actual_season = str(actual_year) + '/' + str(year)
-        return actual_season
-
+        bronze_dataset = scan_files_added_since(bronze_table, watermark, credential)
+        scan_filter = None
+
+    azure_path = get_storage().root_uri
+    quality = QualityCollector(data_source, file_date, load_reference_values(QUALITY_RULES.get(data_source, []), azure_path, credential))
+    batch_size = calculate_batch_size(bronze_dataset, memory_budget_bytes, scan_filter)
+    silver_batches = transform_batches(
+        scan_batches(bronze_dataset, batch_size, scan_filter),
+        lambda batch_df: add_season_to_dataset(quality.validate(convert_column_datatype(batch_df, data_source)), file_date)
+    )
+    if silver_batches is None:
+        write_quality_results(*quality.results(), azure_path, credential)
+        empty_dataset = add_season_to_dataset(convert_column_datatype(pl.from_arrow(bronze_dataset.schema.empty_table()), data_source), file_date)
+        commit_watermark(silver_path, app_id, bronze_version, credential, empty_dataset)
+        logging.info(f"No valid bronze data for {data_source} up to bronze version {bronze_version}")
+        return False
+
+    commit_properties = create_watermark_commit_properties(app_id, bronze_version)
+    version = write_batches_to_delta(silver_batches, silver_path, credential, memory_budget_bytes, batch_size, commit_properties=commit_properties)
+    record_delta_version(version)
+    write_quality_results(*quality.results(), azure_path, credential)
+    logging.info(f"Dataset has been streamed into silver layer up to bronze version {bronze_version}")
+
+    return True
+
+
+@instrument('read')
+def read_new_bronze_data(file_date, credential, bronze_path, silver_path, data_source, bronze_rows=None, bronze_rows_version=None):
+    """
+    Read bronze rows that have not been loaded into silver yet.
+
+    When the silver table has no watermark, the bronze table is read for the file date only,
+    otherwise only the rows added to bronze since the watermark version are read.
+
+    Args:
+        file_date (str): The file date to be processed when there is no watermark.
+        credential (dict): Credentials to access ADLS2.
+        bronze_path (str): The path of the bronze delta table.
+        silver_path (str): The path of the silver delta table.
+        data_source (str): The value of data source to be processed.
+        bronze_rows (pl.DataFrame): Rows of a bronze commit that are still in memory. They are used instead of
+                                    reading bronze when that commit is the next one after the watermark.
+        bronze_rows_version (int): The bronze version committed by bronze_rows.
+
+    Returns:
+        tuple: Bronze rows to be loaded and the bronze version they were read up to.
+    """
+    app_id = create_watermark_app_id('silver', data_source)
+    watermark = get_watermark(silver_path, app_id, credential)
+
+    # Bronze commits after bronze_rows_version are loaded by the next run, commits before it have to be read
+    if bronze_rows is not None and bronze_rows_version is not None and watermark == bronze_rows_version - 1:
+        logging.info(f"Using {bronze_rows.height} bronze rows from memory for bronze version {bronze_rows_version}")
+        return bronze_rows, bronze_rows_version
+
+    if watermark is None:
+        bronze_version = deltalake.DeltaTable(bronze_path, storage_options=credential).version()
+        logging.info(f"No watermark for {app_id}. Reading bronze version {bronze_version} for file date {file_date}")
+        return read_bronze_file(file_date, credential, 'bronze', data_source, version=bronze_version), bronze_version
+
+    return read_delta_changes(bronze_path, watermark, credential)
 
 
 def add_season_to_dataset(dataset, season_year):
@@ -311,7 +420,7 @@ def add_season_to_dataset(dataset, season_year):
     # Add new columns
     result = dataset.with_columns([
         pl.lit(season).alias('season'),
-        pl.lit(datetime.now()).dt.strftime('%Y-%m-%d %H:%M:%S').alias('row_inserted_timestamp')
+        pl.lit(datetime.now()).cast(pl.Datetime("us")).alias('row_inserted_timestamp')
     ])
     
     logging.info(f"Add season column - {season} to dataset")
@@ -332,11 +441,70 @@ def convert_ingest_date_column_to_bigint(df_to_fix):
 
 
 
+def load_bronze_to_silver(data_source, file_date, storage, execution_mode='in_memory', bronze_rows=None, bronze_rows_version=None):
+    """
+    Load bronze rows that have not been loaded into silver yet into silver delta table.
+
+    Args:
+        data_source (str): The value of data source to be processed.
+        file_date (str): The file date to be processed.
+        storage: The storage backend from util.storage.
+        execution_mode (str): Either in_memory or streaming.
+        bronze_rows (pl.DataFrame): Rows of a bronze commit that are still in memory.
+        bronze_rows_version (int): The bronze version committed by bronze_rows.
+
+    Returns:
+        pl.DataFrame: Rows written into silver. Empty if there is no new bronze data. None in streaming mode.
+    """
+    silver_layer = 'silver'
+    credential = storage.storage_options
+    azure_path = storage.root_uri
+    bronze_path = f"{azure_path}/bronze/{data_source}"
+    silver_path = f"{azure_path}/{silver_layer}/{data_source}"
+    logging.info(f"Data source - {data_source}")
+    align_silver_table(silver_path, credential, data_source, create_watermark_app_id(silver_layer, data_source))
+
+    if execution_mode == 'streaming':
+        memory_budget_bytes = int(os.getenv("StreamingMemoryBudgetMb", DEFAULT_MEMORY_BUDGET_MB)) * 1024 * 1024
+        stream_new_bronze_data_to_silver(file_date, credential, bronze_path, silver_path, data_source, memory_budget_bytes)
+        return None
+
+    data_length, bronze_version = read_new_bronze_data(file_date, credential, bronze_path, silver_path, data_source, bronze_rows, bronze_rows_version)
+
+    if data_length.is_empty():
+        logging.info(f"No new bronze data for {data_source} up to bronze version {bronze_version}")
+        return data_length
+
+    converted_column_dataset = convert_column_datatype(data_length, data_source)
+
+    reference_values = load_reference_values(QUALITY_RULES.get(data_source, []), azure_path, credential)
+    valid_dataset, quarantine_df, metrics_df = validate_dataset(converted_column_dataset, data_source, file_date, reference_values)
+    write_quality_results(quarantine_df, metrics_df, azure_path, credential)
+    if valid_dataset.is_empty():
+        logging.warning(f"Every new bronze row of {data_source} has been quarantined")
+        # The watermark still moves on, so the quarantined rows are not loaded and quarantined again
+        commit_watermark(silver_path, create_watermark_app_id(silver_layer, data_source), bronze_version, credential, add_season_to_dataset(valid_dataset, file_date))
+        return valid_dataset
+
+    new_dataset = add_season_to_dataset(valid_dataset, file_date)
+    #   logging.info(f"Season {create_season_value(file_date)} has been added to the dataset")
+    #convert_dataset = convert_ingest_date_column_to_bigint(new_dataset)
+    commit_properties = create_watermark_commit_properties(create_watermark_app_id(silver_layer, data_source), bronze_version)
+    write_bronze_to_silver(new_dataset, credential, azure_path, silver_layer, data_source, commit_properties=commit_properties)
+
+    #print(str(convert_dataset.select('row_inserted_timestamp').head(5)), errors='replace')
+    #   logging.info(f"{data_source_type} data for date {file_date} has been written to silver layer")
+
+    return new_dataset
+
+
+@profile_invocation
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Python HTTP trigger function processed a request.")
 
     data_source_type = req.params.get('data_source')
     file_date = req.params.get('file_date')
+    execution_mode = req.params.get('execution_mode') or os.getenv("SilverExecutionMode", "in_memory")
 
     if not data_source_type:
         return func.HttpResponse(
@@ -350,38 +518,10 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     try:
-        adls_url = os.getenv("StorageAccountName")
-        container_name = os.getenv("StorageAccountContainer")
-        password = create_storage_options(os.getenv('KeyVault'))
-        bronze_layer = 'bronze'
-        silver_layer = 'silver'
-        logging.info(f"Data source - {data_source_type}")
-        data_length = read_bronze_file(file_date, password, bronze_layer, data_source_type)
-
-        if data_source_type == 'current_season_history':
-            converted_column_dataset = convert_column_datatype_current_season_history(data_length)
-        elif data_source_type == 'player_metadata':
-            converted_column_dataset = convert_column_datatype_player_metadata(data_length)
-        elif data_source_type == 'position_metadata':
-            converted_column_dataset = convert_column_datatype_position_metadata(data_length)
-        elif data_source_type == 'team_metadata':
-            converted_column_dataset = convert_column_datatype_team_metadata(data_length)
-
-        #dataset_column = get_list_column(password, data_source_type)
-        #logging.info(f"Dataset column - {dataset_column}")
-#
-        #column_null_check = check_for_null(data_length)
-        #if column_null_check != 0:
-        #    logging.error("There is null")
-        #else:
-        #   logging.info(f"There is no null in the datasets")
-        new_dataset = add_season_to_dataset(converted_column_dataset, file_date)
-        #   logging.info(f"Season {create_season_value(file_date)} has been added to the dataset")
-        #convert_dataset = convert_ingest_date_column_to_bigint(new_dataset)
-        write_bronze_to_silver(new_dataset, password, container_name, adls_url, silver_layer, data_source_type)
-
-        #print(str(convert_dataset.select('row_inserted_timestamp').head(5)), errors='replace')
-        #   logging.info(f"{data_source_type} data for date {file_date} has been written to silver layer")
+        silver_dataset = load_bronze_to_silver(data_source_type, file_date, get_storage(), execution_mode)
+
+        if silver_dataset is not None and silver_dataset.is_empty():
+            return func.HttpResponse(f"No new data to be loaded into silver layer for data source {data_source_type}", status_code=200)
 
         return func.HttpResponse(f"Process Completed", status_code=200)
     except Exception as e:
@@ -1,11 +1,17 @@
-import os
 import azure.functions as func
 import logging
 from datetime import datetime
-from azure.identity import DefaultAzureCredential
-from util.common_func import convert_timestamp_to_myt_date, create_storage_options
-import polars as pl
-from deltalake import DeltaTable
+from typing import Optional, Tuple
+from util.common_func import convert_timestamp_to_myt_date, create_season_value
+from util.instrumentation import instrument, record_delta_version
+from util.delta_writer import write_delta_table
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from util.parquet_cache import read_delta_cached
+from util.lazy_import import lazy_import
+
+pl = lazy_import('polars')
+deltalake = lazy_import('deltalake')
 
 """
 This code is to move data from staging delta table to bronze delta table.
@@ -13,72 +19,32 @@ It also create custom value such as season, composite key to join 4 base tables.
 """
 
 
-def create_season_value(file_date: str) -> str:
-    """
-    Create season value.
-
-    Args:
-        file_date (str): The value of date to be used as indicator to create season value.
-
-    Returns:
-        str: Season value. Example value is 2024/2025.
-    """
-    year = int(file_date[4:])
-    month = int(file_date[2:4])
-
-    month_list = [8,9,10,11,12]
-
-    if len(file_date) != 8:
-        error_msg = f"File date value - {file_date} is wrong"
-        logging.error(error_msg)
-        raise ValueError(error_msg)
-
-    try:
-        date_object = datetime.strptime(file_date, '%d%m%Y')
-        year = date_object.year
-        month = date_object.month
-
-
-        if month in month_list:
-            year_a = int(year) + 1
-            actual_season = str(year) + '/' + str(year_a)
-            logging.info(f"Actual season: {actual_season}")
-            return actual_season
-        else:
-            actual_year = int(year) - 1
-            actual_season = str(actual_year) + '/' + str(year)
-            logging.info(f"Actual season: {actual_season}")
-            return actual_season
-    except ValueError as e:
-        error_msg = f"Invalid file_date format or value: '{file_date}'. Expected 'ddMMyyyy'. Error: {e}"
-        logging.error(error_msg)
-        raise ValueError(error_msg)
-
-
-def write_raw_to_bronze(dataset: pl.DataFrame, storage_options: dict, container_name: str, adls_url: str, data_source: str) -> None:
+@instrument('write', dataset_arg='dataset')
+def write_raw_to_bronze(dataset: 'pl.DataFrame', storage_options: dict, azure_path: str, data_source: str) -> int:
     """
     Write data to delta table in bronze layer.
 
     Args:
         dataset (pl.dataframe): Dataset to be written to delta table.
         storage_options (dict): Credentials to access ADLS2.
-        container_name (str): Container of delta table.
-        adls_url (str): The URL of the Azure Storage account (e.g., "https://youraccount.blob.core.windows.net").
+        azure_path (str): The root path of the storage backend.
         data_source (str): The value of data source to be processed.
+
+    Returns:
+        int: The version of bronze delta table committed by the write.
     """
     try:
-        dataset.write_delta(
-            f"abfss://{container_name}@{adls_url}/bronze/{data_source}",
-            mode="append",
-            storage_options=storage_options
-        )
+        table_path = f"{azure_path}/bronze/{data_source}"
+        version = write_delta_table(dataset, table_path, storage_options, mode="append")
+        record_delta_version(version)
         logging.info("Dataset has been inserted into bronze layer")
+        return version
     except Exception as e:
         logging.error(f"An error occured: {str(e)}")
         raise
 
 
-def add_season_column(football_dataframe: pl.DataFrame, season: str) -> pl.DataFrame:
+def add_season_column(football_dataframe: 'pl.DataFrame', season: str) -> 'pl.DataFrame':
     """
     Add season column to the staging dataframe.
 
@@ -97,7 +63,7 @@ def add_season_column(football_dataframe: pl.DataFrame, season: str) -> pl.DataF
     return df
 
 
-def add_load_date_column(football_dataframe: pl.DataFrame) -> pl.DataFrame:
+def add_load_date_column(football_dataframe: 'pl.DataFrame') -> 'pl.DataFrame':
     """
     Add timestamp column to the staging dataframe.
 
@@ -116,7 +82,32 @@ def add_load_date_column(football_dataframe: pl.DataFrame) -> pl.DataFrame:
     return df
 
 
-def detect_new_or_changed_rows(staging_df: pl.DataFrame, bronze_df: pl.DataFrame, data_source: str) -> pl.DataFrame:
+def fill_missing_columns(football_dataframe: 'pl.DataFrame', column_list: list) -> 'pl.DataFrame':
+    """
+    Add bronze columns missing in the staging dataframe, e.g. fields left out by a column profile at extraction.
+    The columns are filled with 'null', the value of null in staging.
+
+    Args:
+        football_dataframe (pl.DataFrame): The dataset to be append.
+        column_list (list): The list of column from bronze delta table.
+
+    Returns:
+        pl.DataFrame: Return dataframe with every bronze column.
+    """
+    missing_columns = [col_name for col_name in column_list if col_name not in football_dataframe.columns]
+    if not missing_columns:
+        return football_dataframe
+
+    df = football_dataframe.with_columns([
+        pl.lit("null").alias(col_name) for col_name in missing_columns
+    ])
+    logging.info(f"Filled {len(missing_columns)} columns missing in staging with null")
+
+    return df
+
+
+@instrument('transform')
+def detect_new_or_changed_rows(staging_df: 'pl.DataFrame', bronze_df: 'pl.DataFrame', data_source: str) -> 'pl.DataFrame':
     """
     Compare new or changed rows between staging against bronze dataframe.
 
@@ -201,23 +192,23 @@ def compare_columns(delta_table_column_list: list, staging_column_list: list, da
         missing_in_staging = bronze_set - staging_set
         missing_in_bronze = staging_set - bronze_set
         if missing_in_staging:
-            logging.error(f"Columns missing in staging: {missing_in_staging} for {data_source}. Need to add custom columns in ignore_columns dictionary")
-            return None
+            # Fields left out by a column profile of util.column_profiles, filled with 'null' by fill_missing_columns
+            logging.warning(f"Columns missing in staging: {missing_in_staging} for {data_source}. They are filled with 'null' in bronze. Custom columns need to be added in ignore_columns dictionary")
         if missing_in_bronze:
             logging.error(f"Columns missing in bronze: {missing_in_bronze} for {data_source}. There is new column in staging table and data source.")
             return missing_in_bronze
 
 
-def read_delta_table(credential: str, layer: str, data_source: str, column_list: list, azure_path: str, **kwargs) -> pl.DataFrame:
+@instrument('read')
+def read_delta_table(storage, layer: str, data_source: str, column_list: list, **kwargs) -> 'pl.DataFrame':
     """
     Return dataset based on selected columns
 
     Args:
-        credential (str): The credential to access ADLS2.
+        storage: The storage backend from util.storage.
         layer (str): The layer of delta table to be accessed.
         data_source (str): The value of data source to be processed.
         column_list (list): The list of column names for column to be selected in dataset.
-        azure_path (str): The path of ADLS2 url
 
     Returns:
         pl.DataFrame: Return the selected dataframe.
@@ -226,22 +217,18 @@ def read_delta_table(credential: str, layer: str, data_source: str, column_list:
 
     if layer == "staging" and columns_to_remove:
         final_column_list = [col for col in column_list if col not in columns_to_remove]
-        delta_table_path = f"{azure_path}/{layer}/{data_source}"
-        logging.info(f"Reading {delta_table_path}")
-        dataset = pl.read_delta(delta_table_path, storage_options=credential)
-        logging.info(f"Reading data from delta table for {data_source} in {layer} layer")
-        selected_dataset = dataset.select(final_column_list)
     else:
-        delta_table_path = f"{azure_path}/{layer}/{data_source}"
-        logging.info(f"Reading {delta_table_path}")
-        dataset = pl.read_delta(delta_table_path, storage_options=credential)
-        logging.info(f"Reading data from delta table for {data_source} in {layer} layer")
-        selected_dataset = dataset.select(column_list)
+        final_column_list = column_list
+    delta_table_path = storage.table_uri(f"{layer}/{data_source}")
+    logging.info(f"Reading {delta_table_path}")
+    selected_dataset = read_delta_cached(storage, f"{layer}/{data_source}", columns=final_column_list)
+    logging.info(f"Reading data from delta table for {data_source} in {layer} layer")
 
     return selected_dataset
 
 
-def create_composite_key(football_dataframe: pl.DataFrame, data_source: str) -> pl.DataFrame:
+@instrument('transform')
+def create_composite_key(football_dataframe: 'pl.DataFrame', data_source: str) -> 'pl.DataFrame':
     """
     Add composite key in bronze dataframe
 
@@ -331,13 +318,59 @@ def remove_row(azure_path: str, date_to_delete: str, data_source: str, storage_o
         pl.DataFrame: Return the dataframe with deleted rows based on date.
     """
     table_path = f"{azure_path}/bronze/{data_source}"
-    dt = DeltaTable(table_path, storage_options=storage_options)
+    dt = deltalake.DeltaTable(table_path, storage_options=storage_options)
     predicate = f"ingest_date = '{date_to_delete}'"
     deleted_rows_info = dt.delete(predicate=predicate)
     num_deleted_rows = deleted_rows_info['num_deleted_rows']
     logging.info(f"Removing {num_deleted_rows} rows from bronze polars dataframe for date {date_to_delete}")
 
 
+def load_staging_to_bronze(data_source: str, file_date: str, storage, staging_df: 'pl.DataFrame' = None) -> Tuple['pl.DataFrame', Optional[int]]:
+    """
+    Append new or changed rows from staging into bronze delta table.
+
+    Args:
+        data_source (str): The value of data source to be processed.
+        file_date (str): The value of date to be used to create season value.
+        storage: The storage backend from util.storage.
+        staging_df (pl.DataFrame): Staging dataset already in memory. Staging delta table is read when not supplied.
+
+    Returns:
+        Tuple[pl.DataFrame, Optional[int]]: Rows appended into bronze delta table and the bronze version of their
+        commit. Rows are empty and version is None if there is no new or changed row.
+    """
+    if staging_df is not None and staging_df.is_empty():
+        logging.info(f"No staging rows for {data_source} in this run. Nothing to be appended into bronze")
+        return staging_df, None
+
+    storage_options = storage.storage_options
+    azure_path = storage.root_uri
+    season = create_season_value(file_date)
+    bronze_column_list = get_delta_table_column_list(storage_options, 'bronze', data_source, azure_path)
+    if staging_df is None:
+        staging_column_list = get_delta_table_column_list(storage_options, 'staging', data_source, azure_path)
+        column_difference = compare_columns(bronze_column_list, staging_column_list, data_source)
+        staging_df = read_delta_table(storage, 'staging', data_source, staging_column_list, columns_to_remove=column_difference)
+    else:
+        column_difference = compare_columns(bronze_column_list, staging_df.columns, data_source)
+        if column_difference:
+            staging_df = staging_df.drop(list(column_difference))
+    current_season_dataset_season_new = add_season_column(staging_df, season)
+    add_composite_key = create_composite_key(current_season_dataset_season_new, data_source)
+    current_season_dataset_new = fill_missing_columns(add_load_date_column(add_composite_key), bronze_column_list)
+    bronze_df = read_delta_table(storage, 'bronze', data_source, bronze_column_list)
+    new_data = detect_new_or_changed_rows(current_season_dataset_new, bronze_df, data_source)
+
+    bronze_version = None
+    if new_data.is_empty() == False:
+        logging.info("There is new data to be append")
+        bronze_version = write_raw_to_bronze(new_data, storage_options, azure_path, data_source)
+    else:
+        logging.info("No new data to be append")
+
+    return new_data, bronze_version
+
+
 def check_data_source(data_source: list, data_source_name: str) -> None:
     """
     Check input value of data source
@@ -356,6 +389,7 @@ def check_data_source(data_source: list, data_source_name: str) -> None:
 
 
 
+@profile_invocation
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Python HTTP trigger function processed a request.")
 
@@ -374,33 +408,14 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     try:
-        # Get ADLS credential details
-        container_name = os.getenv("StorageAccountContainer")
-        adls_url_v2 = os.getenv("DataLakeUrllll")
-        StorageAccountName = os.getenv("StorageAccountName")
-        azure_path = f"abfss://{container_name}@{StorageAccountName}.dfs.core.windows.net"
-        password = create_storage_options(os.getenv('KeyVault'))
-
         data_source_list = ['current_season_history', 'player_metadata', 'team_metadata', 'position_metadata']
         check_data_source(data_source_list, data_source_type)
 
-        season = create_season_value(file_date)
-        staging_column_list = get_delta_table_column_list(password, 'staging', data_source_type, azure_path)
-        bronze_column_list = get_delta_table_column_list(password, 'bronze', data_source_type, azure_path)
-        column_difference = compare_columns(bronze_column_list, staging_column_list, data_source_type)
-        staging_df = read_delta_table(password, 'staging', data_source_type, staging_column_list, azure_path, columns_to_remove=column_difference)
-        current_season_dataset_season_new = add_season_column(staging_df, season)
-        add_composite_key = create_composite_key(current_season_dataset_season_new, data_source_type)
-        current_season_dataset_new = add_load_date_column(add_composite_key)
-        bronze_df = read_delta_table(password, 'bronze', data_source_type, bronze_column_list, azure_path)
-        new_data = detect_new_or_changed_rows(current_season_dataset_new, bronze_df, data_source_type)
+        new_data, _ = load_staging_to_bronze(data_source_type, file_date, get_storage())
 
         if new_data.is_empty() == False:
-            logging.info("There is new data to be append")
-            write_raw_to_bronze(new_data, password, container_name, adls_url_v2, data_source_type)
             return func.HttpResponse(f"Data has been uploaded into bronze layer for data source {data_source_type}", status_code=200)
         else:
-            logging.info("No new data to be append")
             return func.HttpResponse(f"No data has need to be uploaded into bronze layer for data source {data_source_type}", status_code=200)
         
     
@@ -0,0 +1,372 @@
+import os
+import json
+import logging
+from io import BytesIO
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import azure.functions as func
+from typing import Any, Dict, List, Optional
+from util.common_func import convert_timestamp_to_myt_date, create_season_value
+from util.compression import compress, decompress, get_content_encoding, get_landing_file_name
+from util.instrumentation import instrument, record_metrics, record_delta_version
+from util.delta_writer import write_delta_table
+from util.extractor import fetch_endpoints, parse_file_date
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from util.async_storage import read_many
+from util.fixture_cache import CACHE_FOLDER, get_cache_path
+from util.lazy_import import lazy_import
+from util.silver_encoding import align_silver_table, convert_silver_types
+from current_season_history_bronze_to_silver_4 import get_current_season_history_dtypes
+
+pl = lazy_import('polars')
+
+"""
+Bulk loader of previous seasons into season-partitioned bronze and silver delta tables.
+
+Sources:
+    history_past - season totals of every player from history_past of element-summary, which the daily extract
+                   leaves out. The raw rows are kept in landing as raw_fpl_history_past_<ingest_date>_<timestamp>.json.
+    archive      - current season history files in the archive folder. For every previous season the latest archived
+                   file is combined with the finished fixture cache of that season, which together hold every fixture.
+Tables:
+    history_past         - one row per player and season, key player_season_key = element_code-season.
+                           element_code is used because element IDs are given out again every season.
+    past_season_history  - one row per player and fixture, key player_current_season_history_key = element-season,
+                           the same key as current_season_history.
+Seasons are written as 2023/2024, the format of create_season_value, also for season_name 2023/24 of history_past.
+Bronze keeps every column as string. Both layers are partitioned by season and the loaded seasons are overwritten,
+so a season can be reloaded without duplicates. Player summaries are fetched concurrently by util.extractor, archived files are read
+in parallel and both sources are loaded into their tables at the same time.
+"""
+
+SOURCES = ['history_past', 'archive']
+HISTORY_PAST_PREFIX = 'raw_fpl_history_past_'
+ARCHIVED_HISTORY_PREFIX = 'raw_fpl_current_season_history_'
+DEFAULT_WORKERS = 8
+
+
+def create_season_from_name(season_name: 'pl.Expr') -> 'pl.Expr':
+    """
+    Convert season name of history_past into the season format of create_season_value, e.g. 2023/24 into 2023/2024.
+    """
+    start_year = season_name.str.slice(0, 4).cast(pl.Int64)
+    return pl.concat_str([start_year, start_year + 1], separator="/")
+
+
+def get_history_past_dtypes():
+    return {
+        'element': pl.Int64,
+        'element_code': pl.Int64,
+        'start_cost': pl.Int64,
+        'end_cost': pl.Int64,
+        'total_points': pl.Int64,
+        'minutes': pl.Int64,
+        'goals_scored': pl.Int64,
+        'assists': pl.Int64,
+        'clean_sheets': pl.Int64,
+        'goals_conceded': pl.Int64,
+        'own_goals': pl.Int64,
+        'penalties_saved': pl.Int64,
+        'penalties_missed': pl.Int64,
+        'yellow_cards': pl.Int64,
+        'red_cards': pl.Int64,
+        'saves': pl.Int64,
+        'bonus': pl.Int64,
+        'bps': pl.Int64,
+        'influence': pl.Float64,
+        'creativity': pl.Float64,
+        'threat': pl.Float64,
+        'ict_index': pl.Float64,
+        'starts': pl.Int64,
+        'expected_goals': pl.Float64,
+        'expected_assists': pl.Float64,
+        'expected_goal_involvements': pl.Float64,
+        'expected_goals_conceded': pl.Float64
+    }
+
+
+def fetch_history_past(player_ids: List[int], workers: int) -> List[Dict[str, Any]]:
+    """
+    Fetches history_past of every player from element-summary endpoint concurrently.
+
+    Args:
+        player_ids (List[int]): The player IDs.
+        workers (int): Number of API calls in flight.
+
+    Returns:
+        List[Dict[str, Any]]: Season rows of all players with the element of the player added.
+    """
+    rows_by_source = fetch_endpoints(['element_summary'], ids={'element_summary': player_ids}, data_sources=['history_past'], workers=workers)
+    logging.info(f"History past of {len(player_ids)} players has been extracted")
+
+    return rows_by_source['history_past']
+
+
+def extract_history_past(ingest_date: str, storage, workers: int) -> 'pl.DataFrame':
+    """
+    Extracts history_past of every player of bootstrap-static and keeps the raw rows in landing.
+
+    Args:
+        ingest_date (str): The ingest date to be used in the file name.
+        storage: The storage backend from util.storage.
+        workers (int): Number of API calls in flight.
+
+    Returns:
+        pl.DataFrame: Season rows as strings with season column.
+    """
+    # Players are fetched from the API, landing files are moved to the archive after every pipeline run
+    player_metadata = fetch_endpoints(['bootstrap_static'], data_sources=['player_metadata']).get('player_metadata')
+    if not player_metadata:
+        error_msg = "No players extracted from bootstrap-static API"
+        logging.error(error_msg)
+        raise ValueError(error_msg)
+
+    history_past = fetch_history_past([player["id"] for player in player_metadata], workers)
+    file_name = get_landing_file_name(f"{HISTORY_PAST_PREFIX}{ingest_date}_{convert_timestamp_to_myt_date()}.json")
+    landing_content = compress("".join(json.dumps(row) + '\n' for row in history_past).encode())
+    storage.write_bytes(f"landing/{file_name}", landing_content, content_encoding=get_content_encoding())
+    logging.info(f"History past data has been uploaded to landing/{file_name}")
+
+    if not history_past:
+        return pl.DataFrame()
+
+    dataset = pl.DataFrame(history_past, infer_schema_length=None)
+    return cast_to_string(dataset).with_columns(
+        create_season_from_name(pl.col("season_name")).alias("season")
+    )
+
+
+def find_archived_season_files(storage, current_season: str) -> Dict[str, str]:
+    """
+    Finds the latest archived current season history file of every previous season. Files without a valid
+    ddMMyyyy date are skipped.
+
+    Args:
+        storage: The storage backend from util.storage.
+        current_season (str): Season of the ingest date, which is loaded by the daily pipeline and skipped here.
+
+    Returns:
+        Dict[str, str]: Path of the latest archived file keyed by season.
+    """
+    latest_files = {}
+    for path in storage.list('archive'):
+        if not os.path.basename(path).startswith(ARCHIVED_HISTORY_PREFIX):
+            continue
+        file_date = parse_file_date(path, ARCHIVED_HISTORY_PREFIX)
+        if file_date is None:
+            continue
+        season = create_season_value(file_date.strftime('%d%m%Y'))
+        if season == current_season:
+            continue
+        # File dates are ddMMyyyy, so they are compared as dates
+        sort_key = (file_date, path)
+        if season not in latest_files or sort_key > latest_files[season][0]:
+            latest_files[season] = (sort_key, path)
+
+    for season, (_, path) in sorted(latest_files.items()):
+        logging.info(f"Latest archived file of season {season} - {path}")
+    return {season: path for season, (_, path) in latest_files.items()}
+
+
+@instrument('read')
+def read_archived_season_history(storage, season_files: Dict[str, str]) -> 'pl.DataFrame':
+    """
+    Reads the latest archived file and the finished fixture cache of every season in parallel.
+    Rows of the archived file replace rows of the same element and fixture in the cache.
+
+    Args:
+        storage: The storage backend from util.storage.
+        season_files (Dict[str, str]): Path of the latest archived file keyed by season.
+
+    Returns:
+        pl.DataFrame: Fixture rows as strings with season column.
+    """
+    cache_paths = set(storage.list(CACHE_FOLDER))
+    # Cache rows come first, so the archived rows are kept when an element and fixture are in both
+    sources = [(season, get_cache_path(season)) for season in sorted(season_files) if get_cache_path(season) in cache_paths]
+    sources += [(season, season_files[season]) for season in sorted(season_files)]
+
+    contents = read_many(storage, [path for _, path in sources])
+    record_metrics(bytes=sum(len(content) for content in contents))
+
+    frames = []
+    for (season, path), content in zip(sources, contents):
+        content = decompress(content)
+        if not content.strip():
+            continue
+        frames.append(cast_to_string(pl.read_ndjson(BytesIO(content), infer_schema_length=None)).with_columns(pl.lit(season).alias("season")))
+        logging.info(f"Read {path} for season {season}")
+
+    if not frames:
+        return pl.DataFrame()
+
+    return pl.concat(frames, how="diagonal").unique(subset=["element", "fixture", "season"], keep="last", maintain_order=True)
+
+
+def cast_to_string(dataset: 'pl.DataFrame') -> 'pl.DataFrame':
+    # Columns were added to the API over the seasons and some change type, bronze keeps them as strings
+    return dataset.with_columns(pl.all().cast(pl.String))
+
+
+def add_bronze_columns(dataset: 'pl.DataFrame', ingest_date: str, data_source: str) -> 'pl.DataFrame':
+    """
+    Add composite key, ingest date and created timestamp to rows to be written into bronze.
+
+    Args:
+        dataset (pl.DataFrame): Rows as strings with season column.
+        ingest_date (str): The ingest date of the run.
+        data_source (str): Either history_past or past_season_history.
+
+    Returns:
+        pl.DataFrame: Rows to be written into bronze.
+    """
+    if data_source == 'history_past':
+        key = pl.concat_str([pl.col("element_code"), pl.col("season")], separator="-").alias("player_season_key")
+    else:
+        key = pl.concat_str([pl.col("element"), pl.col("season")], separator="-").alias("player_current_season_history_key")
+
+    return dataset.with_columns([
+        key,
+        pl.lit(ingest_date).alias("ingest_date"),
+        pl.lit(convert_timestamp_to_myt_date()).alias("created_timestamp")
+    ])
+
+
+def convert_to_silver(dataset: 'pl.DataFrame', dtype_mapping: dict, data_source: str) -> 'pl.DataFrame':
+    """
+    Convert column datatypes of bronze rows. Columns that do not exist in older seasons are added as null.
+
+    Args:
+        dataset (pl.DataFrame): Bronze rows.
+        dtype_mapping (dict): Datatype keyed by column name.
+        data_source (str): Either history_past or past_season_history.
+
+    Returns:
+        pl.DataFrame: Rows to be written into silver.
+    """
+    return convert_silver_types(dataset.with_columns([
+        (pl.col(col_name).replace("null", None) if col_name in dataset.columns else pl.lit(None, dtype=pl.String)).cast(dtype, strict=False).alias(col_name)
+        for col_name, dtype in dtype_mapping.items()
+    ] + [
+        pl.lit(datetime.now()).cast(pl.Datetime("us")).alias('row_inserted_timestamp')
+    ]), data_source)
+
+
+@instrument('write', dataset_arg='dataset')
+def write_season_partitions(dataset: 'pl.DataFrame', storage, layer: str, data_source: str) -> None:
+    """
+    Overwrite the seasons in dataset in a delta table partitioned by season. Other seasons are not changed.
+
+    Args:
+        dataset (pl.DataFrame): Rows with season column.
+        storage: The storage backend from util.storage.
+        layer (str): Either bronze or silver.
+        data_source (str): Either history_past or past_season_history.
+    """
+    table_path = storage.table_uri(f"{layer}/{data_source}")
+    seasons = dataset.get_column("season").unique().sort().to_list()
+    predicate = "season IN (" + ", ".join(f"'{season}'" for season in seasons) + ")"
+    version = write_delta_table(
+        dataset,
+        table_path,
+        storage.storage_options,
+        mode="overwrite",
+        delta_write_options={
+            "partition_by": ["season"],
+            "predicate": predicate,
+            "schema_mode": "merge"
+        }
+    )
+    record_delta_version(version)
+    logging.info(f"Seasons {seasons} of {data_source} have been written into {layer} layer")
+
+
+def load_seasons(dataset: 'pl.DataFrame', ingest_date: str, storage, data_source: str, dtype_mapping: dict) -> Dict[str, int]:
+    """
+    Load rows of previous seasons into bronze and silver.
+
+    Returns:
+        Dict[str, int]: Number of rows loaded per season.
+    """
+    if dataset.is_empty():
+        logging.info(f"No rows of previous seasons for {data_source}")
+        return {}
+
+    bronze_dataset = add_bronze_columns(dataset, ingest_date, data_source)
+    write_season_partitions(bronze_dataset, storage, 'bronze', data_source)
+    align_silver_table(storage.table_uri(f"silver/{data_source}"), storage.storage_options, data_source)
+    write_season_partitions(convert_to_silver(bronze_dataset, dtype_mapping, data_source), storage, 'silver', data_source)
+
+    return dict(bronze_dataset.group_by("season").len().sort("season").iter_rows())
+
+
+def load_historical_seasons(ingest_date: str, storage, sources: Optional[List[str]] = None, seasons: Optional[List[str]] = None, workers: int = DEFAULT_WORKERS) -> Dict[str, Dict[str, int]]:
+    """
+    Extract previous seasons from history_past and the archive folder and load them into bronze and silver.
+
+    Args:
+        ingest_date (str): The ingest date of the run. Seasons before the season of this date are loaded.
+        storage: The storage backend from util.storage.
+        sources (Optional[List[str]]): Either history_past or archive or both. Both are loaded when not supplied.
+        seasons (Optional[List[str]]): Seasons to be loaded, e.g. ["2022/2023"]. Every season found is loaded when not supplied.
+        workers (int): Number of API calls in flight.
+
+    Returns:
+        Dict[str, Dict[str, int]]: Number of rows loaded per season keyed by table.
+    """
+    sources = sources or SOURCES
+    unknown_sources = [source for source in sources if source not in SOURCES]
+    if unknown_sources:
+        error_msg = f"Source - '{unknown_sources}' does not exists. Input could be either history_past or archive"
+        logging.error(error_msg)
+        raise ValueError(error_msg)
+
+    def load_history_past() -> Dict[str, int]:
+        dataset = extract_history_past(ingest_date, storage, workers)
+        if seasons and not dataset.is_empty():
+            dataset = dataset.filter(pl.col("season").is_in(seasons))
+        return load_seasons(dataset, ingest_date, storage, 'history_past', get_history_past_dtypes())
+
+    def load_archive() -> Dict[str, int]:
+        season_files = find_archived_season_files(storage, create_season_value(ingest_date))
+        if seasons:
+            season_files = {season: path for season, path in season_files.items() if season in seasons}
+        dataset = read_archived_season_history(storage, season_files) if season_files else pl.DataFrame()
+        return load_seasons(dataset, ingest_date, storage, 'past_season_history', get_current_season_history_dtypes())
+
+    loaders = {'history_past': load_history_past, 'archive': load_archive}
+    tables = {'history_past': 'history_past', 'archive': 'past_season_history'}
+    # Sources write into different tables, so they are loaded at the same time
+    with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        futures = {source: executor.submit(loaders[source]) for source in sources}
+        return {tables[source]: future.result() for source, future in futures.items()}
+
+
+@profile_invocation
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Python HTTP trigger function processed a request.")
+
+    ingest_date = req.params.get('ingest_date')
+    if not ingest_date:
+        return func.HttpResponse(
+            "No parameter supplied. Please provide a 'ingest_date' parameter. Date format should be ddMMyyyy",
+            status_code=400
+        )
+
+    try:
+        sources = req.params.get('sources')
+        seasons = req.params.get('seasons')
+        workers = int(req.params.get('workers') or os.getenv("HistoricalLoadWorkers") or DEFAULT_WORKERS)
+
+        loaded_rows = load_historical_seasons(
+            ingest_date,
+            get_storage(),
+            sources=sources.split(',') if sources else None,
+            seasons=seasons.split(',') if seasons else None,
+            workers=workers
+        )
+        return func.HttpResponse(json.dumps(loaded_rows), status_code=200, mimetype="application/json")
+    except Exception as e:
+        logging.error(f"An error occured: {str(e)}")
+        return func.HttpResponse(f"An error occured: {str(e)}", status_code=500)
@@ -1,25 +1,26 @@
-import os
-import pandas as pd
-from azure.storage.filedatalake import DataLakeServiceClient
 import azure.functions as func
 from io import BytesIO
 import logging
-from deltalake import write_deltalake
-from azure.identity import DefaultAzureCredential
-import pyarrow as pa
-from util.common_func import convert_timestamp_to_myt_date, create_storage_options
-import polars as pl
+import json
+from util.common_func import convert_timestamp_to_myt_date
+from util.compression import decompress
+from util.instrumentation import instrument, record_delta_version
+from util.delta_writer import write_delta_table
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from util.lazy_import import lazy_import
 from datetime import datetime
 
+pl = lazy_import('polars')
 
-def list_directory_contents(service_client: DataLakeServiceClient, container_name: str, directory_name: str, data_source: str, file_date: str) -> str:
+
+def list_directory_contents(storage, directory_name: str, data_source: str, file_date: str) -> str:
     """
     Return a list containing file name based on the data source in landing folder
 
     Args:
-        service_client (str): The credential to access ADLS2.
-        container_name (str): The container storing the source files.
-        directory_name (str): The path of source files in ADLS.
+        storage: The storage backend from util.storage.
+        directory_name (str): The path of source files in storage.
         data_source (str): Data source type to be processed.
         file_date (str): File date to be processed
 
@@ -27,11 +28,10 @@ def list_directory_contents(service_client: DataLakeServiceClient, container_nam
         str: Source file name.
     """
     file_list = []
-    file_system_client = service_client.get_file_system_client(container_name)
-    paths = file_system_client.get_paths(path=directory_name)
+    paths = storage.list(directory_name)
 
     for path in paths:
-        file_name = path.name.removeprefix("landing/")
+        file_name = path.removeprefix("landing/")
         if data_source in file_name:
             file_list.append(file_name)
     
@@ -57,26 +57,32 @@ def list_directory_contents(service_client: DataLakeServiceClient, container_nam
         raise Exception(error_message)
 
 
-def read_file_from_adls_using_polars(credential: str, landing_file_name: str, adls_path: str) -> pl.DataFrame:
+@instrument('read')
+def read_file_from_adls_using_polars(storage, landing_file_name: str) -> 'pl.DataFrame':
     """
     Return dataframe based on data type source stored in json
 
     Args:
-        credential (str): The credential to access ADLS2.
+        storage: The storage backend from util.storage.
         landing_file_name (str): The source file name in landing folder.
-        adls_path (str): The adls2 path.
     Returns:
         pl.DataFrame: Dataset source read from landing folder.
     """
-    landing_source_file_path = f"{adls_path}/landing/{landing_file_name}"
-    df = pl.read_ndjson(landing_source_file_path, storage_options=credential)
+    # Landing files are compressed with gzip or zstd, or uncompressed when written before compression was enabled
+    landing_content = decompress(storage.read_bytes(f"landing/{landing_file_name}"))
+    if not landing_content.strip():
+        # Landing file of current season history is empty when every fixture is already in the finished fixture cache
+        logging.info(f"File {landing_file_name} has no rows")
+        return pl.DataFrame()
+    df = pl.read_ndjson(BytesIO(landing_content))
 
     logging.info(f"Data from file {landing_file_name} can be read and stored in a dataframe")
 
     return df
 
 
-def write_raw_to_landing(dataset: pl.DataFrame, storage_options: str, adls_path: str, data_source: str) -> None:
+@instrument('write', dataset_arg='dataset')
+def write_raw_to_landing(dataset: 'pl.DataFrame', storage_options: str, adls_path: str, data_source: str) -> None:
     """
     Insert dataframe into staging delta table
 
@@ -87,14 +93,16 @@ def write_raw_to_landing(dataset: pl.DataFrame, storage_options: str, adls_path:
         data_source (str): Data source type to be processed.
     """
     try:
-        dataset.write_delta(
+        version = write_delta_table(
+            dataset,
             f"{adls_path}/staging/{data_source}",
+            storage_options,
             mode="overwrite",
             delta_write_options={
                 "schema_mode": "overwrite"
-                },
-            storage_options=storage_options
+                }
         )
+        record_delta_version(version)
         logging.info(f"Dataset for {data_source} has been inserted into staging delta table")
     except Exception as e:
         error_msg = f"An error occured: {str(e)}"
@@ -102,7 +110,7 @@ def write_raw_to_landing(dataset: pl.DataFrame, storage_options: str, adls_path:
         raise (error_msg)
 
 
-def add_load_date_column(football_dataframe: pl.DataFrame, ingest_date: str) -> pl.DataFrame:
+def add_load_date_column(football_dataframe: 'pl.DataFrame', ingest_date: str) -> 'pl.DataFrame':
     """
     Return dataframe with addition column of ingest date and created timestamp
 
@@ -122,7 +130,8 @@ def add_load_date_column(football_dataframe: pl.DataFrame, ingest_date: str) ->
     return df
 
 
-def handle_inconsistent_null_value_columns(df: pl.DataFrame) -> pl.DataFrame:
+@instrument('transform')
+def handle_inconsistent_null_value_columns(df: 'pl.DataFrame') -> 'pl.DataFrame':
     """
     Cast all columns to string data type and fill in null
 
@@ -144,6 +153,55 @@ def handle_inconsistent_null_value_columns(df: pl.DataFrame) -> pl.DataFrame:
     return df
 
 
+@instrument('read')
+def read_landing_rows_using_polars(landing_rows: list) -> 'pl.DataFrame':
+    """
+    Return dataframe from rows that have just been extracted and are still in memory.
+    Rows are serialized to JSON lines, so data types are inferred the same way as reading the landing file.
+
+    Args:
+        landing_rows (list): The rows written to the landing file.
+    Returns:
+        pl.DataFrame: Dataset source read from memory.
+    """
+    if not landing_rows:
+        logging.info(f"No rows in memory")
+        return pl.DataFrame()
+    json_lines = "\n".join(json.dumps(row) for row in landing_rows).encode()
+    df = pl.read_ndjson(BytesIO(json_lines))
+
+    logging.info(f"Data from memory can be read and stored in a dataframe")
+
+    return df
+
+
+def load_landing_to_staging(data_source_type: str, file_date: str, storage, landing_rows: list = None) -> 'pl.DataFrame':
+    """
+    Load landing data of a data source into staging delta table
+
+    Args:
+        data_source_type (str): Data source type to be processed.
+        file_date (str): File date to be processed.
+        storage: The storage backend from util.storage.
+        landing_rows (list): Rows of the landing file that are already in memory.
+    Returns:
+        pl.DataFrame: Dataset inserted into staging delta table.
+    """
+    if landing_rows is None:
+        landing_file_name = list_directory_contents(storage, 'landing/', data_source_type, file_date)
+        landing_df = read_file_from_adls_using_polars(storage, landing_file_name)
+    else:
+        landing_df = read_landing_rows_using_polars(landing_rows)
+    if landing_df.is_empty():
+        logging.info(f"No new rows for {data_source_type} in landing. Staging delta table is not changed")
+        return landing_df
+    current_season_dataset_new = add_load_date_column(landing_df, file_date)
+    landing_data_to_load = handle_inconsistent_null_value_columns(current_season_dataset_new)
+    write_raw_to_landing(landing_data_to_load, storage.storage_options, storage.root_uri, data_source_type)
+
+    return landing_data_to_load
+
+
 def check_data_source(data_source: list, data_source_name: str) -> None:
     """
     Check input value of data source
@@ -160,6 +218,7 @@ def check_data_source(data_source: list, data_source_name: str) -> None:
         raise ValueError(error_msg)
 
 
+@profile_invocation
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Python HTTP trigger function processed a request.")
 
@@ -180,21 +239,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
         data_source_list = ['current_season_history', 'player_metadata', 'team_metadata', 'position_metadata']
         check_data_source(data_source_list, data_source_type)
-
-        default_credential = DefaultAzureCredential()
-        StorageAccountName = os.getenv("StorageAccountName")
-        container_name = os.getenv("StorageAccountContainer")
-        adls_url_v2 = os.getenv("DataLakeUrllll")
-        password = create_storage_options(os.getenv('KeyVault'))
-
-        azure_path = f"abfss://{container_name}@{StorageAccountName}.dfs.core.windows.net"
-
-        service_client = DataLakeServiceClient(account_url=adls_url_v2, credential=default_credential)
-        landing_file_name = list_directory_contents(service_client, container_name,'landing/', data_source_type, file_date)
-        landing_df = read_file_from_adls_using_polars(password, landing_file_name, azure_path)
-        current_season_dataset_new = add_load_date_column(landing_df, file_date)
-        landing_data_to_load = handle_inconsistent_null_value_columns(current_season_dataset_new)
-        write_raw_to_landing(landing_data_to_load, password, azure_path, data_source_type)
+        load_landing_to_staging(data_source_type, file_date, get_storage())
     
         return func.HttpResponse(f"Data has been uploaded into staging table for data source {data_source_type}", status_code=200)
     
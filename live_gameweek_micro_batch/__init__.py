@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import logging
+from datetime import datetime, timezone
+import azure.functions as func
+from typing import Any, Dict, List, Optional
+from util.endpoint_registry import get_endpoint
+from util.extractor import fetch_endpoints, fetch_json, get_rate_limiter, get_session
+from util.instrumentation import instrument, record_metrics, record_delta_version, calculate_percentile
+from util.delta_writer import write_delta_table
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from util.lazy_import import lazy_import
+
+pl = lazy_import('polars')
+deltalake = lazy_import('deltalake')
+
+"""
+Live gameweek micro-batch mode, run during matches for near-real-time points.
+
+event/{gameweek}/live/ is polled every poll_seconds for duration_seconds. Every response is compared with the
+previous one in memory and only players whose stats have changed are kept. The previous stats of a run are seeded
+from the latest rows of the gameweek in bronze, so only the first run of a gameweek emits every player as the
+baseline. Changed rows are buffered and appended to bronze/live_event_stats, partitioned by event,
+at most once every commit_seconds, or earlier when max_batch_rows rows are buffered, so a match produces a few
+files per run instead of one file per poll. At the end of a run that has committed more than one batch, the files
+of the gameweek are compacted.
+
+Freshness latency of every row is the time from the start of the poll that saw the change to the commit of its
+batch. Its p50, p95 and max are recorded on the commit steps and logged with the run summary. Changes upstream are
+seen at most poll_seconds late, so max_staleness_ms = poll_seconds + max freshness latency.
+
+The function runs on a timer every 5 minutes and polls for LiveDurationSeconds. A run is skipped when no gameweek
+is in progress, i.e. the current gameweek of bootstrap-static has been data checked, unless LiveGameweek is set. The polling window is capped, so the last commit and the compaction finish before the
+functionTimeout of host.json.
+"""
+
+DATA_SOURCE = 'live_event_stats'
+DEFAULT_POLL_SECONDS = 30
+DEFAULT_COMMIT_SECONDS = 120
+DEFAULT_DURATION_SECONDS = 240
+# functionTimeout of host.json and the time kept for the last commit and the compaction after polling
+FUNCTION_TIMEOUT_SECONDS = 600
+COMMIT_RESERVE_SECONDS = 120
+DEFAULT_MAX_BATCH_ROWS = 20000
+# Columns of the live table that are not stats of the element
+LIVE_COLUMNS = ['event', 'element', 'fetched_timestamp', 'committed_timestamp']
+
+
+def get_live_gameweek() -> Optional[int]:
+    """
+    Find the gameweek in progress in events of bootstrap-static. None if the current gameweek has been data checked
+    or there is no current gameweek.
+    """
+    events = fetch_endpoints(['bootstrap_static'], data_sources=['events_metadata']).get('events_metadata', [])
+    live_events = [event['id'] for event in events if event.get('is_current') and not event.get('data_checked')]
+    return live_events[0] if live_events else None
+
+
+def hash_stats(stats: Dict[str, Any]) -> str:
+    """
+    Hash the stats of an element. Null stats are left out, so a stat column added to the live table later
+    does not change the hash of rows written before it.
+    """
+    return json.dumps({key: value for key, value in stats.items() if value is not None}, sort_keys=True, default=str)
+
+
+class LiveMicroBatch:
+    """
+    Diff live responses of one gameweek against the previous response and commit changed rows in micro-batches.
+
+    Args:
+        gameweek (int): The gameweek polled.
+        table_path (str): The path of the bronze live delta table.
+        storage_options (dict): Credentials to access ADLS2.
+        commit_seconds (float): Minimum time between two commits.
+        max_batch_rows (int): Number of buffered rows that triggers a commit before commit_seconds.
+    """
+
+    def __init__(self, gameweek: int, table_path: str, storage_options: dict, commit_seconds: float, max_batch_rows: int):
+        self.gameweek = gameweek
+        self.table_path = table_path
+        self.storage_options = storage_options
+        self.commit_seconds = commit_seconds
+        self.max_batch_rows = max_batch_rows
+        self.previous_stats: Dict[int, str] = {}
+        self.buffer: List[Dict[str, Any]] = []
+        self.last_commit_time = time.monotonic()
+        self.latencies_ms: List[float] = []
+        self.polls = 0
+        self.commits = 0
+        self.committed_rows = 0
+
+    def diff(self, response: Dict[str, Any], fetched_at: datetime) -> List[Dict[str, Any]]:
+        """
+        Return rows of players whose stats differ from the previous response, and keep the response as the previous one.
+        """
+        changed_rows = []
+        for element in response.get('elements', []):
+            stats = element.get('stats', {})
+            stats_hash = hash_stats(stats)
+            if self.previous_stats.get(element['id']) == stats_hash:
+                continue
+            self.previous_stats[element['id']] = stats_hash
+            changed_rows.append({'event': self.gameweek, 'element': element['id'], **stats, 'fetched_timestamp': fetched_at})
+        return changed_rows
+
+    @instrument('read')
+    def load_previous_stats(self) -> int:
+        """
+        Seed the previous stats with the latest committed row of every element of the gameweek, so a run only
+        commits elements whose stats have changed since the last commit of an earlier run.
+
+        Returns:
+            int: Number of elements seeded.
+        """
+        try:
+            deltalake.DeltaTable(self.table_path, storage_options=self.storage_options)
+        except deltalake.exceptions.TableNotFoundError:
+            logging.info(f"Live table {self.table_path} does not exist yet. Every element of gameweek {self.gameweek} is the baseline")
+            return 0
+
+        latest_rows = (
+            pl.scan_delta(self.table_path, storage_options=self.storage_options)
+            .filter(pl.col('event') == self.gameweek)
+            .sort(['committed_timestamp', 'fetched_timestamp'])
+            .unique(subset=['element'], keep='last')
+            .collect()
+        )
+        stats_columns = [column for column in latest_rows.columns if column not in LIVE_COLUMNS]
+        for row in latest_rows.iter_rows(named=True):
+            self.previous_stats[row['element']] = hash_stats({column: row[column] for column in stats_columns})
+        logging.info(f"Previous stats of {latest_rows.height} elements of gameweek {self.gameweek} have been read from {self.table_path}")
+        return latest_rows.height
+
+    def add(self, response: Dict[str, Any], fetched_at: datetime) -> int:
+        """
+        Buffer the changed rows of a response and commit when the buffer is due.
+
+        Returns:
+            int: Number of changed rows.
+        """
+        changed_rows = self.diff(response, fetched_at)
+        self.polls += 1
+        self.buffer.extend(changed_rows)
+        logging.info(f"Poll {self.polls} of gameweek {self.gameweek} has {len(changed_rows)} changed rows")
+        if self.is_commit_due():
+            self.commit()
+        return len(changed_rows)
+
+    def is_commit_due(self) -> bool:
+        if not self.buffer:
+            return False
+        return len(self.buffer) >= self.max_batch_rows or time.monotonic() - self.last_commit_time >= self.commit_seconds
+
+    @instrument('write')
+    def commit(self) -> Optional[int]:
+        """
+        Append the buffered rows to the bronze live table as one commit.
+
+        Returns:
+            Optional[int]: Number of rows committed. None if the buffer is empty.
+        """
+        self.last_commit_time = time.monotonic()
+        if not self.buffer:
+            return None
+
+        committed_at = datetime.now(timezone.utc)
+        latencies_ms = [(committed_at - row['fetched_timestamp']).total_seconds() * 1000 for row in self.buffer]
+        dataset = pl.DataFrame(self.buffer, infer_schema_length=None).with_columns([
+            pl.lit(committed_at).alias('committed_timestamp')
+        ])
+        version = write_delta_table(
+            dataset,
+            self.table_path,
+            self.storage_options,
+            mode="append",
+            delta_write_options={
+                "partition_by": ["event"],
+                "schema_mode": "merge"
+            }
+        )
+        record_delta_version(version)
+        record_metrics(
+            rows=len(self.buffer),
+            freshness_p50_ms=calculate_percentile(latencies_ms, 0.5),
+            freshness_p95_ms=calculate_percentile(latencies_ms, 0.95),
+            freshness_max_ms=calculate_percentile(latencies_ms, 1.0)
+        )
+        self.latencies_ms.extend(latencies_ms)
+        committed_rows = len(self.buffer)
+        self.commits += 1
+        self.committed_rows += committed_rows
+        self.buffer = []
+        logging.info(f"{committed_rows} live rows of gameweek {self.gameweek} have been committed into {self.table_path}")
+        return committed_rows
+
+    def compact(self) -> None:
+        """
+        Compact the files of the gameweek partition, written by the commits of this run.
+        """
+        if self.commits < 2:
+            return
+        delta_table = deltalake.DeltaTable(self.table_path, storage_options=self.storage_options)
+        result = delta_table.optimize.compact(partition_filters=[("event", "=", str(self.gameweek))])
+        logging.info(f"Gameweek {self.gameweek} partition has been compacted: {result.get('numFilesRemoved')} files into {result.get('numFilesAdded')}")
+
+    def summary(self, poll_seconds: float) -> Dict[str, Any]:
+        max_latency_ms = calculate_percentile(self.latencies_ms, 1.0)
+        return {
+            'gameweek': self.gameweek,
+            'polls': self.polls,
+            'commits': self.commits,
+            'rows': self.committed_rows,
+            'freshness_p50_ms': calculate_percentile(self.latencies_ms, 0.5),
+            'freshness_p95_ms': calculate_percentile(self.latencies_ms, 0.95),
+            'freshness_max_ms': max_latency_ms,
+            'max_staleness_ms': None if max_latency_ms is None else round(poll_seconds * 1000 + max_latency_ms, 1)
+        }
+
+
+def run_live_micro_batch(storage, gameweek: int, poll_seconds: float, commit_seconds: float, duration_seconds: float, max_batch_rows: int) -> Dict[str, Any]:
+    """
+    Poll the live endpoint of a gameweek and commit changed rows until duration_seconds has passed.
+
+    Args:
+        storage: The storage backend from util.storage.
+        gameweek (int): The gameweek to be polled.
+        poll_seconds (float): Time between the start of two polls.
+        commit_seconds (float): Minimum time between two commits.
+        duration_seconds (float): Length of polling. It is capped to the function timeout less the commit reserve.
+        max_batch_rows (int): Number of buffered rows that triggers a commit before commit_seconds.
+
+    Returns:
+        Dict[str, Any]: Polls, commits, rows and freshness latency of the run.
+    """
+    endpoint = get_endpoint('event_live')
+    url = endpoint.create_url(gameweek)
+    session = get_session()
+    rate_limiter = get_rate_limiter(endpoint)
+    micro_batch = LiveMicroBatch(gameweek, storage.table_uri(f"bronze/{DATA_SOURCE}"), storage.storage_options, commit_seconds, max_batch_rows)
+    micro_batch.load_previous_stats()
+    if duration_seconds > FUNCTION_TIMEOUT_SECONDS - COMMIT_RESERVE_SECONDS:
+        logging.warning(f"Duration of {duration_seconds} seconds is capped to {FUNCTION_TIMEOUT_SECONDS - COMMIT_RESERVE_SECONDS} seconds to commit before the function timeout")
+        duration_seconds = FUNCTION_TIMEOUT_SECONDS - COMMIT_RESERVE_SECONDS
+
+    start_time = time.monotonic()
+    next_poll_time = start_time
+    while next_poll_time - start_time < duration_seconds:
+        time.sleep(max(next_poll_time - time.monotonic(), 0))
+        next_poll_time += poll_seconds
+
+        fetched_at = datetime.now(timezone.utc)
+        response, _ = fetch_json(session, url, rate_limiter)
+        if response is None:
+            continue
+        micro_batch.add(response, fetched_at)
+
+    if micro_batch.buffer:
+        micro_batch.commit()
+    micro_batch.compact()
+    summary = micro_batch.summary(poll_seconds)
+    logging.info(f"Live micro-batch run finished: {summary}")
+    return summary
+
+
+@profile_invocation
+def main(livetimer: func.TimerRequest) -> None:
+    if livetimer.past_due:
+        logging.warning("Live gameweek timer is past due")
+
+    storage = get_storage()
+    gameweek = os.getenv("LiveGameweek")
+    gameweek = int(gameweek) if gameweek else get_live_gameweek()
+    if gameweek is None:
+        logging.info("No gameweek in progress. Live micro-batch run is skipped")
+        return
+
+    summary = run_live_micro_batch(
+        storage,
+        gameweek,
+        poll_seconds=float(os.getenv("LivePollSeconds") or DEFAULT_POLL_SECONDS),
+        commit_seconds=float(os.getenv("LiveCommitSeconds") or DEFAULT_COMMIT_SECONDS),
+        duration_seconds=float(os.getenv("LiveDurationSeconds") or DEFAULT_DURATION_SECONDS),
+        max_batch_rows=int(os.getenv("LiveMaxBatchRows") or DEFAULT_MAX_BATCH_ROWS)
+    )
+    logging.info(f"Live micro-batch run of gameweek {gameweek}: {json.dumps(summary)}")
@@ -0,0 +1,295 @@
+import os
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+import azure.functions as func
+from util.pipeline import Stage, PipelineContext, run_pipeline, select_stages, summarize_results, DEFAULT_STAGE_RETRIES
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from util.data_quality import QUALITY_RULES
+from util.column_profiles import parse_column_profiles
+from util.extractor import fetch_endpoints
+from util.gameweek_scheduler import FULL_PLAN, METADATA_PLAN, NO_PLAN, create_run_plan, read_scheduler_state, write_scheduler_state
+from Extract_main_api_1 import extract_bootstrap_static
+from Extract_player_api_2 import extract_current_season_history
+from landing_to_staging_3 import load_landing_to_staging
+from current_season_history_landing_to_bronze_3 import load_staging_to_bronze
+from current_season_history_bronze_to_silver_4 import load_bronze_to_silver
+from cdz2_player_profile_5 import run_player_profile
+from player_form_silver_to_gold_5 import load_silver_to_gold, DEFAULT_FORM_WINDOW
+from Archive_file import archive_landing_files
+
+"""
+This code is to run the whole pipeline in one process, from API extraction to gold layer and archive.
+Rows extracted, loaded into staging and appended into bronze are handed over to the next stage in memory,
+while every layer is still persisted. The storage backend, its credentials and clients are shared by every stage.
+The HTTP function of each stage still works on its own and reads its input from storage.
+
+With mode=scheduled the stages are selected by the plan of util.gameweek_scheduler, so a run without new data does
+not spend compute. dry_run=true returns the plan and its stages without running them.
+"""
+
+METADATA_SOURCES = ['player_metadata', 'team_metadata', 'position_metadata']
+DATA_SOURCES = ['current_season_history'] + METADATA_SOURCES
+RUN_MODES = ['all', 'scheduled']
+
+# Stages selected by each plan of the scheduler. player_profile joins every metadata source of the ingest date,
+# so the metadata plan loads all of them. Landed files are archived, so landing never holds two files of a source.
+PLAN_SELECTIONS = {
+    FULL_PLAN: None,
+    METADATA_PLAN: ['extract_main', 'player_profile', 'archive'] + [
+        f"{stage_group}:{data_source}"
+        for stage_group in ['landing_to_staging', 'staging_to_bronze', 'bronze_to_silver']
+        for data_source in METADATA_SOURCES
+    ],
+    NO_PLAN: []
+}
+
+
+def get_landing_rows(context: PipelineContext, data_source: str) -> list:
+    """
+    Get rows extracted for a data source in this run.
+
+    Args:
+        context (PipelineContext): The pipeline context.
+        data_source (str): The value of data source to be processed.
+
+    Returns:
+        list: Extracted rows. Returns None if the extract stage has not been run in this process.
+    """
+    if data_source == 'current_season_history':
+        extract_output = context.get_output('extract_player_history')
+        return None if extract_output is None else extract_output[1]
+
+    extract_output = context.get_output('extract_main')
+    if extract_output is None or data_source not in extract_output:
+        return None
+    return extract_output[data_source][1]
+
+
+def extract_main(context: PipelineContext) -> dict:
+    column_profiles = parse_column_profiles(os.getenv("ExtractorColumnProfiles"))
+    landing_files = extract_bootstrap_static(
+        context.params['file_date'],
+        get_storage(),
+        column_profiles=column_profiles,
+        rows_by_source=context.params.get('bootstrap_rows')
+    )
+    if not landing_files:
+        raise ValueError("No data extracted from bootstrap-static API")
+    return landing_files
+
+
+def extract_player_history(context: PipelineContext) -> tuple:
+    return extract_current_season_history(
+        context.params['file_date'],
+        get_storage(),
+        player_metadata=get_landing_rows(context, 'player_metadata'),
+        events=get_landing_rows(context, 'events_metadata'),
+        use_cache=os.getenv("PlayerHistoryCacheEnabled", 'true').lower() == 'true'
+    )
+
+
+def create_landing_to_staging_stage(data_source: str) -> Stage:
+    def run(context: PipelineContext):
+        return load_landing_to_staging(
+            data_source,
+            context.params['file_date'],
+            get_storage(),
+            landing_rows=get_landing_rows(context, data_source)
+        )
+
+    extract_stage = 'extract_player_history' if data_source == 'current_season_history' else 'extract_main'
+    return Stage(name=f"landing_to_staging:{data_source}", run=run, depends_on=[extract_stage])
+
+
+def create_staging_to_bronze_stage(data_source: str) -> Stage:
+    def run(context: PipelineContext):
+        return load_staging_to_bronze(
+            data_source,
+            context.params['file_date'],
+            get_storage(),
+            staging_df=context.get_output(f"landing_to_staging:{data_source}")
+        )
+
+    return Stage(name=f"staging_to_bronze:{data_source}", run=run, depends_on=[f"landing_to_staging:{data_source}"])
+
+
+def get_bronze_rows(context: PipelineContext, data_source: str) -> Tuple[Any, Any]:
+    # Rows appended into bronze by this run and the bronze version of their commit
+    output = context.get_output(f"staging_to_bronze:{data_source}")
+    return output if output is not None else (None, None)
+
+
+def create_bronze_to_silver_stage(data_source: str) -> Stage:
+    def run(context: PipelineContext):
+        bronze_rows, bronze_rows_version = get_bronze_rows(context, data_source)
+        return load_bronze_to_silver(
+            data_source,
+            context.params['file_date'],
+            get_storage(),
+            execution_mode=os.getenv("SilverExecutionMode", "in_memory"),
+            bronze_rows=bronze_rows,
+            bronze_rows_version=bronze_rows_version
+        )
+
+    # Silver tables used by reference rules are loaded first, so rows are checked against the latest reference values
+    reference_tables = sorted({rule['reference_table'] for rule in QUALITY_RULES.get(data_source, []) if rule['type'] == 'reference'})
+    return Stage(
+        name=f"bronze_to_silver:{data_source}",
+        run=run,
+        depends_on=[f"staging_to_bronze:{data_source}"] + [f"bronze_to_silver:{reference_table}" for reference_table in reference_tables]
+    )
+
+
+def player_profile(context: PipelineContext):
+    # Bronze rows appended in this run are the rows of the ingest date. Empty output is read from storage
+    # because the rows of the ingest date might have been appended by a previous run.
+    source_frames = {}
+    for data_source in METADATA_SOURCES:
+        bronze_rows, _ = get_bronze_rows(context, data_source)
+        if bronze_rows is not None and not bronze_rows.is_empty():
+            source_frames[data_source] = bronze_rows
+
+    return run_player_profile(
+        context.params['file_date'],
+        get_storage(),
+        load_mode=os.getenv("PlayerProfileLoadMode", "snapshot"),
+        source_frames=source_frames
+    )
+
+
+def player_form(context: PipelineContext):
+    storage = get_storage()
+    return load_silver_to_gold(
+        context.params['file_date'],
+        storage.table_uri("silver/current_season_history"),
+        storage.table_uri("gold/player_form"),
+        int(os.getenv("PlayerFormWindow") or DEFAULT_FORM_WINDOW),
+        storage.storage_options
+    )
+
+
+def archive(context: PipelineContext) -> list:
+    return archive_landing_files(get_storage())
+
+
+def create_pipeline_stages() -> List[Stage]:
+    """
+    Create every stage of the pipeline and its dependencies.
+
+    Returns:
+        List[Stage]: Stages of the pipeline.
+    """
+    stages = [
+        Stage(name='extract_main', run=extract_main),
+        Stage(name='extract_player_history', run=extract_player_history, depends_on=['extract_main'])
+    ]
+    stages += [create_landing_to_staging_stage(data_source) for data_source in DATA_SOURCES]
+    stages += [create_staging_to_bronze_stage(data_source) for data_source in DATA_SOURCES]
+    stages += [create_bronze_to_silver_stage(data_source) for data_source in DATA_SOURCES]
+    stages += [
+        Stage(name='player_profile', run=player_profile, depends_on=[f"staging_to_bronze:{data_source}" for data_source in METADATA_SOURCES]),
+        Stage(name='player_form', run=player_form, depends_on=['bronze_to_silver:current_season_history']),
+        # Landing files are only archived once every data source has been loaded into staging
+        Stage(name='archive', run=archive, depends_on=[f"landing_to_staging:{data_source}" for data_source in DATA_SOURCES])
+    ]
+
+    return stages
+
+
+def plan_scheduled_run(storage) -> Tuple[Dict[str, Any], Dict[str, List[Dict[str, Any]]]]:
+    """
+    Fetch bootstrap-static and plan the stages of a scheduled run.
+
+    Args:
+        storage: The storage backend from util.storage.
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, List[Dict[str, Any]]]]: The plan with the names of its stages, and the rows of
+        bootstrap-static, which extract_main lands instead of calling the API again.
+    """
+    rows_by_source = fetch_endpoints(['bootstrap_static'])
+    if not rows_by_source.get('events_metadata'):
+        error_msg = "No events extracted from bootstrap-static API to plan the run"
+        logging.error(error_msg)
+        raise RuntimeError(error_msg)
+
+    run_plan = create_run_plan(rows_by_source['events_metadata'], rows_by_source.get('player_metadata', []), read_scheduler_state(storage))
+    selection = PLAN_SELECTIONS[run_plan['plan']]
+    run_plan['stages'] = [] if selection == [] else [stage.name for stage in select_stages(create_pipeline_stages(), selection)]
+
+    return run_plan, rows_by_source
+
+
+@profile_invocation
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Python HTTP trigger function processed a request.")
+
+    file_date = req.params.get('file_date')
+    stages = req.params.get('stages')
+    retries = req.params.get('retries') or os.getenv("PipelineStageRetries") or DEFAULT_STAGE_RETRIES
+    dry_run = req.params.get('dry_run', 'false').lower() == 'true'
+    mode = 'scheduled' if dry_run else req.params.get('mode') or os.getenv("PipelineRunMode", 'all')
+
+    if not file_date:
+        return func.HttpResponse(
+            "No parameter supplied. Please provide a 'file_date' based on the file to be ingested. Date format should be ddMMyyyy",
+            status_code=400
+        )
+
+    try:
+        datetime.strptime(file_date, '%d%m%Y')
+        retries = int(retries)
+    except ValueError:
+        return func.HttpResponse(
+            "Wrong parameter supplied. 'file_date' format should be ddMMyyyy and 'retries' should be a number",
+            status_code=400
+        )
+
+    if mode not in RUN_MODES:
+        return func.HttpResponse(
+            f"Wrong 'mode' parameter supplied. Input could be either {' or '.join(RUN_MODES)}",
+            status_code=400
+        )
+    elif mode == 'scheduled' and stages:
+        return func.HttpResponse(
+            "Parameter 'stages' cannot be supplied in scheduled mode. The stages are selected by the run plan",
+            status_code=400
+        )
+
+    selection = [stage.strip() for stage in stages.split(',') if stage.strip()] if stages else None
+    params = {'file_date': file_date}
+    run_plan = None
+
+    if mode == 'scheduled':
+        try:
+            run_plan, params['bootstrap_rows'] = plan_scheduled_run(get_storage())
+        except Exception as e:
+            return func.HttpResponse(f"An error occured: {str(e)}", status_code=500)
+
+        if dry_run:
+            return func.HttpResponse(json.dumps(run_plan), status_code=200, mimetype="application/json")
+        selection = PLAN_SELECTIONS[run_plan['plan']]
+
+    try:
+        context = PipelineContext(params)
+        results = [] if selection == [] else run_pipeline(create_pipeline_stages(), context, selection, retries)
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+    except Exception as e:
+        return func.HttpResponse(f"An error occured: {str(e)}", status_code=500)
+
+    summary = summarize_results(results)
+    if run_plan is not None:
+        summary['plan'] = run_plan
+        if summary['status'] == 'succeeded':
+            write_scheduler_state(get_storage(), run_plan)
+    logging.info(f"Pipeline run completed with status {summary['status']} in {summary['duration_ms']} ms")
+
+    return func.HttpResponse(
+        json.dumps(summary),
+        status_code=200 if summary['status'] == 'succeeded' else 500,
+        mimetype="application/json"
+    )
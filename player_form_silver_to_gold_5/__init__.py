@@ -0,0 +1,267 @@
+import os
+import logging
+from typing import Optional
+import azure.functions as func
+from util.common_func import convert_timestamp_to_myt_date, create_season_value
+from util.instrumentation import instrument, record_delta_version
+from util.delta_writer import write_delta_table
+from util.profiling import profile_invocation
+from util.storage import get_storage
+from util.lazy_import import lazy_import
+from util.silver_encoding import decode_categories, encode_categories
+
+pl = lazy_import('polars')
+deltalake = lazy_import('deltalake')
+
+"""
+This code is to maintain gold player form table from silver current season history table.
+Rolling metrics are calculated per player and gameweek, and only new gameweeks are recalculated on every run.
+"""
+
+DEFAULT_FORM_WINDOW = 5
+
+HISTORY_COLUMNS = ["element", "fixture", "round", "season", "total_points", "minutes", "expected_goals", "expected_assists", "bps", "row_inserted_timestamp"]
+
+
+def get_last_gold_round(gold_table_path: str, season: str, storage_options: dict) -> Optional[int]:
+    """
+    Get the latest gameweek that exists in gold player form table for a season.
+
+    Args:
+        gold_table_path (str): The path of gold delta table.
+        season (str): The season to be checked.
+        storage_options (dict): Credentials to access ADLS2.
+
+    Returns:
+        Optional[int]: The latest gameweek. Returns None if the table or the season does not exist yet.
+    """
+    try:
+        deltalake.DeltaTable(gold_table_path, storage_options=storage_options)
+    except deltalake.exceptions.TableNotFoundError:
+        logging.info(f"Gold table {gold_table_path} does not exist yet")
+        return None
+
+    last_round = (
+        pl.scan_delta(gold_table_path, storage_options=storage_options)
+        .filter(pl.col("season") == season)
+        .select(pl.col("round").max())
+        .collect()
+        .item()
+    )
+    logging.info(f"Latest gameweek in gold table for season {season} is {last_round}")
+
+    return last_round
+
+
+@instrument('read')
+def read_silver_history(silver_table_path: str, season: str, from_round: int, storage_options: dict) -> 'pl.DataFrame':
+    """
+    Read silver current season history rows for a season starting from a gameweek.
+
+    Args:
+        silver_table_path (str): The path of silver delta table.
+        season (str): The season to be read.
+        from_round (int): The first gameweek to be read.
+        storage_options (dict): Credentials to access ADLS2.
+
+    Returns:
+        pl.DataFrame: Current season history rows needed to calculate rolling metrics, season encoded as pl.Enum.
+    """
+    dataset = (
+        pl.scan_delta(silver_table_path, storage_options=storage_options)
+        .filter((pl.col("season") == season) & (pl.col("round") >= from_round))
+        .select(HISTORY_COLUMNS)
+        .collect()
+        .pipe(encode_categories)
+    )
+    logging.info(f"Read {dataset.height} rows from silver current_season_history for season {season} from gameweek {from_round}")
+
+    return dataset
+
+
+def deduplicate_fixture_rows(history_df: 'pl.DataFrame') -> 'pl.DataFrame':
+    """
+    Keep the latest row for each player and fixture. Silver keeps every changed version of a fixture row.
+
+    Args:
+        history_df (pl.DataFrame): Current season history rows.
+
+    Returns:
+        pl.DataFrame: One row per player and fixture.
+    """
+    return (
+        history_df
+        .sort("row_inserted_timestamp")
+        .unique(subset=["element", "fixture"], keep="last")
+    )
+
+
+def aggregate_player_gameweek(history_df: 'pl.DataFrame') -> 'pl.DataFrame':
+    """
+    Aggregate fixture rows into one row per player and gameweek. A player can play two fixtures in a double gameweek.
+
+    Args:
+        history_df (pl.DataFrame): One row per player and fixture.
+
+    Returns:
+        pl.DataFrame: One row per player and gameweek.
+    """
+    return (
+        history_df
+        .group_by(["season", "element", "round"])
+        .agg([
+            pl.len().alias("fixtures"),
+            pl.col("total_points").sum(),
+            pl.col("minutes").sum(),
+            pl.col("expected_goals").sum(),
+            pl.col("expected_assists").sum(),
+            pl.col("bps").sum()
+        ])
+        .sort(["element", "round"])
+    )
+
+
+@instrument('transform')
+def add_rolling_form_metrics(gameweek_df: 'pl.DataFrame', window: int) -> 'pl.DataFrame':
+    """
+    Add rolling metrics over the last N gameweeks for each player.
+    The window is based on gameweek number, so blank gameweeks count towards the window.
+
+    Args:
+        gameweek_df (pl.DataFrame): One row per player and gameweek, sorted by player and gameweek.
+        window (int): Number of gameweeks in the rolling window.
+
+    Returns:
+        pl.DataFrame: Dataframe with rolling metric columns.
+    """
+    window_size = f"{window}i"
+
+    def rolling_sum(column: str) -> 'pl.Expr':
+        return pl.col(column).rolling_sum_by("round", window_size=window_size, min_samples=1).over("element")
+
+    df = gameweek_df.with_columns([
+        rolling_sum("total_points").alias("points_last_n"),
+        rolling_sum("minutes").alias("minutes_last_n"),
+        rolling_sum("expected_goals").alias("expected_goals_last_n"),
+        rolling_sum("expected_assists").alias("expected_assists_last_n"),
+        rolling_sum("fixtures").alias("fixtures_last_n"),
+        pl.col("bps").rolling_mean_by("round", window_size=window_size, min_samples=1).over("element").alias("bps_avg_last_n")
+    ])
+
+    # bps_trend compares against the previous gameweek, which is missing when the player has no row in it
+    previous_bps = df.select([
+        pl.col("element"),
+        (pl.col("round") + 1).alias("round"),
+        pl.col("bps_avg_last_n").alias("previous_bps_avg_last_n")
+    ])
+    df = df.join(previous_bps, on=["element", "round"], how="left", maintain_order="left")
+
+    minutes_played = pl.when(pl.col("minutes_last_n") > 0).then(pl.col("minutes_last_n"))
+
+    df = df.with_columns([
+        (pl.col("expected_goals_last_n") / minutes_played * 90).alias("expected_goals_per_90_last_n"),
+        (pl.col("expected_assists_last_n") / minutes_played * 90).alias("expected_assists_per_90_last_n"),
+        (pl.col("bps_avg_last_n") - pl.col("previous_bps_avg_last_n")).alias("bps_trend"),
+        pl.lit(window).alias("form_window"),
+        pl.lit(convert_timestamp_to_myt_date()).alias("created_timestamp")
+    ]).drop("previous_bps_avg_last_n")
+
+    logging.info(f"Added rolling form metrics over {window} gameweeks")
+
+    return df
+
+
+@instrument('write', dataset_arg='dataset')
+def write_silver_to_gold(dataset: 'pl.DataFrame', gold_table_path: str, season: str, from_round: Optional[int], storage_options: dict) -> None:
+    """
+    Write player form rows to gold delta table partitioned by season.
+    Existing rows of the season from the first recalculated gameweek onwards are replaced.
+
+    Args:
+        dataset (pl.DataFrame): Player form rows to be written.
+        gold_table_path (str): The path of gold delta table.
+        season (str): The season of the rows.
+        from_round (Optional[int]): The first gameweek recalculated. None when the season is loaded for the first time.
+        storage_options (dict): Credentials to access ADLS2.
+    """
+    delta_write_options = {"partition_by": ["season"]}
+
+    if from_round is None:
+        mode = "append"
+    else:
+        mode = "overwrite"
+        delta_write_options["predicate"] = f"season = '{season}' AND round >= {from_round}"
+
+    version = write_delta_table(
+        decode_categories(dataset),
+        gold_table_path,
+        storage_options,
+        mode=mode,
+        delta_write_options=delta_write_options
+    )
+    record_delta_version(version)
+    logging.info(f"{dataset.height} rows have been inserted into gold player_form table for season {season}")
+
+
+def load_silver_to_gold(file_date: str, silver_table_path: str, gold_table_path: str, window: int, storage_options: dict) -> 'pl.DataFrame':
+    """
+    Recalculate player form of new gameweeks and write them into gold player form table.
+
+    Args:
+        file_date (str): The file date used to get the season. Date format should be ddMMyyyy.
+        silver_table_path (str): The path of silver delta table.
+        gold_table_path (str): The path of gold delta table.
+        window (int): Number of gameweeks in the rolling window.
+        storage_options (dict): Credentials to access ADLS2.
+
+    Returns:
+        pl.DataFrame: Player form rows written into gold. Empty if there is no new gameweek.
+    """
+    season = create_season_value(file_date)
+    last_gold_round = get_last_gold_round(gold_table_path, season, storage_options)
+
+    # The latest gameweek in gold is recalculated because its fixtures might not have been completed in the previous run.
+    # One more window is read back, so bps_trend of from_round has the rolling average of the gameweek before it
+    from_round = last_gold_round
+    lookback_round = 1 if last_gold_round is None else max(last_gold_round - window, 1)
+
+    history_df = read_silver_history(silver_table_path, season, lookback_round, storage_options)
+    if history_df.is_empty():
+        logging.info(f"No new gameweek to be loaded into gold player_form table for season {season}")
+        return history_df
+
+    gameweek_df = aggregate_player_gameweek(deduplicate_fixture_rows(history_df))
+    form_df = add_rolling_form_metrics(gameweek_df, window)
+    if from_round is not None:
+        form_df = form_df.filter(pl.col("round") >= from_round)
+
+    write_silver_to_gold(form_df, gold_table_path, season, from_round, storage_options)
+
+    return form_df
+
+
+@profile_invocation
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Python HTTP trigger function processed a request.")
+
+    file_date = req.params.get('file_date')
+    window = int(req.params.get('window') or os.getenv("PlayerFormWindow") or DEFAULT_FORM_WINDOW)
+
+    if not file_date:
+        return func.HttpResponse(
+            "No parameter supplied. Please provide a 'file_date' based on the file to be ingested. Date format should be ddMMyyyy",
+            status_code=400
+        )
+
+    try:
+        storage = get_storage()
+        silver_table_path = storage.table_uri("silver/current_season_history")
+        gold_table_path = storage.table_uri("gold/player_form")
+
+        form_df = load_silver_to_gold(file_date, silver_table_path, gold_table_path, window, storage.storage_options)
+        if form_df.is_empty():
+            return func.HttpResponse(f"No new gameweek to be loaded into gold player_form table", status_code=200)
+
+        return func.HttpResponse(f"Gold player_form table has been updated for season {form_df['season'][0]}", status_code=200)
+    except Exception as e:
+        return func.HttpResponse(f"An error occured: {str(e)}", status_code=500)
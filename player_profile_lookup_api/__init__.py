@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+import azure.functions as func
+from util.storage import get_storage
+from util.lazy_import import lazy_import
+from util.instrumentation import instrument, record_metrics, calculate_percentile
+from util.profiling import profile_invocation
+
+pa = lazy_import('pyarrow')
+pc = lazy_import('pyarrow.compute')
+deltalake = lazy_import('deltalake')
+
+"""
+This code is to look up current player profiles of silver/cdz2_player_profile by player id, e.g. ?id=1 or ?ids=1,2,3.
+With PlayerProfileLoadMode=scd2 silver/cdz2_player_profile_scd2 is read instead.
+
+The current rows are loaded once per warm instance into a pyarrow table, the columnar snapshot,
+with a hash index of (season, id) to row number. Lookups take the rows of the index out of the snapshot, so they
+never scan the delta table. The snapshot is kept in module scope and reloaded only when the delta table version
+has changed. The version is checked at most once every ProfileSnapshotRefreshSeconds.
+
+Every lookup records its latency and whether the snapshot was served as it was (hit) or had to be loaded (miss).
+p50 and p99 latency of the last LATENCY_WINDOW lookups and the hit rate since the instance started are recorded on
+the lookup step, returned as X-Lookup-* headers and returned as JSON with ?stats=true.
+"""
+
+TABLE_PATHS = {
+    'snapshot': 'silver/cdz2_player_profile',
+    'scd2': 'silver/cdz2_player_profile_scd2'
+}
+DEFAULT_SNAPSHOT_REFRESH_SECONDS = 60
+MAX_LOOKUP_IDS = 1000
+LATENCY_WINDOW = 1000
+
+_snapshot_lock = threading.Lock()
+# {'table': DeltaTable, 'version': int, 'checked_at': float, 'rows': pa.Table, 'index': Dict[Tuple[str, str], int], 'latest_season': str}
+_snapshot: Dict[str, Any] = {}
+_lookup_stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'latencies_ms': deque(maxlen=LATENCY_WINDOW)}
+
+
+def load_snapshot(delta_table: 'deltalake.DeltaTable') -> Tuple['pa.Table', Dict[Tuple[str, str], int]]:
+    """
+    Load the current player profile rows and build the hash index on season and id.
+    The scd2 table marks current rows with is_current. The snapshot table appends every daily profile,
+    so its current row of a player is the one with the latest inserted_timestamp in the season.
+
+    Args:
+        delta_table (DeltaTable): The player profile delta table.
+
+    Returns:
+        Tuple[pa.Table, Dict[Tuple[str, str], int]]: The current rows and the row number of every season and id.
+    """
+    dataset = delta_table.to_pyarrow_dataset()
+    if 'is_current' in dataset.schema.names:
+        rows = dataset.to_table(filter=pc.field('is_current') == True)
+    else:
+        rows = dataset.to_table().sort_by([('inserted_timestamp', 'descending')])
+        latest_rows = {}
+        for row_number, (season, player_id) in enumerate(zip(rows.column('season').to_pylist(), rows.column('id').to_pylist())):
+            latest_rows.setdefault((str(season), str(player_id)), row_number)
+        rows = rows.take(sorted(latest_rows.values()))
+
+    index = {
+        (str(season), str(player_id)): row_number
+        for row_number, (season, player_id) in enumerate(zip(rows.column('season').to_pylist(), rows.column('id').to_pylist()))
+    }
+    logging.info(f"Loaded player profile snapshot at version {delta_table.version()} with {rows.num_rows} current rows")
+    return rows, index
+
+
+def get_snapshot(azure_path: str, storage_options: dict) -> bool:
+    """
+    Make sure the snapshot is loaded and holds the latest version of the delta table.
+    The version is only checked when the refresh interval has passed, the snapshot is only reloaded when it has changed.
+
+    Args:
+        azure_path (str): The root path of the storage backend.
+        storage_options (dict): Credentials to access ADLS2.
+
+    Returns:
+        bool: True if the snapshot was served as it was, False if it has been loaded.
+    """
+    refresh_seconds = float(os.getenv("ProfileSnapshotRefreshSeconds") or DEFAULT_SNAPSHOT_REFRESH_SECONDS)
+    now = time.monotonic()
+
+    if _snapshot:
+        if now - _snapshot['checked_at'] < refresh_seconds:
+            return True
+        delta_table = _snapshot['table']
+        delta_table.update_incremental()
+        _snapshot['checked_at'] = now
+        if delta_table.version() == _snapshot['version']:
+            return True
+    else:
+        table_path = TABLE_PATHS[os.getenv("PlayerProfileLoadMode", "snapshot")]
+        delta_table = deltalake.DeltaTable(f"{azure_path}/{table_path}", storage_options=storage_options)
+
+    rows, index = load_snapshot(delta_table)
+    _snapshot.update({
+        'table': delta_table,
+        'version': delta_table.version(),
+        'checked_at': now,
+        'rows': rows,
+        'index': index,
+        'latest_season': max((season for season, _ in index), default=None)
+    })
+    return False
+
+
+def get_lookup_stats() -> Dict[str, Any]:
+    """
+    Return latency percentiles and cache hit rate of the lookups served by this instance.
+    """
+    latencies_ms = list(_lookup_stats['latencies_ms'])
+    lookups = _lookup_stats['lookups']
+    return {
+        'lookups': lookups,
+        'latency_p50_ms': calculate_percentile(latencies_ms, 0.5, digits=3),
+        'latency_p99_ms': calculate_percentile(latencies_ms, 0.99, digits=3),
+        'cache_hit_rate': round(_lookup_stats['hits'] / lookups, 4) if lookups else None,
+        'snapshot_version': _snapshot.get('version'),
+        'snapshot_rows': _snapshot['rows'].num_rows if _snapshot else None
+    }
+
+
+@instrument('read')
+def lookup_profiles(player_ids: List[str], season: Optional[str], azure_path: str, storage_options: dict) -> Tuple[List[Dict[str, Any]], List[str], bool]:
+    """
+    Look up current player profiles by id.
+
+    Args:
+        player_ids (List[str]): Player ids to be looked up.
+        season (Optional[str]): The season of the ids. The latest season in the snapshot is used when not supplied.
+        azure_path (str): The root path of the storage backend.
+        storage_options (dict): Credentials to access ADLS2.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[str], bool]: Profiles in the order of the ids, ids not found and
+        whether the snapshot was served from cache.
+    """
+    start_time = time.perf_counter()
+    with _snapshot_lock:
+        cache_hit = get_snapshot(azure_path, storage_options)
+        rows, index = _snapshot['rows'], _snapshot['index']
+        season = season or _snapshot['latest_season']
+
+    row_numbers = [index.get((season, player_id)) for player_id in player_ids]
+    profiles = rows.take([row_number for row_number in row_numbers if row_number is not None]).to_pylist()
+    not_found = [player_id for player_id, row_number in zip(player_ids, row_numbers) if row_number is None]
+    latency_ms = (time.perf_counter() - start_time) * 1000
+
+    with _snapshot_lock:
+        _lookup_stats['lookups'] += 1
+        _lookup_stats['hits' if cache_hit else 'misses'] += 1
+        _lookup_stats['latencies_ms'].append(latency_ms)
+    lookup_stats = get_lookup_stats()
+    record_metrics(
+        latency_p50_ms=lookup_stats['latency_p50_ms'],
+        latency_p99_ms=lookup_stats['latency_p99_ms'],
+        cache_hit_rate=lookup_stats['cache_hit_rate']
+    )
+    return profiles, not_found, cache_hit
+
+
+def parse_player_ids(params: Dict[str, str]) -> List[str]:
+    """
+    Read player ids from the id or ids parameter.
+    """
+    player_ids = [player_id.strip() for player_id in (params.get('ids') or params.get('id') or '').split(',') if player_id.strip()]
+    if not player_ids:
+        raise ValueError("No parameter supplied. Please provide an 'id' or 'ids' parameter, e.g. ids=1,2,3")
+    if len(player_ids) > MAX_LOOKUP_IDS:
+        raise ValueError(f"At most {MAX_LOOKUP_IDS} ids can be looked up in one request, got {len(player_ids)}")
+    if not all(player_id.isdigit() for player_id in player_ids):
+        raise ValueError("Parameter 'ids' should be a comma separated list of player ids")
+    return player_ids
+
+
+@profile_invocation
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Python HTTP trigger function processed a request.")
+
+    if req.params.get('stats') == 'true':
+        return func.HttpResponse(json.dumps(get_lookup_stats()), status_code=200, mimetype="application/json")
+
+    try:
+        player_ids = parse_player_ids(req.params)
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
+    try:
+        storage = get_storage()
+        profiles, not_found, cache_hit = lookup_profiles(player_ids, req.params.get('season'), storage.root_uri, storage.storage_options)
+        lookup_stats = get_lookup_stats()
+
+        return func.HttpResponse(
+            json.dumps({'profiles': profiles, 'not_found': not_found}, default=str),
+            status_code=200,
+            mimetype="application/json",
+            headers={
+                'X-Lookup-Cache': 'hit' if cache_hit else 'miss',
+                'X-Lookup-Snapshot-Version': str(lookup_stats['snapshot_version']),
+                'X-Lookup-Latency-P50-Ms': str(lookup_stats['latency_p50_ms']),
+                'X-Lookup-Latency-P99-Ms': str(lookup_stats['latency_p99_ms']),
+                'X-Lookup-Cache-Hit-Rate': str(lookup_stats['cache_hit_rate'])
+            }
+        )
+    except Exception as e:
+        logging.error(f"An error occured: {str(e)}")
+        return func.HttpResponse(f"An error occured: {str(e)}", status_code=500)
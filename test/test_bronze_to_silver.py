@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import polars as pl
+from current_season_history_bronze_to_silver_4 import read_new_bronze_data
+from util.watermark import commit_watermark, create_watermark_app_id
+
+DATA_SOURCE = 'team_metadata'
+
+
+def append_bronze_rows(bronze_path: str, team_ids: list) -> pl.DataFrame:
+    dataset = pl.DataFrame({'id': team_ids, 'ingest_date': ['01032025'] * len(team_ids)})
+    dataset.write_delta(bronze_path, mode='append')
+    return dataset
+
+
+def test_bronze_commit_not_loaded_by_a_previous_run_is_read(tmp_path):
+    bronze_path = str(tmp_path / 'bronze')
+    silver_path = str(tmp_path / 'silver')
+    append_bronze_rows(bronze_path, [1])
+    commit_watermark(silver_path, create_watermark_app_id('silver', DATA_SOURCE), 0, {}, pl.DataFrame({'id': [1]}))
+    # Version 1 was appended into bronze by a run whose silver stage failed
+    append_bronze_rows(bronze_path, [2])
+
+    # This run appended nothing into bronze
+    new_rows, bronze_version = read_new_bronze_data('01032025', {}, bronze_path, silver_path, DATA_SOURCE, pl.DataFrame())
+    assert bronze_version == 1
+    assert new_rows.get_column('id').to_list() == [2]
+
+    # Rows of version 2 are in memory, version 1 is read from bronze as well
+    bronze_rows = append_bronze_rows(bronze_path, [3])
+    new_rows, bronze_version = read_new_bronze_data('01032025', {}, bronze_path, silver_path, DATA_SOURCE, bronze_rows, 2)
+    assert bronze_version == 2
+    assert sorted(new_rows.get_column('id').to_list()) == [2, 3]
+
+    commit_watermark(silver_path, create_watermark_app_id('silver', DATA_SOURCE), 1, {})
+    new_rows, bronze_version = read_new_bronze_data('01032025', {}, bronze_path, silver_path, DATA_SOURCE, bronze_rows, 2)
+    assert bronze_version == 2
+    assert new_rows.equals(bronze_rows)
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import polars as pl
+from util.data_quality import validate_dataset
+
+
+def create_players(ingest_dates: list) -> pl.DataFrame:
+    return pl.DataFrame({
+        'id': [1, 1, 2, 3, 3],
+        'team': [1] * 5,
+        'element_type': [1] * 5,
+        'now_cost': [50, 55, 60, 70, 70],
+        'ingest_date': ingest_dates,
+        'created_timestamp': ['2025-01-31 10:00:00'] + ['2025-02-01 10:00:00'] * 4
+    })
+
+
+def test_unique_rule_keeps_latest_load_and_quarantines_duplicates_of_an_ingest():
+    # Player 1 changed between two loaded bronze versions, player 3 is duplicated within one ingest
+    for ingest_dates in [['31012025'] + ['01022025'] * 4, [31012025] + [1022025] * 4]:
+        passed_df, quarantine_df, metrics_df = validate_dataset(create_players(ingest_dates), 'player_metadata', '01022025', {})
+
+        assert passed_df.select(['id', 'now_cost']).rows() == [(1, 55), (2, 60)]
+        assert quarantine_df.height == 2
+        assert quarantine_df.get_column('failed_rules').to_list() == ['id_unique', 'id_unique']
+        assert metrics_df.filter(pl.col('rule') == 'id_unique').get_column('checked_rows').item() == 4
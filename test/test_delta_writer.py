@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import polars as pl
+from util.delta_writer import write_delta_table
+
+
+def test_write_delta_table_returns_committed_version(tmp_path):
+    table_path = str(tmp_path / 'gold')
+    dataset = pl.DataFrame({'element': [1, 2], 'season': ['2024/2025'] * 2})
+
+    assert write_delta_table(dataset, table_path, {}, mode="append", delta_write_options={"partition_by": ["season"]}) == 0
+    assert write_delta_table(dataset, table_path, {}, mode="append") == 1
+    assert write_delta_table(dataset.head(1), table_path, {}, mode="overwrite", delta_write_options={"predicate": "season = '2024/2025'"}) == 2
+    assert pl.read_delta(table_path).get_column('element').to_list() == [1]
@@ -0,0 +1,36 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.compression import compress
+from util.extractor import read_latest_landing_rows
+from util.storage import LocalStorage
+from Extract_player_api_2 import PLAYER_METADATA_PREFIX, download_landing_metadata, get_blob_name
+
+
+def write_landing_file(storage: LocalStorage, file_name: str, rows: list) -> None:
+    storage.write_bytes(f"landing/{file_name}", compress("".join(json.dumps(row) + '\n' for row in rows).encode()))
+
+
+def test_read_latest_landing_rows_compares_file_dates(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    # 31012025 sorts after 01022025 as a string, the file of 1 February is the latest
+    write_landing_file(storage, "raw_fpl_events_metadata_31012025_2025-01-31 10:00:00.json.gz", [{'id': 22}])
+    write_landing_file(storage, "raw_fpl_events_metadata_01022025_2025-02-01 09:00:00.json.gz", [{'id': 23}])
+    write_landing_file(storage, "raw_fpl_events_metadata_01022025_2025-02-01 08:00:00.json.gz", [{'id': 24}])
+
+    assert read_latest_landing_rows(storage, 'events_metadata') == [{'id': 23}]
+    assert read_latest_landing_rows(storage, 'team_metadata') is None
+
+
+def test_landing_files_without_ddmmyyyy_date_are_skipped(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    write_landing_file(storage, "raw_fpl_player_metadata_20250201_2025-02-01 09:00:00.json.gz", [{'id': 1}])
+    write_landing_file(storage, "raw_fpl_player_metadata_31012025_2025-01-31 10:00:00.json.gz", [{'id': 2}])
+    write_landing_file(storage, "raw_fpl_player_metadata_01022025_2025-02-01 09:00:00.json.gz", [{'id': 3}])
+
+    assert read_latest_landing_rows(storage, 'player_metadata') == [{'id': 3}]
+    assert get_blob_name(storage) == "raw_fpl_player_metadata_01022025_2025-02-01 09:00:00.json.gz"
+    assert download_landing_metadata(storage, [PLAYER_METADATA_PREFIX])[PLAYER_METADATA_PREFIX] == [{'id': 3}]
@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import historical_seasons_loader as loader
+from util.storage import LocalStorage
+
+
+def test_archived_files_without_ddmmyyyy_date_are_skipped(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    for file_name in [
+        "raw_fpl_current_season_history_20240510_2024-05-10 10:00:00.json",
+        "raw_fpl_current_season_history_10052024_2024-05-10 10:00:00.json",
+        "raw_fpl_current_season_history_26052024_2024-05-26 10:00:00.json",
+        "raw_fpl_current_season_history_01032025_2025-03-01 10:00:00.json"
+    ]:
+        storage.write_bytes(f"archive/{file_name}", b"")
+
+    assert loader.find_archived_season_files(storage, '2024/2025') == {
+        '2023/2024': "archive/raw_fpl_current_season_history_26052024_2024-05-26 10:00:00.json"
+    }
+
+
+def test_history_past_players_are_fetched_from_bootstrap_static(tmp_path, monkeypatch):
+    requests = []
+
+    def fetch_endpoints(endpoint_names, ids=None, data_sources=None, workers=None):
+        requests.append(endpoint_names)
+        if endpoint_names == ['bootstrap_static']:
+            return {'player_metadata': [{'id': 1}, {'id': 2}]}
+        return {'history_past': [{'element_code': player_id, 'season_name': '2023/24', 'total_points': 100} for player_id in ids['element_summary']]}
+
+    monkeypatch.setattr(loader, 'fetch_endpoints', fetch_endpoints)
+    dataset = loader.extract_history_past('01032025', LocalStorage(str(tmp_path)), workers=2)
+
+    assert requests == [['bootstrap_static'], ['element_summary']]
+    assert dataset.get_column('season').to_list() == ['2023/2024', '2023/2024']
@@ -0,0 +1,33 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import live_gameweek_micro_batch as live
+
+GAMEWEEK = 12
+
+
+def create_response(total_points: int) -> dict:
+    return {'elements': [
+        {'id': 1, 'stats': {'minutes': 90, 'total_points': total_points, 'influence': '12.4', 'expected_goals': '0.31', 'in_dreamteam': False}},
+        {'id': 2, 'stats': {'minutes': 45, 'total_points': 2, 'influence': '3.0', 'expected_goals': '0.00', 'in_dreamteam': False}}
+    ]}
+
+
+def create_micro_batch(table_path: str) -> live.LiveMicroBatch:
+    return live.LiveMicroBatch(GAMEWEEK, table_path, {}, commit_seconds=3600, max_batch_rows=1000)
+
+
+def test_next_run_only_commits_changes_since_previous_run(tmp_path):
+    table_path = str(tmp_path / 'live_event_stats')
+    first_run = create_micro_batch(table_path)
+    assert first_run.load_previous_stats() == 0
+    assert first_run.add(create_response(6), datetime.now(timezone.utc)) == 2
+    first_run.commit()
+
+    next_run = create_micro_batch(table_path)
+    assert next_run.load_previous_stats() == 2
+    assert next_run.add(create_response(6), datetime.now(timezone.utc)) == 0
+    assert next_run.add(create_response(8), datetime.now(timezone.utc)) == 1
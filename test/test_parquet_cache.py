@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import polars as pl
+import util.parquet_cache as parquet_cache
+from util.storage import LocalStorage
+
+
+def test_file_evicted_between_fetch_and_read_is_fetched_again(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path / 'container'))
+    pl.DataFrame({'element': [1, 2], 'season': ['2024/2025'] * 2}).write_delta(
+        storage.table_uri('bronze/current_season_history'), delta_write_options={'partition_by': ['season']}
+    )
+    cache = parquet_cache.ParquetCache(str(tmp_path / 'cache'), 1024 * 1024)
+    monkeypatch.setattr(parquet_cache, 'get_parquet_cache', lambda: cache)
+    monkeypatch.setattr(parquet_cache, 'is_cached_backend', lambda storage: True)
+
+    read_cached_file = parquet_cache.read_cached_file
+    evicted_paths = []
+
+    def evict_before_first_read(cache_path, *args):
+        # Another worker process evicts the file right after this process fetched it
+        if not evicted_paths:
+            os.remove(cache_path)
+            evicted_paths.append(cache_path)
+        return read_cached_file(cache_path, *args)
+
+    monkeypatch.setattr(parquet_cache, 'read_cached_file', evict_before_first_read)
+
+    dataset = parquet_cache.read_delta_cached(storage, 'bronze/current_season_history')
+    assert evicted_paths
+    assert sorted(dataset.get_column('element').to_list()) == [1, 2]
+    assert dataset.get_column('season').unique().to_list() == ['2024/2025']
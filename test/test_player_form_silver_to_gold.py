@@ -0,0 +1,53 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import polars as pl
+import player_form_silver_to_gold_5 as player_form
+
+FILE_DATE = '01032025'
+SEASON = '2024/2025'
+WINDOW = 3
+
+
+def create_history(rounds: list) -> pl.DataFrame:
+    # Player 1 has a blank gameweek 4, player 2 plays every gameweek
+    rows = [(element, round) for round in rounds for element in [1, 2] if not (element == 1 and round == 4)]
+    return pl.DataFrame({
+        'element': [element for element, _ in rows],
+        'fixture': [element * 100 + round for element, round in rows],
+        'round': [round for _, round in rows],
+        'season': [SEASON] * len(rows),
+        'total_points': [round + element for element, round in rows],
+        'minutes': [90] * len(rows),
+        'expected_goals': [0.1 * round for _, round in rows],
+        'expected_assists': [0.05 * element for element, _ in rows],
+        'bps': [element * round * 3 % 17 for element, round in rows],
+        'row_inserted_timestamp': [datetime(2025, 1, round) for _, round in rows]
+    })
+
+
+def read_gold(gold_table_path: str) -> pl.DataFrame:
+    return (
+        pl.read_delta(gold_table_path)
+        .select(['element', 'round', 'points_last_n', 'bps_avg_last_n', 'bps_trend'])
+        .sort(['element', 'round'])
+    )
+
+
+def test_incremental_bps_trend_matches_full_rebuild(tmp_path):
+    silver_table_path = str(tmp_path / 'silver')
+    incremental_table_path = str(tmp_path / 'gold_incremental')
+    full_table_path = str(tmp_path / 'gold_full')
+
+    for rounds in [[1, 2, 3, 4], [5, 6], [7]]:
+        create_history(rounds).write_delta(silver_table_path, mode='append')
+        player_form.load_silver_to_gold(FILE_DATE, silver_table_path, incremental_table_path, WINDOW, {})
+    player_form.load_silver_to_gold(FILE_DATE, silver_table_path, full_table_path, WINDOW, {})
+
+    incremental = read_gold(incremental_table_path)
+    assert incremental.equals(read_gold(full_table_path))
+    # Gameweek 5 of player 1 follows a blank gameweek, so it has no previous rolling average to compare against
+    assert incremental.filter((pl.col('element') == 1) & (pl.col('round') == 5))['bps_trend'].item() is None
@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Extract_player_api_2 as player_api
+from util.compression import decompress
+from util.storage import LocalStorage
+
+RUN_ID = '01032025_run'
+
+
+class BarrierStorage(LocalStorage):
+    """
+    Hold every shard worker after listing the partial files, so all of them see a complete run.
+    """
+
+    def __init__(self, root: str, parties: int):
+        super().__init__(root)
+        self.barrier = threading.Barrier(parties, timeout=10)
+
+    def list(self, prefix: str):
+        paths = super().list(prefix)
+        if prefix == player_api.get_work_folder(RUN_ID) and any('manifest' in path for path in paths) and not self.barrier.broken:
+            self.barrier.wait()
+        return paths
+
+
+def create_run(storage: LocalStorage) -> None:
+    work_folder = player_api.get_work_folder(RUN_ID)
+    manifest = {'run_id': RUN_ID, 'ingest_date': '01032025', 'file_name': 'raw_fpl_current_season_history_01032025.json', 'shard_count': 2, 'use_cache': False}
+    storage.write_bytes(f"{work_folder}/manifest.json", json.dumps(manifest).encode())
+    for shard_index in range(2):
+        storage.write_bytes(f"{work_folder}/part_{shard_index:05d}.json", (json.dumps({'element': shard_index}) + '\n').encode())
+    storage.write_bytes(f"{work_folder}/failed_00001.json", json.dumps([7]).encode())
+
+
+def test_fan_in_is_merged_by_one_shard_worker(tmp_path, caplog):
+    storage = BarrierStorage(str(tmp_path), 2)
+    create_run(storage)
+
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(player_api.fan_in_player_history(RUN_ID, storage))) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    landing_files = [path for path in storage.list('landing') if path.startswith('landing/raw_fpl_current_season_history_')]
+    assert sorted(results, key=str) == [None, 'raw_fpl_current_season_history_01032025.json']
+    assert len(landing_files) == 1
+    assert decompress(storage.read_bytes(landing_files[0])).decode().count('\n') == 2
+    assert storage.list(player_api.get_work_folder(RUN_ID)) == []
+    assert "Requests of players 7 failed" in caplog.text
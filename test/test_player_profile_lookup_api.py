@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import polars as pl
+import pytest
+import azure.functions as func
+import player_profile_lookup_api as lookup_api
+from util.storage import LocalStorage, set_storage
+
+
+def create_profiles(season: str, inserted_timestamp: datetime, now_cost: float) -> pl.DataFrame:
+    return pl.DataFrame({
+        'id': ['1', '2'],
+        'web_name': ['Raya', 'Saka'],
+        'name': ['Arsenal', 'Arsenal'],
+        'singular_name': ['Goalkeeper', 'Midfielder'],
+        'now_cost': [now_cost, 100.0],
+        'status': ['a', 'a'],
+        'can_select': ['True', 'True'],
+        'season': [season, season],
+        'inserted_timestamp': [inserted_timestamp, inserted_timestamp],
+        'updated_timestamp': [inserted_timestamp, inserted_timestamp]
+    })
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.delenv("PlayerProfileLoadMode", raising=False)
+    lookup_api._snapshot.clear()
+    storage = LocalStorage(str(tmp_path))
+    set_storage(storage)
+    yield storage
+    lookup_api._snapshot.clear()
+    set_storage(None)
+
+
+def lookup(params: dict) -> func.HttpResponse:
+    return lookup_api.main(func.HttpRequest(method='GET', url='/api/player_profile_lookup_api', params=params, body=b''))
+
+
+def test_lookup_snapshot_table_returns_latest_daily_profile(storage):
+    table_path = storage.table_uri('silver/cdz2_player_profile')
+    create_profiles('2024/2025', datetime(2024, 9, 1, 8), 55.0).write_delta(table_path)
+    create_profiles('2024/2025', datetime(2024, 9, 2, 8), 56.0).write_delta(table_path, mode='append')
+
+    response = lookup({'ids': '1,2,3'})
+
+    assert response.status_code == 200
+    body = json.loads(response.get_body())
+    assert [profile['id'] for profile in body['profiles']] == ['1', '2']
+    assert body['profiles'][0]['now_cost'] == 56.0
+    assert body['not_found'] == ['3']
+
+
+def test_lookup_scd2_table_returns_current_rows(storage, monkeypatch):
+    monkeypatch.setenv("PlayerProfileLoadMode", "scd2")
+    profiles = pl.concat([
+        create_profiles('2024/2025', datetime(2024, 9, 1, 8), 55.0).with_columns(pl.Series('is_current', [False, True])),
+        create_profiles('2024/2025', datetime(2024, 9, 2, 8), 56.0).head(1).with_columns(pl.lit(True).alias('is_current'))
+    ])
+    profiles.write_delta(storage.table_uri('silver/cdz2_player_profile_scd2'))
+
+    response = lookup({'id': '1'})
+
+    assert response.status_code == 200
+    assert [profile['now_cost'] for profile in json.loads(response.get_body())['profiles']] == [56.0]
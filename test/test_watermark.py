@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import deltalake
+import polars as pl
+from util.watermark import read_delta_changes
+
+
+def append_rows(table_path: str, elements: list) -> None:
+    pl.DataFrame({'element': elements, 'season': ['2024/2025'] * len(elements)}).write_delta(
+        table_path, mode='append', delta_write_options={'partition_by': ['season']}
+    )
+
+
+def test_compacted_files_are_not_read_as_new_rows(tmp_path):
+    table_path = str(tmp_path / 'bronze')
+    append_rows(table_path, [1, 2])
+    append_rows(table_path, [3])
+    deltalake.DeltaTable(table_path).optimize.compact()
+    append_rows(table_path, [4])
+
+    new_rows, version = read_delta_changes(table_path, 0, {})
+    assert version == 3
+    assert sorted(new_rows.get_column('element').to_list()) == [3, 4]
+    assert new_rows.get_column('season').unique().to_list() == ['2024/2025']
+
+    new_rows, _ = read_delta_changes(table_path, 2, {})
+    assert new_rows.get_column('element').to_list() == [4]
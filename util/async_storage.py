@@ -0,0 +1,259 @@
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from util.storage import AdlsStorage
+
+"""
+Async I/O layer for storage operations that can run in parallel, e.g. uploading every landing file of
+bootstrap-static, reading partial files of a fan-out or moving landing files to archive.
+
+For the adls backend the aio clients of the Azure SDK are used. Every operation goes through one aiohttp session
+and the number of requests in flight is bounded by StorageIoConcurrency. Files are read and written with the blob
+endpoint, which also serves accounts with hierarchical namespace, so the same code runs against a local
+Azurite emulator with StorageConnectionString=UseDevelopmentStorage=true. Rename is a metadata operation on the
+dfs endpoint when StorageHierarchicalNamespace is true (default), otherwise a server side copy and delete, which
+is the only option on Azurite. Other backends run their blocking operations in threads under the same bound.
+
+Callers are synchronous functions, so run_storage_io runs the operations in a new event loop and returns once
+they have all finished. It cannot be called from a coroutine.
+"""
+
+DEFAULT_STORAGE_IO_CONCURRENCY = 16
+COPY_STATUS_POLL_SECONDS = 0.2
+
+T = TypeVar('T')
+
+
+def get_storage_io_concurrency() -> int:
+    return max(int(os.getenv("StorageIoConcurrency") or DEFAULT_STORAGE_IO_CONCURRENCY), 1)
+
+
+class AsyncAdlsStorage:
+    def __init__(self, storage: AdlsStorage, concurrency: int, hierarchical_namespace: bool = True):
+        self.storage = storage
+        self.container_name = storage.container_name
+        self.concurrency = concurrency
+        self.hierarchical_namespace = hierarchical_namespace
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+        self._credential = None
+        self._container_client = None
+        self._file_system_client = None
+
+    def _create_transport(self):
+        from azure.core.pipeline.transport import AioHttpTransport
+        # Every client shares the session, so connections are reused across blob and dfs requests
+        return AioHttpTransport(session=self._session, session_owner=False)
+
+    def _create_credential(self):
+        if self._credential is None:
+            from azure.identity.aio import DefaultAzureCredential
+            self._credential = DefaultAzureCredential()
+        return self._credential
+
+    async def __aenter__(self):
+        import aiohttp
+        from azure.storage.blob.aio import BlobServiceClient
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency))
+        if self.storage.connection_string:
+            service_client = BlobServiceClient.from_connection_string(self.storage.connection_string, transport=self._create_transport())
+        else:
+            service_client = BlobServiceClient(
+                account_url=f"https://{self.storage.account_name}.blob.core.windows.net",
+                credential=self._create_credential(),
+                transport=self._create_transport()
+            )
+        self._container_client = service_client.get_container_client(self.container_name)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._file_system_client is not None:
+            await self._file_system_client.close()
+        await self._container_client.close()
+        if self._credential is not None:
+            await self._credential.close()
+        await self._session.close()
+
+    @property
+    def file_system_client(self):
+        if self._file_system_client is None:
+            from azure.storage.filedatalake.aio import DataLakeServiceClient
+            if self.storage.connection_string:
+                service_client = DataLakeServiceClient.from_connection_string(self.storage.connection_string, transport=self._create_transport())
+            else:
+                service_client = DataLakeServiceClient(account_url=self.storage.account_url, credential=self._create_credential(), transport=self._create_transport())
+            self._file_system_client = service_client.get_file_system_client(self.container_name)
+        return self._file_system_client
+
+    async def list(self, prefix: str) -> List[str]:
+        # Directories of a hierarchical namespace are listed as empty blobs with hdi_isfolder metadata
+        name_prefix = prefix.rstrip('/') + '/' if prefix else None
+        async with self._semaphore:
+            return [
+                blob.name async for blob in self._container_client.list_blobs(name_starts_with=name_prefix, include=['metadata'])
+                if not (blob.metadata or {}).get('hdi_isfolder')
+            ]
+
+    async def exists(self, path: str) -> bool:
+        async with self._semaphore:
+            return await self._container_client.get_blob_client(path).exists()
+
+    async def read_bytes(self, path: str) -> bytes:
+        async with self._semaphore:
+            downloader = await self._container_client.get_blob_client(path).download_blob()
+            return await downloader.readall()
+
+    async def write_bytes(self, path: str, data: bytes, content_encoding: Optional[str] = None) -> None:
+        from azure.storage.blob import ContentSettings
+        content_settings = ContentSettings(content_encoding=content_encoding) if content_encoding else None
+        async with self._semaphore:
+            await self._container_client.get_blob_client(path).upload_blob(data, overwrite=True, content_settings=content_settings)
+
+    async def rename(self, source_path: str, destination_path: str) -> None:
+        async with self._semaphore:
+            if self.hierarchical_namespace:
+                directory = os.path.dirname(destination_path)
+                if directory:
+                    await self.file_system_client.create_directory(directory)
+                await self.file_system_client.get_file_client(source_path).rename_file(f"{self.container_name}/{destination_path}")
+                return
+
+            source_client = self._container_client.get_blob_client(source_path)
+            destination_client = self._container_client.get_blob_client(destination_path)
+            copy = await destination_client.start_copy_from_url(source_client.url)
+            copy_status = copy['copy_status']
+            while copy_status == 'pending':
+                await asyncio.sleep(COPY_STATUS_POLL_SECONDS)
+                copy_status = (await destination_client.get_blob_properties()).copy.status
+            if copy_status != 'success':
+                raise IOError(f"Copy of {source_path} to {destination_path} ended with status {copy_status}")
+            await source_client.delete_blob()
+
+    async def delete(self, path: str) -> None:
+        async with self._semaphore:
+            await self._container_client.get_blob_client(path).delete_blob()
+
+
+class AsyncStorageAdapter:
+    """
+    Run operations of a synchronous storage backend (local, memory) in threads, bounded like AsyncAdlsStorage.
+    """
+
+    def __init__(self, storage, concurrency: int):
+        self.storage = storage
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+    async def _run(self, operation: Callable[..., T], *args, **kwargs) -> T:
+        async with self._semaphore:
+            return await asyncio.to_thread(operation, *args, **kwargs)
+
+    async def list(self, prefix: str) -> List[str]:
+        return await self._run(self.storage.list, prefix)
+
+    async def exists(self, path: str) -> bool:
+        return await self._run(self.storage.exists, path)
+
+    async def read_bytes(self, path: str) -> bytes:
+        return await self._run(self.storage.read_bytes, path)
+
+    async def write_bytes(self, path: str, data: bytes, content_encoding: Optional[str] = None) -> None:
+        await self._run(self.storage.write_bytes, path, data, content_encoding=content_encoding)
+
+    async def rename(self, source_path: str, destination_path: str) -> None:
+        await self._run(self.storage.rename, source_path, destination_path)
+
+    async def delete(self, path: str) -> None:
+        await self._run(self.storage.delete, path)
+
+
+def open_async_storage(storage, concurrency: Optional[int] = None):
+    """
+    Create the async counterpart of a storage backend. Use it with async with, so clients and sessions are closed.
+
+    Args:
+        storage: The storage backend from util.storage.
+        concurrency (Optional[int]): Maximum number of operations in flight. StorageIoConcurrency is used when not supplied.
+
+    Returns:
+        AsyncAdlsStorage for the adls backend, AsyncStorageAdapter for the others.
+    """
+    concurrency = concurrency or get_storage_io_concurrency()
+    if isinstance(storage, AdlsStorage):
+        hierarchical_namespace = os.getenv("StorageHierarchicalNamespace", "true").lower() == "true"
+        return AsyncAdlsStorage(storage, concurrency, hierarchical_namespace=hierarchical_namespace)
+    return AsyncStorageAdapter(storage, concurrency)
+
+
+def run_storage_io(storage, operation: Callable[[Any], Awaitable[T]], concurrency: Optional[int] = None) -> T:
+    """
+    Run async storage operations from synchronous code.
+
+    Args:
+        storage: The storage backend from util.storage.
+        operation (Callable[[Any], Awaitable[T]]): Coroutine function called with the async storage.
+        concurrency (Optional[int]): Maximum number of operations in flight. StorageIoConcurrency is used when not supplied.
+
+    Returns:
+        T: The result of operation.
+    """
+    async def run() -> T:
+        async with open_async_storage(storage, concurrency) as async_storage:
+            return await operation(async_storage)
+
+    return asyncio.run(run())
+
+
+def read_many(storage, paths: List[str]) -> List[bytes]:
+    """
+    Read files in parallel. Raises the first error if any file cannot be read.
+
+    Returns:
+        List[bytes]: Content of every file in the order of paths.
+    """
+    async def read_all(async_storage) -> List[bytes]:
+        return list(await asyncio.gather(*(async_storage.read_bytes(path) for path in paths)))
+
+    return run_storage_io(storage, read_all) if paths else []
+
+
+def write_many(storage, files: Dict[str, bytes], content_encoding: Optional[str] = None) -> None:
+    """
+    Write files in parallel. Raises the first error if any file cannot be written.
+
+    Args:
+        storage: The storage backend from util.storage.
+        files (Dict[str, bytes]): Content keyed by path.
+        content_encoding (Optional[str]): Content-Encoding of every file.
+    """
+    async def write_all(async_storage) -> None:
+        await asyncio.gather(*(async_storage.write_bytes(path, data, content_encoding=content_encoding) for path, data in files.items()))
+
+    if files:
+        run_storage_io(storage, write_all)
+
+
+def delete_many(storage, paths: List[str]) -> List[Tuple[str, Exception]]:
+    """
+    Delete files in parallel. A file that cannot be deleted does not stop the others.
+
+    Returns:
+        List[Tuple[str, Exception]]: Paths that could not be deleted and the error.
+    """
+    async def delete_all(async_storage) -> List[Optional[BaseException]]:
+        return await asyncio.gather(*(async_storage.delete(path) for path in paths), return_exceptions=True)
+
+    if not paths:
+        return []
+    results = run_storage_io(storage, delete_all)
+    failures = [(path, result) for path, result in zip(paths, results) if isinstance(result, Exception)]
+    for path, error in failures:
+        logging.warning(f"File {path} cannot be removed: {str(error)}")
+    return failures
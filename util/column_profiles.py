@@ -0,0 +1,90 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+"""
+Column profiles of wide landing data sources, applied by util.extractor before rows are landed.
+
+A profile is the set of fields kept from the response:
+    full      - every field of the response (default)
+    analytics - fields used by analytics and gold tables
+    minimal   - fields needed by the pipeline itself: keys, data quality rules, cdz2_player_profile and the ID sources
+                of util.endpoint_registry
+Data sources without profiles are always landed in full. Fields left out of a landing file are recorded in the
+extraction manifest and are filled with 'null' when rows are appended into bronze, so the bronze schema does not change
+when a profile is changed.
+"""
+
+DEFAULT_COLUMN_PROFILE = 'full'
+
+MINIMAL_PLAYER_METADATA = [
+    'id', 'code', 'element_type', 'team', 'web_name', 'now_cost', 'status', 'can_select', 'birth_date', 'team_join_date'
+]
+
+MINIMAL_EVENTS_METADATA = ['id', 'name', 'deadline_time', 'finished', 'is_current', 'is_next', 'is_previous', 'data_checked']
+
+COLUMN_PROFILES = {
+    'player_metadata': {
+        'minimal': MINIMAL_PLAYER_METADATA,
+        'analytics': MINIMAL_PLAYER_METADATA + [
+            'first_name', 'second_name', 'team_code', 'chance_of_playing_next_round', 'chance_of_playing_this_round',
+            'news', 'form', 'points_per_game', 'selected_by_percent', 'total_points', 'event_points', 'ep_next', 'ep_this',
+            'cost_change_start', 'transfers_in_event', 'transfers_out_event', 'minutes', 'starts', 'goals_scored', 'assists',
+            'clean_sheets', 'goals_conceded', 'saves', 'bonus', 'bps', 'influence', 'creativity', 'threat', 'ict_index',
+            'expected_goals', 'expected_assists', 'expected_goal_involvements', 'expected_goals_conceded',
+            'expected_goals_per_90', 'expected_assists_per_90', 'expected_goal_involvements_per_90'
+        ]
+    },
+    'events_metadata': {
+        'minimal': MINIMAL_EVENTS_METADATA,
+        'analytics': MINIMAL_EVENTS_METADATA + ['average_entry_score', 'highest_score', 'highest_scoring_entry', 'most_selected', 'most_captained', 'top_element']
+    }
+}
+
+
+def parse_column_profiles(value: Optional[str]) -> Dict[str, str]:
+    """
+    Parse the column profile of every data source, e.g. 'minimal' for every data source with profiles or
+    'player_metadata:analytics,events_metadata:minimal' for single data sources.
+
+    Args:
+        value (Optional[str]): The column_profiles parameter or ExtractorColumnProfiles setting.
+
+    Returns:
+        Dict[str, str]: Column profile keyed by data source.
+    """
+    if not value:
+        return {}
+    if ':' not in value:
+        value = ','.join(f"{data_source}:{value}" for data_source in COLUMN_PROFILES)
+
+    column_profiles = {}
+    for item in value.split(','):
+        data_source, _, profile = item.strip().partition(':')
+        if profile != DEFAULT_COLUMN_PROFILE and profile not in COLUMN_PROFILES.get(data_source, {}):
+            profiles = [DEFAULT_COLUMN_PROFILE] + list(COLUMN_PROFILES.get(data_source, {}))
+            error_msg = f"Column profile - '{profile}' does not exists for {data_source}. Input could be either {' or '.join(profiles)}"
+            logging.error(error_msg)
+            raise ValueError(error_msg)
+        column_profiles[data_source] = profile
+    return column_profiles
+
+
+def project_rows(rows: List[Dict[str, Any]], data_source: str, profile: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Keep the fields of a column profile in every row.
+
+    Args:
+        rows (List[Dict[str, Any]]): Rows of the data source.
+        data_source (str): The data source.
+        profile (str): Either full, analytics or minimal.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[str]]: Projected rows and the sorted fields left out.
+    """
+    if profile == DEFAULT_COLUMN_PROFILE:
+        return rows, []
+
+    fields = COLUMN_PROFILES[data_source][profile]
+    response_fields = {field for row in rows for field in row}
+    projected_rows = [{field: row[field] for field in fields if field in row} for row in rows]
+    return projected_rows, sorted(response_fields - set(fields))
@@ -2,9 +2,6 @@ from datetime import datetime
 import logging
 import pytz
 import os
-from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient
-from azure.keyvault.secrets import SecretClient
 
 def convert_timestamp_to_myt_date():
     current_utc_timestamp = datetime.utcnow()
@@ -26,6 +23,9 @@ def get_secret_value(key_vault_url: str) -> str:
         str: Return client id, secret and tenant id value.
     """
 
+    from azure.identity import DefaultAzureCredential
+    from azure.keyvault.secrets import SecretClient
+
     # Create a DefaultAzureCredential object to authenticate with Azure Key Vault
     credential = DefaultAzureCredential(managed_identity_client_id=os.getenv("ManagedIdentityClientId"))
 
@@ -55,4 +55,47 @@ def create_storage_options(azure_dev_key_vault_url):
     }
     logging.info("Credentials has been created")
 
-    return storage_options
\ No newline at end of file
+    return storage_options
+
+def validate_file_date(file_date: str) -> datetime:
+    """
+    Validate a file or ingest date.
+
+    Args:
+        file_date (str): The date to be validated. Date format should be ddMMyyyy.
+
+    Returns:
+        datetime: The parsed date.
+
+    Raises:
+        ValueError: When the date is not ddMMyyyy.
+    """
+    try:
+        if len(file_date) != 8:
+            raise ValueError("Length should be 8")
+        date_object = datetime.strptime(file_date, '%d%m%Y')
+        # A yyyyMMdd date can parse as ddMMyyyy with a year like 0125
+        if date_object.year < 2000:
+            raise ValueError("Year should be 2000 or later")
+        return date_object
+    except (TypeError, ValueError) as e:
+        error_msg = f"Invalid file_date format or value: '{file_date}'. Expected 'ddMMyyyy'. Error: {e}"
+        logging.error(error_msg)
+        raise ValueError(error_msg)
+
+
+def create_season_value(file_date: str) -> str:
+    """
+    Create season value. A season starts in August.
+
+    Args:
+        file_date (str): The value of date to be used as indicator to create season value. Date format should be ddMMyyyy.
+
+    Returns:
+        str: Season value. Example value is 2024/2025.
+    """
+    date_object = validate_file_date(file_date)
+
+    if date_object.month in [8, 9, 10, 11, 12]:
+        return f"{date_object.year}/{date_object.year + 1}"
+    return f"{date_object.year - 1}/{date_object.year}"
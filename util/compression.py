@@ -0,0 +1,110 @@
+import os
+import gzip
+import logging
+from typing import Optional
+from urllib3.util.request import ACCEPT_ENCODING
+from util.lazy_import import lazy_import
+
+pa = lazy_import('pyarrow')
+
+"""
+Compression of API responses and landing files.
+
+API calls ask for a compressed response with API_HEADERS. br is only offered when the brotli package is installed,
+because urllib3 can only decode it then. Landing files are written as JSONL compressed with LandingCompression:
+    gzip - .gz is appended to the file name, e.g. raw_fpl_team_metadata_17022025_<timestamp>.json.gz (default)
+    zstd - .zst is appended to the file name, compressed with pyarrow, so no extra dependency is needed
+    none - file name is not changed
+Readers detect the format from the magic bytes of the content instead of the file name, so files written before
+compression was enabled and content that has already been decoded by the HTTP client are read the same way.
+"""
+
+DEFAULT_LANDING_COMPRESSION = 'gzip'
+LANDING_FILE_SUFFIXES = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+CONTENT_ENCODINGS = {'none': None, 'gzip': 'gzip', 'zstd': 'zstd'}
+GZIP_COMPRESSION_LEVEL = 6
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+API_HEADERS = {'Accept-Encoding': ACCEPT_ENCODING}
+
+
+def get_landing_compression(compression: Optional[str] = None) -> str:
+    """
+    Return the compression of landing files.
+
+    Args:
+        compression (Optional[str]): Either none, gzip or zstd. LandingCompression setting is used when not supplied.
+
+    Returns:
+        str: The compression.
+    """
+    compression = compression or os.getenv("LandingCompression", DEFAULT_LANDING_COMPRESSION)
+    if compression not in LANDING_FILE_SUFFIXES:
+        error_msg = f"Landing compression - '{compression}' does not exists. Input could be either none or gzip or zstd"
+        logging.error(error_msg)
+        raise ValueError(error_msg)
+    return compression
+
+
+def get_landing_file_name(file_name: str, compression: Optional[str] = None) -> str:
+    """
+    Return the landing file name of an uncompressed JSONL file name, e.g. raw_fpl_team_metadata_17022025.json.gz.
+    """
+    return f"{file_name}{LANDING_FILE_SUFFIXES[get_landing_compression(compression)]}"
+
+
+def get_content_encoding(compression: Optional[str] = None) -> Optional[str]:
+    return CONTENT_ENCODINGS[get_landing_compression(compression)]
+
+
+def compress(data: bytes, compression: Optional[str] = None) -> bytes:
+    """
+    Compress content of a landing file.
+
+    Args:
+        data (bytes): The uncompressed content.
+        compression (Optional[str]): Either none, gzip or zstd. LandingCompression setting is used when not supplied.
+
+    Returns:
+        bytes: The compressed content.
+    """
+    compression = get_landing_compression(compression)
+    if compression == 'gzip':
+        # mtime is fixed, so the same content always gives the same bytes
+        return gzip.compress(data, compresslevel=GZIP_COMPRESSION_LEVEL, mtime=0)
+    elif compression == 'zstd':
+        sink = pa.BufferOutputStream()
+        with pa.CompressedOutputStream(sink, 'zstd') as compressed_stream:
+            compressed_stream.write(data)
+        return sink.getvalue().to_pybytes()
+    return data
+
+
+def decompress(data: bytes) -> bytes:
+    """
+    Decompress content of a landing file. The format is detected from the magic bytes.
+
+    Args:
+        data (bytes): The content, either gzip, zstd or uncompressed.
+
+    Returns:
+        bytes: The uncompressed content.
+    """
+    if data[:2] == GZIP_MAGIC:
+        return gzip.decompress(data)
+    elif data[:4] == ZSTD_MAGIC:
+        return pa.input_stream(pa.BufferReader(data), compression='zstd').read()
+    return data
+
+
+def get_transfer_size(response) -> Optional[int]:
+    """
+    Return the number of bytes received on the wire for a response requested with stream=True,
+    which is the compressed size when the response is compressed.
+    """
+    try:
+        return response.raw.tell()
+    except Exception:
+        return None
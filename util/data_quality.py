@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from util.lazy_import import lazy_import
+from util.instrumentation import instrument, record_delta_version
+from util.delta_writer import write_delta_table
+
+pl = lazy_import('polars')
+deltalake = lazy_import('deltalake')
+
+"""
+Data quality validation of silver tables.
+
+Rules are declared per data source in QUALITY_RULES and evaluated in one vectorized pass: every rule is a polars
+expression that flags failing rows, all flags are computed in the same plan, and the failed row and rule counts
+are aggregated from the flags. Every rule type is hash or comparison based, so runtime is linear in table size.
+    not_null  - columns must not be null
+    unique    - combination of columns must be unique within the rows of an ingest date. When the rows loaded span
+                several ingest dates, e.g. a watermark catch-up over two bronze versions, only the rows of the latest
+                load of a key are kept before the rules run
+    range     - column must be between min and max, null is not checked
+    reference - column value must exist in column of a reference silver table
+Rows failing a rule with severity error are written to quality/quarantine instead of silver. Rules with severity
+warn are only counted. Pass and fail counts of every rule are appended to quality/rule_metrics.
+"""
+
+QUARANTINE_TABLE = 'quality/quarantine'
+# Columns of bronze rows ordering the loads of a key, the latest load is the last
+LOAD_ORDER_COLUMNS = ['ingest_date', 'created_timestamp']
+RULE_METRICS_TABLE = 'quality/rule_metrics'
+
+QUALITY_RULES = {
+    'current_season_history': [
+        {'name': 'key_not_null', 'type': 'not_null', 'columns': ['element', 'fixture', 'round']},
+        {'name': 'element_fixture_unique', 'type': 'unique', 'columns': ['element', 'fixture']},
+        {'name': 'minutes_range', 'type': 'range', 'column': 'minutes', 'min': 0, 'max': 120},
+        {'name': 'total_points_range', 'type': 'range', 'column': 'total_points', 'min': -10, 'max': 40, 'severity': 'warn'},
+        {'name': 'opponent_team_reference', 'type': 'reference', 'column': 'opponent_team', 'reference_table': 'team_metadata', 'reference_column': 'id'}
+    ],
+    'player_metadata': [
+        {'name': 'key_not_null', 'type': 'not_null', 'columns': ['id', 'team', 'element_type']},
+        {'name': 'id_unique', 'type': 'unique', 'columns': ['id']},
+        {'name': 'now_cost_range', 'type': 'range', 'column': 'now_cost', 'min': 0, 'max': 200},
+        {'name': 'team_reference', 'type': 'reference', 'column': 'team', 'reference_table': 'team_metadata', 'reference_column': 'id'},
+        {'name': 'element_type_reference', 'type': 'reference', 'column': 'element_type', 'reference_table': 'position_metadata', 'reference_column': 'id'}
+    ],
+    'team_metadata': [
+        {'name': 'key_not_null', 'type': 'not_null', 'columns': ['id']},
+        {'name': 'id_unique', 'type': 'unique', 'columns': ['id']}
+    ],
+    'position_metadata': [
+        {'name': 'key_not_null', 'type': 'not_null', 'columns': ['id']},
+        {'name': 'id_unique', 'type': 'unique', 'columns': ['id']}
+    ]
+}
+
+
+def read_reference_values(azure_path: str, reference_table: str, reference_column: str, storage_options: dict) -> Optional[pl.Series]:
+    """
+    Read distinct values of a column of a silver table used by a reference rule.
+
+    Returns:
+        Optional[pl.Series]: Distinct values. None if the reference table does not exist yet.
+    """
+    table_path = f"{azure_path}/silver/{reference_table}"
+    try:
+        deltalake.DeltaTable(table_path, storage_options=storage_options)
+    except deltalake.exceptions.TableNotFoundError:
+        logging.warning(f"Reference table {table_path} does not exist. Reference rules on {reference_table} are skipped")
+        return None
+
+    return pl.scan_delta(table_path, storage_options=storage_options).select(pl.col(reference_column).unique()).collect().to_series()
+
+
+def load_reference_values(rules: List[Dict[str, Any]], azure_path: str, storage_options: dict) -> Dict[Tuple[str, str], Optional[pl.Series]]:
+    """
+    Read values of every reference table used by the rules once.
+    """
+    references = {(rule['reference_table'], rule['reference_column']) for rule in rules if rule['type'] == 'reference'}
+    return {
+        (reference_table, reference_column): read_reference_values(azure_path, reference_table, reference_column, storage_options)
+        for reference_table, reference_column in references
+    }
+
+
+def create_rule_expression(rule: Dict[str, Any], dataset: pl.DataFrame, reference_values: Dict[Tuple[str, str], Optional[pl.Series]]) -> Optional[pl.Expr]:
+    """
+    Create the expression flagging rows failing a rule.
+
+    Returns:
+        Optional[pl.Expr]: True for failing rows. None if the rule cannot be evaluated and is skipped.
+    """
+    if rule['type'] == 'not_null':
+        return pl.any_horizontal([pl.col(column).is_null() for column in rule['columns']])
+    elif rule['type'] == 'unique':
+        ingest_columns = ['ingest_date'] if 'ingest_date' in dataset.columns else []
+        return pl.struct(rule['columns'] + ingest_columns).is_duplicated()
+    elif rule['type'] == 'range':
+        return pl.col(rule['column']).is_between(rule['min'], rule['max']).not_().fill_null(False)
+    elif rule['type'] == 'reference':
+        values = reference_values.get((rule['reference_table'], rule['reference_column']))
+        if values is None:
+            return None
+        values = values.drop_nulls().cast(dataset.schema[rule['column']], strict=False)
+        return pl.col(rule['column']).is_in(values.implode()).not_().fill_null(False)
+
+    error_msg = f"Data quality rule type - '{rule['type']}' does not exists"
+    logging.error(error_msg)
+    raise ValueError(error_msg)
+
+
+def create_load_order_expression(column_name: str) -> pl.Expr:
+    """
+    Create the expression ordering loads by a column. ingest_date is ddMMyyyy, as a string or an integer without the
+    leading zero, so it is compared as a date.
+    """
+    if column_name == 'ingest_date':
+        return pl.col(column_name).cast(pl.String).str.zfill(8).str.to_date('%d%m%Y', strict=False)
+    return pl.col(column_name)
+
+
+def keep_latest_load(dataset: pl.DataFrame, rules: List[Dict[str, Any]]) -> pl.DataFrame:
+    """
+    Keep the rows of the latest load of every key of the unique rules, so a row changed between two loaded bronze
+    versions is loaded once instead of failing the unique rule with every copy.
+
+    Args:
+        dataset (pl.DataFrame): Rows to be loaded into silver.
+        rules (List[Dict[str, Any]]): Rules of the data source.
+
+    Returns:
+        pl.DataFrame: Rows of the latest ingest_date and created_timestamp of every key.
+    """
+    order_columns = [column_name for column_name in LOAD_ORDER_COLUMNS if column_name in dataset.columns]
+    unique_rules = [rule for rule in rules if rule['type'] == 'unique']
+    if not order_columns or not unique_rules or dataset.is_empty():
+        return dataset
+
+    latest_df = dataset
+    for rule in unique_rules:
+        load_order = [create_load_order_expression(column_name) for column_name in order_columns]
+        latest_df = latest_df.filter(pl.all_horizontal([
+            (expression == expression.max().over(rule['columns'])).fill_null(True) for expression in load_order
+        ]))
+
+    if latest_df.height < dataset.height:
+        logging.info(f"{dataset.height - latest_df.height} rows superseded by a later load of the same key are not loaded")
+    return latest_df
+
+
+@instrument('transform')
+def validate_dataset(dataset: pl.DataFrame, data_source: str, file_date: str, reference_values: Dict[Tuple[str, str], Optional[pl.Series]]) -> Tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+    """
+    Evaluate every rule of a data source in one pass.
+
+    Args:
+        dataset (pl.DataFrame): Rows to be loaded into silver, after datatype conversion.
+        data_source (str): The value of data source to be processed.
+        file_date (str): The file date to be processed.
+        reference_values (Dict[Tuple[str, str], Optional[pl.Series]]): Values of reference tables from load_reference_values.
+
+    Returns:
+        Tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]: Rows passing every error rule, quarantined rows and rule metrics.
+    """
+    rules = QUALITY_RULES.get(data_source, [])
+    run_timestamp = datetime.now()
+    dataset = keep_latest_load(dataset, rules)
+
+    flags = {}
+    skipped_rules = []
+    for rule in rules:
+        expression = create_rule_expression(rule, dataset, reference_values)
+        if expression is None:
+            skipped_rules.append(rule)
+        else:
+            flags[f"__dq_{rule['name']}"] = (rule, expression)
+
+    error_flags = [flag for flag, (rule, _) in flags.items() if rule.get('severity', 'error') == 'error']
+    flagged = dataset.lazy().with_columns([expression.alias(flag) for flag, (_, expression) in flags.items()])
+    flagged = flagged.with_columns(
+        (pl.any_horizontal([pl.col(flag) for flag in error_flags]) if error_flags else pl.lit(False)).alias("__dq_quarantined")
+    ).collect()
+
+    failed_counts = flagged.select([pl.col(flag).sum() for flag in flags]).row(0, named=True) if flags else {}
+    metrics_df = pl.DataFrame([
+        {
+            'data_source': data_source,
+            'file_date': file_date,
+            'rule': rule['name'],
+            'rule_type': rule['type'],
+            'severity': rule.get('severity', 'error'),
+            'checked_rows': 0 if rule in skipped_rules else dataset.height,
+            'failed_rows': failed_counts.get(f"__dq_{rule['name']}", 0),
+            'status': 'skipped' if rule in skipped_rules else ('failed' if failed_counts.get(f"__dq_{rule['name']}", 0) else 'passed'),
+            'run_timestamp': run_timestamp
+        }
+        for rule in rules
+    ], schema={
+        'data_source': pl.String, 'file_date': pl.String, 'rule': pl.String, 'rule_type': pl.String, 'severity': pl.String,
+        'checked_rows': pl.Int64, 'failed_rows': pl.Int64, 'status': pl.String, 'run_timestamp': pl.Datetime("us")
+    })
+
+    flag_columns = list(flags) + ["__dq_quarantined"]
+    passed_df = flagged.filter(pl.col("__dq_quarantined").not_()).drop(flag_columns)
+    quarantine_df = (
+        flagged.filter(pl.col("__dq_quarantined"))
+        .select([
+            pl.lit(data_source).alias('data_source'),
+            pl.lit(file_date).alias('file_date'),
+            pl.concat_str(
+                [pl.when(pl.col(flag)).then(pl.lit(flag.removeprefix("__dq_"))) for flag in error_flags],
+                separator=',',
+                ignore_nulls=True
+            ).alias('failed_rules'),
+            pl.struct([column for column in dataset.columns]).struct.json_encode().alias('row'),
+            pl.lit(run_timestamp).cast(pl.Datetime("us")).alias('quarantined_timestamp')
+        ])
+    )
+
+    logging.info(f"Data quality of {data_source}: {passed_df.height} rows passed, {quarantine_df.height} rows quarantined")
+    for metric in metrics_df.filter(pl.col('status') != 'passed').iter_rows(named=True):
+        logging.warning(f"Data quality rule {metric['rule']} of {data_source} {metric['status']} with {metric['failed_rows']} of {metric['checked_rows']} rows")
+
+    return passed_df, quarantine_df, metrics_df
+
+
+@instrument('write')
+def write_quality_results(quarantine_df: pl.DataFrame, metrics_df: pl.DataFrame, azure_path: str, storage_options: dict) -> None:
+    """
+    Append quarantined rows and rule metrics into quality delta tables.
+
+    Args:
+        quarantine_df (pl.DataFrame): Quarantined rows from validate_dataset.
+        metrics_df (pl.DataFrame): Rule metrics from validate_dataset.
+        azure_path (str): The root path of the storage backend.
+        storage_options (dict): Credentials to access ADLS2.
+    """
+    if not quarantine_df.is_empty():
+        quarantine_path = f"{azure_path}/{QUARANTINE_TABLE}"
+        quarantine_df.write_delta(quarantine_path, mode="append", storage_options=storage_options)
+        logging.info(f"{quarantine_df.height} rows have been inserted into {QUARANTINE_TABLE}")
+
+    if not metrics_df.is_empty():
+        metrics_path = f"{azure_path}/{RULE_METRICS_TABLE}"
+        version = write_delta_table(metrics_df, metrics_path, storage_options, mode="append")
+        record_delta_version(version)
+        logging.info(f"{metrics_df.height} rule metrics have been inserted into {RULE_METRICS_TABLE}")
+
+
+class QualityCollector:
+    """
+    Validate record batches one at a time, e.g. in streaming mode, and combine quarantined rows and rule metrics.
+    Uniqueness is only checked within a batch.
+    """
+
+    def __init__(self, data_source: str, file_date: str, reference_values: Dict[Tuple[str, str], Optional[pl.Series]]):
+        self.data_source = data_source
+        self.file_date = file_date
+        self.reference_values = reference_values
+        self.quarantine_frames: List[pl.DataFrame] = []
+        self.metrics_frames: List[pl.DataFrame] = []
+
+    def validate(self, dataset: pl.DataFrame) -> pl.DataFrame:
+        passed_df, quarantine_df, metrics_df = validate_dataset(dataset, self.data_source, self.file_date, self.reference_values)
+        if not quarantine_df.is_empty():
+            self.quarantine_frames.append(quarantine_df)
+        self.metrics_frames.append(metrics_df)
+        return passed_df
+
+    def results(self) -> Tuple[pl.DataFrame, pl.DataFrame]:
+        quarantine_df = pl.concat(self.quarantine_frames) if self.quarantine_frames else pl.DataFrame()
+        if not self.metrics_frames:
+            return quarantine_df, pl.DataFrame()
+
+        metrics_df = (
+            pl.concat(self.metrics_frames)
+            .group_by(['data_source', 'file_date', 'rule', 'rule_type', 'severity'], maintain_order=True)
+            .agg([
+                pl.col('checked_rows').sum(),
+                pl.col('failed_rows').sum(),
+                pl.col('status').min(),
+                pl.col('run_timestamp').first()
+            ])
+            .with_columns(
+                pl.when(pl.col('status') == 'skipped').then(pl.lit('skipped'))
+                .when(pl.col('failed_rows') > 0).then(pl.lit('failed'))
+                .otherwise(pl.lit('passed')).alias('status')
+            )
+            .select(['data_source', 'file_date', 'rule', 'rule_type', 'severity', 'checked_rows', 'failed_rows', 'status', 'run_timestamp'])
+        )
+        return quarantine_df, metrics_df
@@ -0,0 +1,49 @@
+from __future__ import annotations
+from typing import Optional
+from util.lazy_import import lazy_import
+
+pl = lazy_import('polars')
+deltalake = lazy_import('deltalake')
+
+"""
+Delta writes that return the committed version.
+
+Neither pl.DataFrame.write_delta nor deltalake.write_deltalake return the version of their commit. An existing
+table is opened once and written through the DeltaTable object, which is updated in place by the commit, so the
+version is known without reading the delta log again. The write itself would open the table anyway.
+A table created by the write is at version 0.
+"""
+
+
+def open_delta_table(table_path: str, storage_options: dict) -> Optional[deltalake.DeltaTable]:
+    """
+    Return the delta table at table_path. None when the table does not exist yet.
+    """
+    try:
+        return deltalake.DeltaTable(table_path, storage_options=storage_options)
+    except deltalake.exceptions.TableNotFoundError:
+        return None
+
+
+def write_delta_table(dataset: pl.DataFrame, table_path: str, storage_options: dict, mode: str, delta_write_options: Optional[dict] = None) -> int:
+    """
+    Write a dataframe into a delta table.
+
+    Args:
+        dataset (pl.DataFrame): Dataset to be written.
+        table_path (str): The path of the delta table.
+        storage_options (dict): Credentials to access ADLS2.
+        mode (str): Write mode of pl.DataFrame.write_delta, e.g. append or overwrite.
+        delta_write_options (Optional[dict]): Options passed to deltalake.write_deltalake.
+
+    Returns:
+        int: The version committed by the write.
+    """
+    delta_table = open_delta_table(table_path, storage_options)
+    dataset.write_delta(
+        table_path if delta_table is None else delta_table,
+        mode=mode,
+        storage_options=storage_options,
+        delta_write_options=delta_write_options
+    )
+    return 0 if delta_table is None else delta_table.version()
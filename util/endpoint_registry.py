@@ -0,0 +1,112 @@
+import os
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+"""
+Registry of Fantasy Premier League API endpoints extracted by util.extractor.
+
+An endpoint is declared with:
+    url_template - URL of the endpoint, {id} is replaced by every ID of the ID source
+    landing      - landing data source keyed to the key of the response holding its rows. None lands the whole
+                   response. Every data source is written as its own raw_fpl_<data_source>_<ingest_date> landing file.
+    id_source    - where the IDs of an endpoint with {id} come from, see ID_SOURCES
+    id_column    - column added to every row with the ID of the request, when the rows do not hold it already
+    rate_limit   - maximum number of requests per second to the endpoint
+    drop_keys    - keys removed from the rows of a data source
+To extract a new endpoint, add it to ENDPOINTS. Data sources also need a landing_to_staging data source to be loaded further.
+"""
+
+API_BASE_URL = 'https://fantasy.premierleague.com/api'
+
+
+@dataclass
+class Endpoint:
+    name: str
+    url_template: str
+    landing: Dict[str, Optional[str]]
+    id_source: Optional[str] = None
+    id_column: Optional[str] = None
+    rate_limit: float = 10.0
+    drop_keys: Dict[str, List[str]] = field(default_factory=dict)
+
+    def create_url(self, endpoint_id: Optional[Any] = None) -> str:
+        return self.url_template.format(base=API_BASE_URL, id=endpoint_id)
+
+
+@dataclass
+class IdSource:
+    # Data source whose rows hold the IDs, read from this run or from the latest landing file
+    data_source: Optional[str]
+    id_key: str = 'id'
+    row_filter: Callable[[Dict[str, Any]], bool] = lambda row: True
+    # IDs from settings instead of a data source
+    setting: Optional[str] = None
+
+
+ID_SOURCES = {
+    'players': IdSource('player_metadata'),
+    # Live data only exists for gameweeks that have started
+    'gameweeks': IdSource('events_metadata', row_filter=lambda row: bool(row.get('finished') or row.get('is_current'))),
+    'entries': IdSource(None, setting='FplEntryIds')
+}
+
+
+ENDPOINTS = {endpoint.name: endpoint for endpoint in [
+    Endpoint(
+        name='bootstrap_static',
+        url_template='{base}/bootstrap-static/',
+        landing={
+            'events_metadata': 'events',
+            'team_metadata': 'teams',
+            'player_metadata': 'elements',
+            'position_metadata': 'element_types'
+        },
+        rate_limit=1.0,
+        drop_keys={'position_metadata': ['sub_positions_locked']}
+    ),
+    Endpoint(
+        name='element_summary',
+        url_template='{base}/element-summary/{id}/',
+        landing={'current_season_history': 'history', 'history_past': 'history_past'},
+        id_source='players',
+        id_column='element',
+        rate_limit=20.0
+    ),
+    Endpoint(
+        name='fixtures',
+        url_template='{base}/fixtures/',
+        landing={'fixtures': None},
+        rate_limit=1.0
+    ),
+    Endpoint(
+        name='event_live',
+        url_template='{base}/event/{id}/live/',
+        landing={'event_live': 'elements'},
+        id_source='gameweeks',
+        id_column='event',
+        rate_limit=5.0
+    ),
+    Endpoint(
+        name='entry',
+        url_template='{base}/entry/{id}/',
+        landing={'entry': None},
+        id_source='entries',
+        rate_limit=5.0
+    )
+]}
+
+
+def get_endpoint(name: str) -> Endpoint:
+    if name not in ENDPOINTS:
+        error_msg = f"Endpoint - '{name}' does not exists. Input could be either {' or '.join(ENDPOINTS)}"
+        logging.error(error_msg)
+        raise ValueError(error_msg)
+    return ENDPOINTS[name]
+
+
+def get_setting_ids(id_source: IdSource) -> List[str]:
+    """
+    Return IDs given in a comma separated setting, e.g. FplEntryIds=123,456.
+    """
+    return [value.strip() for value in (os.getenv(id_source.setting) or '').split(',') if value.strip()]
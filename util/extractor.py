@@ -0,0 +1,363 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from util.common_func import convert_timestamp_to_myt_date
+from util.compression import API_HEADERS, compress, decompress, get_content_encoding, get_landing_file_name, get_transfer_size
+from util.endpoint_registry import ID_SOURCES, Endpoint, get_endpoint, get_setting_ids
+from util.instrumentation import instrument, record_metrics
+from util.async_storage import write_many
+from util.column_profiles import DEFAULT_COLUMN_PROFILE, project_rows
+
+"""
+Extractor engine of the endpoints in util.endpoint_registry.
+
+Every request of every endpoint goes through one requests session with a connection pool of ExtractorWorkers
+connections, and ExtractorWorkers requests are in flight at a time across all endpoints. Each endpoint is held
+to its own rate limit, shared by every extraction of the instance. Failed requests with status 429 or 5xx are retried with backoff, honouring Retry-After.
+Endpoints without ID source are fetched first, so endpoints with IDs can use the rows of the same run, e.g.
+element_summary uses player_metadata from bootstrap_static. When the rows are not in the run, the IDs are read from
+the latest landing file of the data source.
+Column profiles of util.column_profiles are applied before rows are landed. Every extraction writes a manifest to
+manifest/extract/ with the landing file, rows, bytes, column profile and fields left out of every data source.
+"""
+
+DEFAULT_WORKERS = 8
+MANIFEST_FOLDER = 'manifest/extract'
+REQUEST_TIMEOUT_SECONDS = 60
+REQUEST_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.5
+
+_session = None
+_session_lock = threading.Lock()
+_rate_limiters: Dict[str, 'RateLimiter'] = {}
+
+
+def get_extractor_workers() -> int:
+    return max(int(os.getenv("ExtractorWorkers") or DEFAULT_WORKERS), 1)
+
+
+def create_session(pool_size: int) -> requests.Session:
+    """
+    Create a session with a connection pool of pool_size connections and retries on throttling and server errors.
+    """
+    retry = Retry(
+        total=REQUEST_RETRIES,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET'],
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(API_HEADERS)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Return the session shared by every extraction of this instance, so connections are kept alive across invocations.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session(get_extractor_workers())
+    return _session
+
+
+class RateLimiter:
+    """
+    Space requests to an endpoint so no more than rate_limit requests per second are started.
+    """
+
+    def __init__(self, rate_limit: float):
+        self.interval = 1.0 / rate_limit if rate_limit > 0 else 0.0
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait_seconds = self._next_time - now
+            self._next_time = max(self._next_time, now) + self.interval
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+
+def get_rate_limiter(endpoint: Endpoint) -> RateLimiter:
+    """
+    Return the rate limiter of an endpoint. It is shared by every extraction of this instance, e.g. concurrent shard workers.
+    """
+    with _session_lock:
+        if endpoint.name not in _rate_limiters:
+            _rate_limiters[endpoint.name] = RateLimiter(endpoint.rate_limit)
+    return _rate_limiters[endpoint.name]
+
+
+def fetch_json(session: requests.Session, url: str, rate_limiter: RateLimiter) -> Tuple[Optional[Any], int]:
+    """
+    Fetch a JSON response.
+
+    Returns:
+        Tuple[Optional[Any], int]: The response, None if the request has failed, and the bytes received on the wire.
+    """
+    rate_limiter.acquire()
+    try:
+        response = session.get(url, stream=True, timeout=REQUEST_TIMEOUT_SECONDS)
+        if response.status_code != 200:
+            logging.warning(f"Request {url} returned status {response.status_code}")
+            return None, 0
+        data = response.json()
+        return data, get_transfer_size(response) or 0
+    except Exception as e:
+        logging.error(f"Request {url} failed: {str(e)}")
+        return None, 0
+
+
+def extract_rows(endpoint: Endpoint, response: Any, endpoint_id: Optional[Any], data_sources: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Split a response into the rows of each landing data source of the endpoint.
+    """
+    rows_by_source = {}
+    for data_source in data_sources:
+        response_key = endpoint.landing[data_source]
+        rows = response if response_key is None else response.get(response_key, [])
+        rows = rows if isinstance(rows, list) else [rows]
+        drop_keys = endpoint.drop_keys.get(data_source, [])
+        if drop_keys or endpoint.id_column:
+            rows = [
+                {
+                    **({endpoint.id_column: endpoint_id} if endpoint.id_column and endpoint.id_column not in row else {}),
+                    **{key: value for key, value in row.items() if key not in drop_keys}
+                }
+                for row in rows
+            ]
+        rows_by_source[data_source] = rows
+    return rows_by_source
+
+
+def parse_file_date(path: str, file_prefix: str) -> Optional[datetime]:
+    """
+    Parse the ddMMyyyy date following the prefix in a landing or archive file name, e.g. 17022025 of
+    landing/raw_fpl_team_metadata_17022025_2025-02-17 10:00:00.json.gz. None with a warning when the date is
+    missing or not ddMMyyyy, e.g. a file named with a yyyyMMdd date.
+    """
+    match = re.match(rf"{re.escape(file_prefix)}(\d{{8}})_", os.path.basename(path))
+    if match:
+        try:
+            file_date = datetime.strptime(match.group(1), '%d%m%Y')
+            # A yyyyMMdd date can parse as ddMMyyyy with a year like 0125
+            if file_date.year >= 2000:
+                return file_date
+        except ValueError:
+            pass
+    logging.warning(f"File {path} has no ddMMyyyy date after {file_prefix} and is skipped")
+    return None
+
+
+def find_latest_landing_path(landing_paths: List[str], file_prefix: str) -> Optional[str]:
+    """
+    Find the latest landing file with a prefix. File dates are ddMMyyyy, so they are compared as dates, and files
+    of a date are ordered by the timestamp after the date. Files without a valid date are skipped.
+
+    Args:
+        landing_paths (List[str]): Paths listed from the landing folder.
+        file_prefix (str): The prefix of the file name. Example value is raw_fpl_player_metadata_.
+
+    Returns:
+        Optional[str]: Path of the latest file. None if there is no file with the prefix.
+    """
+    landing_files = []
+    for path in landing_paths:
+        if not path.startswith(f"landing/{file_prefix}"):
+            continue
+        file_date = parse_file_date(path, file_prefix)
+        if file_date is not None:
+            landing_files.append((file_date, path))
+    return max(landing_files)[1] if landing_files else None
+
+
+def read_latest_landing_rows(storage, data_source: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Read rows of the latest landing file of a data source. None if there is no landing file.
+    """
+    landing_path = find_latest_landing_path(storage.list('landing'), f"raw_fpl_{data_source}_")
+    if landing_path is None:
+        return None
+    content = decompress(storage.read_bytes(landing_path))
+    return [json.loads(line) for line in content.decode().splitlines() if line.strip()]
+
+
+def resolve_ids(endpoint: Endpoint, rows_by_source: Dict[str, List[Dict[str, Any]]], storage) -> List[Any]:
+    """
+    Resolve the IDs of an endpoint from its ID source.
+
+    Args:
+        endpoint (Endpoint): The endpoint.
+        rows_by_source (Dict[str, List[Dict[str, Any]]]): Rows extracted in this run keyed by data source.
+        storage: The storage backend from util.storage, used when the rows are not in this run.
+
+    Returns:
+        List[Any]: The IDs.
+    """
+    id_source = ID_SOURCES[endpoint.id_source]
+    if id_source.setting:
+        return get_setting_ids(id_source)
+
+    rows = rows_by_source.get(id_source.data_source)
+    if rows is None and storage is not None:
+        rows = read_latest_landing_rows(storage, id_source.data_source)
+    if rows is None:
+        error_msg = f"No {id_source.data_source} rows to find IDs of endpoint {endpoint.name}"
+        logging.error(error_msg)
+        raise ValueError(error_msg)
+    return [row[id_source.id_key] for row in rows if id_source.row_filter(row)]
+
+
+@instrument('extract')
+def fetch_endpoints(endpoint_names: List[str], storage=None, ids: Optional[Dict[str, List[Any]]] = None, data_sources: Optional[List[str]] = None, workers: Optional[int] = None, failed_ids: Optional[Dict[str, List[Any]]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Fetch every request of the endpoints concurrently over the shared session.
+
+    Args:
+        endpoint_names (List[str]): Names of endpoints in the registry.
+        storage: The storage backend from util.storage, used to read IDs when their rows are not fetched in this run.
+        ids (Optional[Dict[str, List[Any]]]): IDs keyed by endpoint name, used instead of the ID source.
+        data_sources (Optional[List[str]]): Data sources to be kept. Every data source of the endpoints is kept when not supplied.
+        workers (Optional[int]): Number of requests in flight. ExtractorWorkers is used when not supplied.
+        failed_ids (Optional[Dict[str, List[Any]]]): When supplied, IDs of failed requests are added keyed by endpoint name.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: Rows keyed by data source. Rows of an endpoint with IDs are in the order of the IDs.
+    """
+    endpoints = [get_endpoint(name) for name in endpoint_names]
+    ids = ids or {}
+    session = get_session()
+    rows_by_source: Dict[str, List[Dict[str, Any]]] = {}
+    transfer_size = 0
+
+    # Endpoints without ID source first, their rows can be the ID source of the others
+    waves = [
+        [endpoint for endpoint in endpoints if endpoint.id_source is None and endpoint.name not in ids],
+        [endpoint for endpoint in endpoints if endpoint.id_source is not None or endpoint.name in ids]
+    ]
+    with ThreadPoolExecutor(max_workers=workers or get_extractor_workers()) as executor:
+        for wave in waves:
+            requests_by_endpoint = []
+            for endpoint in wave:
+                endpoint_ids = ids.get(endpoint.name)
+                if endpoint_ids is None:
+                    endpoint_ids = resolve_ids(endpoint, rows_by_source, storage) if endpoint.id_source else [None]
+                rate_limiter = get_rate_limiter(endpoint)
+                futures = [(endpoint_id, executor.submit(fetch_json, session, endpoint.create_url(endpoint_id), rate_limiter)) for endpoint_id in endpoint_ids]
+                requests_by_endpoint.append((endpoint, futures))
+                logging.info(f"Fetching {len(futures)} requests of endpoint {endpoint.name}")
+
+            for endpoint, futures in requests_by_endpoint:
+                endpoint_sources = [source for source in endpoint.landing if data_sources is None or source in data_sources]
+                for data_source in endpoint_sources:
+                    rows_by_source.setdefault(data_source, [])
+                endpoint_failed_ids = []
+                for endpoint_id, future in futures:
+                    response, size = future.result()
+                    transfer_size += size
+                    if response is None:
+                        endpoint_failed_ids.append(endpoint_id)
+                        continue
+                    for data_source, rows in extract_rows(endpoint, response, endpoint_id, endpoint_sources).items():
+                        rows_by_source[data_source].extend(rows)
+                if endpoint_failed_ids:
+                    logging.warning(f"{len(endpoint_failed_ids)} of {len(futures)} requests of endpoint {endpoint.name} failed")
+                    if failed_ids is not None:
+                        failed_ids.setdefault(endpoint.name, []).extend(endpoint_failed_ids)
+                logging.info(f"Endpoint {endpoint.name} has been extracted")
+
+    record_metrics(bytes=transfer_size)
+    logging.info(f"Extracted {', '.join(f'{source} ({len(rows)} rows)' for source, rows in rows_by_source.items())}. Received {transfer_size} bytes")
+    return rows_by_source
+
+
+@instrument('write')
+def land_rows(ingest_date: str, storage, rows_by_source: Dict[str, List[Dict[str, Any]]], manifest: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Write the rows of every data source as a JSONL landing file, compressed with LandingCompression, in parallel.
+
+    Args:
+        ingest_date (str): The ingest date to be used in the file name.
+        storage: The storage backend from util.storage.
+        rows_by_source (Dict[str, List[Dict[str, Any]]]): Rows keyed by data source.
+        manifest (Optional[Dict[str, Dict[str, Any]]]): Details of every data source, e.g. column profile. When supplied,
+                                                      a manifest with landing file, rows and bytes added is written after the files.
+
+    Returns:
+        Dict[str, Tuple[str, List[Dict[str, Any]]]]: Landing file name and rows keyed by data source.
+    """
+    current_timestamp = convert_timestamp_to_myt_date()
+    landing_files = {}
+    landing_contents = {}
+    for data_source, rows in rows_by_source.items():
+        landing_file_name = get_landing_file_name(f"raw_fpl_{data_source}_{ingest_date}_{current_timestamp}.json")
+        landing_contents[f"landing/{landing_file_name}"] = compress("".join(json.dumps(row) + '\n' for row in rows).encode())
+        landing_files[data_source] = (landing_file_name, rows)
+
+    write_many(storage, landing_contents, content_encoding=get_content_encoding())
+    record_metrics(bytes=sum(len(content) for content in landing_contents.values()))
+    logging.info(f"Files have been uploaded to {list(landing_contents)}")
+
+    if manifest is not None:
+        # Written after the landing files, so every file in a manifest exists
+        manifest_sources = {
+            data_source: {
+                'landing_file': landing_file_name,
+                'rows': len(rows),
+                'bytes': len(landing_contents[f"landing/{landing_file_name}"]),
+                **manifest.get(data_source, {})
+            }
+            for data_source, (landing_file_name, rows) in landing_files.items()
+        }
+        manifest_path = f"{MANIFEST_FOLDER}/extract_{ingest_date}_{current_timestamp}.json"
+        manifest_content = {'ingest_date': ingest_date, 'created_timestamp': current_timestamp, 'sources': manifest_sources}
+        storage.write_bytes(manifest_path, json.dumps(manifest_content, indent=2).encode())
+        logging.info(f"Extraction manifest has been uploaded to {manifest_path}")
+
+    return landing_files
+
+
+def extract_endpoints(ingest_date: str, storage, endpoint_names: List[str], ids: Optional[Dict[str, List[Any]]] = None, data_sources: Optional[List[str]] = None, column_profiles: Optional[Dict[str, str]] = None, rows_by_source: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> Dict[str, Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Fetch the endpoints and land every data source that has rows, projected to its column profile.
+    column_profiles holds the profile of a data source from util.column_profiles, full when not given.
+    rows_by_source holds rows of the endpoints fetched before, e.g. by the pipeline scheduler, which are landed
+    without fetching the endpoints again.
+
+    Returns:
+        Dict[str, Tuple[str, List[Dict[str, Any]]]]: Landing file name and rows keyed by data source.
+        Empty if no request has succeeded.
+    """
+    if rows_by_source is None:
+        rows_by_source = fetch_endpoints(endpoint_names, storage, ids=ids, data_sources=data_sources)
+    rows_by_source = {data_source: rows for data_source, rows in rows_by_source.items() if rows}
+    if not rows_by_source:
+        logging.warning(f"No rows extracted from endpoints {endpoint_names}")
+        return {}
+
+    column_profiles = column_profiles or {}
+    manifest = {}
+    for data_source, rows in rows_by_source.items():
+        profile = column_profiles.get(data_source, DEFAULT_COLUMN_PROFILE)
+        rows_by_source[data_source], dropped_fields = project_rows(rows, data_source, profile)
+        manifest[data_source] = {'endpoints': endpoint_names, 'column_profile': profile, 'dropped_fields': dropped_fields}
+        if dropped_fields:
+            logging.info(f"Column profile {profile} of {data_source} leaves out {len(dropped_fields)} fields")
+    return land_rows(ingest_date, storage, rows_by_source, manifest=manifest)
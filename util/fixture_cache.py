@@ -0,0 +1,121 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+"""
+Cache of finished fixture rows of element-summary history.
+
+Once the data_checked flag of a gameweek is set in events, the history rows of its fixtures never change again.
+Those rows are kept in cache/player_history/ per season, keyed by element and fixture, and are not written to
+the landing file again. The daily landing file then only holds rows of unfinished and newly finished fixtures.
+"""
+
+CACHE_FOLDER = 'cache/player_history'
+
+FixtureKey = Tuple[int, int]
+
+
+def get_cache_path(season: str) -> str:
+    return f"{CACHE_FOLDER}/finished_fixtures_{season.replace('/', '_')}.json"
+
+
+def get_finished_rounds(events: Iterable[Dict[str, Any]]) -> Set[int]:
+    """
+    Get gameweeks whose data has been checked and will not change anymore.
+
+    Args:
+        events (Iterable[Dict[str, Any]]): Rows of events from bootstrap-static.
+
+    Returns:
+        Set[int]: The finished gameweeks.
+    """
+    return {event['id'] for event in events if event.get('data_checked')}
+
+
+def load_finished_fixture_cache(storage, season: str) -> Dict[FixtureKey, Dict[str, Any]]:
+    """
+    Load the finished fixture rows of a season.
+
+    Args:
+        storage: The storage backend from util.storage.
+        season (str): Season of the cache. Example value is 2024/2025.
+
+    Returns:
+        Dict[FixtureKey, Dict[str, Any]]: History rows keyed by element and fixture. Empty if there is no cache yet.
+    """
+    cache_path = get_cache_path(season)
+    if not storage.exists(cache_path):
+        logging.info(f"No finished fixture cache for season {season}")
+        return {}
+
+    cache = {}
+    for line in storage.read_bytes(cache_path).decode().splitlines():
+        if line.strip():
+            row = json.loads(line)
+            cache[(row['element'], row['fixture'])] = row
+    logging.info(f"Loaded {len(cache)} finished fixture rows for season {season}")
+    return cache
+
+
+def save_finished_fixture_cache(storage, season: str, cache: Dict[FixtureKey, Dict[str, Any]]) -> None:
+    """
+    Write the finished fixture rows of a season, ordered by element and fixture.
+
+    Args:
+        storage: The storage backend from util.storage.
+        season (str): Season of the cache.
+        cache (Dict[FixtureKey, Dict[str, Any]]): History rows keyed by element and fixture.
+    """
+    content = "".join(json.dumps(cache[key]) + '\n' for key in sorted(cache))
+    storage.write_bytes(get_cache_path(season), content.encode())
+    logging.info(f"Saved {len(cache)} finished fixture rows for season {season}")
+
+
+def filter_cached_rows(rows: List[Dict[str, Any]], cache: Dict[FixtureKey, Dict[str, Any]], finished_rounds: Set[int]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split history rows into rows to be written to landing and newly finished rows to be added to the cache.
+
+    Args:
+        rows (List[Dict[str, Any]]): History rows returned by element-summary.
+        cache (Dict[FixtureKey, Dict[str, Any]]): Finished fixture rows already cached.
+        finished_rounds (Set[int]): Gameweeks whose data has been checked.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]: Rows not in cache, and the newly finished rows among them.
+    """
+    new_rows = [row for row in rows if (row['element'], row['fixture']) not in cache]
+    newly_finished_rows = [row for row in new_rows if row['round'] in finished_rounds]
+    logging.info(
+        f"History rows - total: {len(rows)}, cached: {len(rows) - len(new_rows)}, "
+        f"newly finished: {len(newly_finished_rows)}, unfinished: {len(new_rows) - len(newly_finished_rows)}"
+    )
+    return new_rows, newly_finished_rows
+
+
+def apply_finished_fixture_cache(storage, season: str, rows: List[Dict[str, Any]], events: Optional[List[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], Optional[Dict[FixtureKey, Dict[str, Any]]]]:
+    """
+    Remove rows of cached finished fixtures and return the cache including the newly finished rows.
+    The cache is returned instead of saved, so it is only saved once the landing file has been written.
+
+    Args:
+        storage: The storage backend from util.storage.
+        season (str): Season of the rows.
+        rows (List[Dict[str, Any]]): History rows returned by element-summary.
+        events (Optional[List[Dict[str, Any]]]): Rows of events from bootstrap-static. Cache is not used when None.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], Optional[Dict[FixtureKey, Dict[str, Any]]]]: Rows to be written to landing and
+        the updated cache. The cache is None when there is nothing to be saved.
+    """
+    if events is None:
+        logging.warning("No events metadata to find finished gameweeks. Finished fixture cache is not used")
+        return rows, None
+
+    cache = load_finished_fixture_cache(storage, season)
+    new_rows, newly_finished_rows = filter_cached_rows(rows, cache, get_finished_rounds(events))
+    if not newly_finished_rows:
+        return new_rows, None
+
+    for row in newly_finished_rows:
+        cache[(row['element'], row['fixture'])] = row
+    return new_rows, cache
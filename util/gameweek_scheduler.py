@@ -0,0 +1,141 @@
+import json
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from util.common_func import convert_timestamp_to_myt_date
+
+"""
+Gameweek-aware scheduler of the pipeline.
+
+The plan of a scheduled run is decided from events and players of bootstrap-static and the state of the last
+scheduled run that has succeeded, kept in state/pipeline_scheduler.json:
+    full     - every stage. Planned when there is no state, the current gameweek has changed, a gameweek has newly
+               been data checked, or player points have changed while the current gameweek is in progress
+    metadata - extraction, the metadata sources up to silver, player profile and archive. Planned when prices, status,
+               news or points of players have changed outside a gameweek in progress, e.g. daily price changes
+    none     - no stage. Nothing tracked has changed since the last scheduled run
+Player changes are detected with a hash of PLAYER_CHANGE_FIELDS of every player. The state is only written once a
+scheduled run has succeeded, so a failed run is planned again.
+"""
+
+STATE_PATH = 'state/pipeline_scheduler.json'
+
+FULL_PLAN = 'full'
+METADATA_PLAN = 'metadata'
+NO_PLAN = 'none'
+
+PLAYER_CHANGE_FIELDS = [
+    'id', 'team', 'element_type', 'now_cost', 'status', 'news', 'chance_of_playing_next_round',
+    'chance_of_playing_this_round', 'total_points', 'event_points', 'minutes'
+]
+
+
+def parse_deadline_time(deadline_time: Optional[str]) -> Optional[datetime]:
+    if not deadline_time:
+        return None
+    return datetime.fromisoformat(deadline_time.replace('Z', '+00:00'))
+
+
+def hash_player_changes(players: List[Dict[str, Any]]) -> str:
+    """
+    Hash the tracked fields of every player, so a change of any of them gives a new hash.
+    """
+    tracked_rows = sorted(
+        ([player.get(field) for field in PLAYER_CHANGE_FIELDS] for player in players),
+        key=lambda row: str(row[0])
+    )
+    return hashlib.md5(json.dumps(tracked_rows, default=str).encode()).hexdigest()
+
+
+def read_scheduler_state(storage) -> Optional[Dict[str, Any]]:
+    """
+    Read the state of the last scheduled run that has succeeded. None if no scheduled run has succeeded yet.
+    """
+    if not storage.exists(STATE_PATH):
+        return None
+    return json.loads(storage.read_bytes(STATE_PATH))
+
+
+def write_scheduler_state(storage, run_plan: Dict[str, Any]) -> None:
+    """
+    Write the state of a scheduled run that has succeeded.
+
+    Args:
+        storage: The storage backend from util.storage.
+        run_plan (Dict[str, Any]): The plan from create_run_plan.
+    """
+    state = {
+        'plan': run_plan['plan'],
+        'current_gameweek': run_plan['current_gameweek'],
+        'checked_gameweeks': run_plan['checked_gameweeks'],
+        'player_hash': run_plan['player_hash'],
+        'updated_timestamp': convert_timestamp_to_myt_date()
+    }
+    storage.write_bytes(STATE_PATH, json.dumps(state, indent=2).encode())
+    logging.info(f"Scheduler state has been written to {STATE_PATH} for plan {run_plan['plan']}")
+
+
+def create_run_plan(events: List[Dict[str, Any]], players: List[Dict[str, Any]], state: Optional[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Decide which part of the pipeline needs to run.
+
+    Args:
+        events (List[Dict[str, Any]]): Rows of events from bootstrap-static.
+        players (List[Dict[str, Any]]): Rows of players from bootstrap-static.
+        state (Optional[Dict[str, Any]]): State of the last scheduled run from read_scheduler_state.
+        now (Optional[datetime]): Time the plan is made for. The current UTC time is used when not supplied.
+
+    Returns:
+        Dict[str, Any]: The plan (full, metadata or none), the reasons for it and the gameweek state it is based on.
+    """
+    now = now or datetime.now(timezone.utc)
+    current_events = [event for event in events if event.get('is_current')]
+    current_event = current_events[0] if current_events else None
+    current_gameweek = current_event['id'] if current_event else None
+    checked_gameweeks = sorted(event['id'] for event in events if event.get('data_checked'))
+    upcoming_deadlines = [
+        deadline for deadline in (parse_deadline_time(event.get('deadline_time')) for event in events if not event.get('finished'))
+        if deadline is not None and deadline > now
+    ]
+    next_deadline = min(upcoming_deadlines) if upcoming_deadlines else None
+    player_hash = hash_player_changes(players)
+
+    # A gameweek is in progress from its deadline until its data has been checked
+    current_deadline = parse_deadline_time(current_event.get('deadline_time')) if current_event else None
+    in_progress = bool(current_event and not current_event.get('data_checked') and (current_deadline is None or current_deadline <= now))
+    players_changed = state is None or state.get('player_hash') != player_hash
+
+    reasons = []
+    if state is None:
+        reasons.append("No previous scheduled run")
+    else:
+        if current_gameweek != state.get('current_gameweek'):
+            reasons.append(f"Current gameweek changed from {state.get('current_gameweek')} to {current_gameweek}")
+        newly_checked = sorted(set(checked_gameweeks) - set(state.get('checked_gameweeks', [])))
+        if newly_checked:
+            reasons.append(f"Gameweeks {newly_checked} have been data checked")
+        if in_progress and players_changed:
+            reasons.append(f"Gameweek {current_gameweek} is in progress and player points have changed")
+
+    if reasons:
+        plan = FULL_PLAN
+    elif players_changed:
+        plan = METADATA_PLAN
+        reasons.append("Player prices, status, news or points have changed")
+    else:
+        plan = NO_PLAN
+        reasons.append("Nothing has changed since the last scheduled run")
+
+    run_plan = {
+        'plan': plan,
+        'reasons': reasons,
+        'current_gameweek': current_gameweek,
+        'gameweek_in_progress': in_progress,
+        'next_deadline_time': next_deadline.isoformat() if next_deadline else None,
+        'checked_gameweeks': checked_gameweeks,
+        'player_hash': player_hash
+    }
+    logging.info(f"Scheduled run plan {plan}: {'; '.join(reasons)}")
+
+    return run_plan
@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import inspect
+import logging
+import tempfile
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+"""
+Per-step performance instrumentation.
+
+Read, transform and write steps are wrapped with the instrument decorator or the measure context manager.
+Every step emits one structured record with wall time, CPU time, row count, bytes, delta version written
+and peak resident memory of the process so far. Records are sent to the exporter selected by MetricsExporter:
+    log         - one logging.info line per step (default)
+    json        - JSON lines appended to MetricsJsonPath, used in tests and local runs
+    appinsights - Application Insights custom metrics, using APPLICATIONINSIGHTS_CONNECTION_STRING
+    none        - instrumentation disabled
+"""
+
+DEFAULT_METRICS_EXPORTER = 'log'
+DEFAULT_METRICS_JSON_FILE = 'fpl_metrics.jsonl'
+APP_INSIGHTS_TIMEOUT_SECONDS = 5
+
+# Arguments used as data source dimension of a step
+DATA_SOURCE_ARGUMENTS = ['data_source', 'data_source_type']
+
+_exporter = None
+_exporter_created = False
+_current_measurement: ContextVar[Optional['Measurement']] = ContextVar('current_measurement', default=None)
+
+
+class LogExporter:
+    def export(self, record: Dict[str, Any]) -> None:
+        logging.info(f"Metrics - {json.dumps(record)}")
+
+
+class JsonFileExporter:
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            with open(self.file_path, 'a') as metrics_file:
+                metrics_file.write(json.dumps(record) + '\n')
+
+
+class AppInsightsExporter:
+    """
+    Send custom metrics to the Application Insights ingestion endpoint. Every numeric value of a record
+    is sent as one metric, and the step details are sent as custom dimensions.
+    """
+
+    METRIC_NAMES = ['wall_ms', 'cpu_ms', 'rows', 'bytes', 'process_peak_memory_mb', 'freshness_p50_ms', 'freshness_p95_ms', 'freshness_max_ms', 'latency_p50_ms', 'latency_p99_ms', 'cache_hit_rate', 'cache_hits', 'cache_misses', 'bytes_saved']
+
+    def __init__(self, connection_string: str):
+        settings = dict(item.split('=', 1) for item in connection_string.split(';') if '=' in item)
+        self.instrumentation_key = settings['InstrumentationKey']
+        ingestion_endpoint = settings.get('IngestionEndpoint', 'https://dc.services.visualstudio.com')
+        self.track_url = f"{ingestion_endpoint.rstrip('/')}/v2/track"
+
+    def export(self, record: Dict[str, Any]) -> None:
+        import requests
+
+        properties = {key: str(value) for key, value in record.items() if key not in self.METRIC_NAMES and value is not None}
+        envelopes = [
+            {
+                'name': 'Microsoft.ApplicationInsights.Metric',
+                'time': record['timestamp'],
+                'iKey': self.instrumentation_key,
+                'data': {
+                    'baseType': 'MetricData',
+                    'baseData': {
+                        'ver': 2,
+                        'metrics': [{'name': f"fpl.{record['step']}.{metric_name}", 'value': record[metric_name], 'count': 1}],
+                        'properties': properties
+                    }
+                }
+            }
+            for metric_name in self.METRIC_NAMES if record.get(metric_name) is not None
+        ]
+        try:
+            requests.post(self.track_url, json=envelopes, timeout=APP_INSIGHTS_TIMEOUT_SECONDS)
+        except Exception as e:
+            logging.warning(f"Metrics cannot be sent to Application Insights: {str(e)}")
+
+
+def create_exporter(exporter_name: str):
+    """
+    Create the metrics exporter.
+
+    Args:
+        exporter_name (str): Either log, json, appinsights or none.
+
+    Returns:
+        Exporter with an export(record) method. Returns None when instrumentation is disabled.
+    """
+    if exporter_name == 'none':
+        return None
+    elif exporter_name == 'json':
+        return JsonFileExporter(os.getenv("MetricsJsonPath") or os.path.join(tempfile.gettempdir(), DEFAULT_METRICS_JSON_FILE))
+    elif exporter_name == 'appinsights':
+        connection_string = os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING")
+        if connection_string:
+            return AppInsightsExporter(connection_string)
+        logging.warning("APPLICATIONINSIGHTS_CONNECTION_STRING is not set. Metrics are written to log")
+    elif exporter_name != 'log':
+        logging.warning(f"Unknown metrics exporter '{exporter_name}'. Metrics are written to log")
+
+    return LogExporter()
+
+
+def get_exporter():
+    """
+    Return the metrics exporter of this instance. The exporter is created from MetricsExporter on first use.
+    """
+    global _exporter, _exporter_created
+    if not _exporter_created:
+        _exporter = create_exporter(os.getenv("MetricsExporter", DEFAULT_METRICS_EXPORTER))
+        _exporter_created = True
+    return _exporter
+
+
+def set_exporter(exporter) -> None:
+    """
+    Replace the metrics exporter, e.g. with JsonFileExporter in tests. None resets it to MetricsExporter.
+    """
+    global _exporter, _exporter_created
+    _exporter = exporter
+    _exporter_created = exporter is not None
+
+
+def get_process_peak_memory_mb() -> Optional[float]:
+    """
+    Return the peak resident memory of the process in MB since the process started, not of a single step.
+    Memory allocated by polars and pyarrow is included.
+    """
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def calculate_percentile(values: List[float], percentile: float, digits: int = 1) -> Optional[float]:
+    """
+    Return the nearest-rank percentile of values, e.g. 0.95 for p95 and 1.0 for the maximum. None if there is no value.
+
+    Args:
+        values (List[float]): Values such as latencies in ms.
+        percentile (float): The percentile between 0 and 1.
+        digits (int): Number of decimal digits the percentile is rounded to.
+
+    Returns:
+        Optional[float]: The percentile value.
+    """
+    if not values:
+        return None
+    sorted_values = sorted(values)
+    return round(sorted_values[min(int(len(sorted_values) * percentile), len(sorted_values) - 1)], digits)
+
+
+def describe_dataset(value: Any) -> Dict[str, Optional[int]]:
+    """
+    Count rows and bytes of a dataset. Polars dataframe, pyarrow table or record batch and list of rows are supported.
+    For a tuple, the first element is described, e.g. (dataframe, version).
+
+    Args:
+        value (Any): The dataset.
+
+    Returns:
+        Dict[str, Optional[int]]: Number of rows and in-memory bytes. Values are None when unknown.
+    """
+    if isinstance(value, tuple) and value:
+        return describe_dataset(value[0])
+    if hasattr(value, 'estimated_size'):
+        return {'rows': value.height, 'bytes': value.estimated_size()}
+    if hasattr(value, 'num_rows') and hasattr(value, 'nbytes'):
+        return {'rows': value.num_rows, 'bytes': value.nbytes}
+    if isinstance(value, (bytes, bytearray)):
+        return {'rows': None, 'bytes': len(value)}
+    if isinstance(value, list):
+        return {'rows': len(value), 'bytes': None}
+    return {'rows': None, 'bytes': None}
+
+
+class Measurement:
+    def __init__(self, function_name: str, operation: str, step: str, dimensions: Dict[str, Any]):
+        self.record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'function': function_name,
+            'operation': operation,
+            'step': step,
+            'status': 'succeeded',
+            'wall_ms': None,
+            'cpu_ms': None,
+            'rows': None,
+            'bytes': None,
+            'delta_version': None,
+            'process_peak_memory_mb': None
+        }
+        self.record.update(dimensions)
+
+    def observe(self, dataset: Any) -> None:
+        """
+        Record rows and bytes of a dataset read, transformed or written by the step.
+        """
+        for key, value in describe_dataset(dataset).items():
+            if value is not None:
+                self.record[key] = value
+
+    def set(self, **values: Any) -> None:
+        """
+        Record values such as rows, bytes or delta_version.
+        """
+        self.record.update(values)
+
+
+@contextmanager
+def measure(step: str, operation: str, function_name: Optional[str] = None, **dimensions: Any) -> Iterator[Optional[Measurement]]:
+    """
+    Measure a block of code and export its metrics.
+
+    Args:
+        step (str): The kind of step. Example values are extract, read, transform and write.
+        operation (str): The name of the operation.
+        function_name (Optional[str]): The name of the Azure function. Example value is landing_to_staging_3.
+        dimensions (Any): Extra dimensions such as data_source.
+
+    Yields:
+        Optional[Measurement]: Measurement of the block. None when instrumentation is disabled.
+    """
+    exporter = get_exporter()
+    if exporter is None:
+        yield None
+        return
+
+    measurement = Measurement(function_name, operation, step, dimensions)
+    token = _current_measurement.set(measurement)
+    start_time = time.perf_counter()
+    start_cpu_time = time.process_time()
+    try:
+        yield measurement
+    except Exception as e:
+        measurement.set(status='failed', error=str(e))
+        raise
+    finally:
+        _current_measurement.reset(token)
+        measurement.set(
+            wall_ms=round((time.perf_counter() - start_time) * 1000, 1),
+            cpu_ms=round((time.process_time() - start_cpu_time) * 1000, 1),
+            process_peak_memory_mb=get_process_peak_memory_mb()
+        )
+        try:
+            exporter.export(measurement.record)
+        except Exception as e:
+            logging.warning(f"Metrics of {operation} cannot be exported: {str(e)}")
+
+
+def instrument(step: str, dataset_arg: Optional[str] = None) -> Callable:
+    """
+    Decorator to measure a function as one step.
+    Rows and bytes are taken from the dataset argument when dataset_arg is set, otherwise from the return value.
+
+    Args:
+        step (str): The kind of step. Example values are extract, read, transform and write.
+        dataset_arg (Optional[str]): The name of the argument holding the dataset, e.g. for write steps.
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        function_name = func.__module__.split('.')[0]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if get_exporter() is None:
+                return func(*args, **kwargs)
+
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            dimensions = {name: arguments[name] for name in DATA_SOURCE_ARGUMENTS if isinstance(arguments.get(name), str)}
+            with measure(step, func.__name__, function_name, **dimensions) as measurement:
+                if dataset_arg is not None:
+                    measurement.observe(arguments.get(dataset_arg))
+                result = func(*args, **kwargs)
+                if dataset_arg is None:
+                    measurement.observe(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def record_metrics(**values: Any) -> None:
+    """
+    Record values on the step that is currently measured, e.g. bytes downloaded inside a decorated function.
+    Does nothing outside of a measured step.
+    """
+    measurement = _current_measurement.get()
+    if measurement is not None:
+        measurement.set(**values)
+
+
+def record_delta_version(version: Optional[int]) -> None:
+    """
+    Record the version of the delta table committed by the step that is currently measured.
+    The version comes from the write, e.g. util.delta_writer.write_delta_table, so the delta log is not read again.
+
+    Args:
+        version (Optional[int]): The version committed by the step. Nothing is recorded when None.
+    """
+    if version is not None:
+        record_metrics(delta_version=version)
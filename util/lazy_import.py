@@ -0,0 +1,44 @@
+import importlib
+import sys
+import types
+
+"""
+Lazy import of heavy dependencies.
+
+polars, pyarrow, deltalake, duckdb and the Azure SDK take seconds to import on a cold consumption plan
+instance. A module returned by lazy_import is only imported on first attribute access, so a function only
+pays for the dependencies used by the code path it runs. Annotations that refer to a lazy module must be
+quoted or postponed, otherwise the module is imported when the function is defined.
+"""
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name: str):
+        super().__init__(name)
+
+    def _load(self) -> types.ModuleType:
+        module = importlib.import_module(self.__name__)
+        # Attributes are cached on the proxy, so later access does not go through __getattr__
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Return a module that is imported on first attribute access.
+
+    Args:
+        name (str): The module name, e.g. polars or pyarrow.dataset.
+
+    Returns:
+        types.ModuleType: The module itself if it has already been imported, otherwise a lazy proxy.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -0,0 +1,223 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from util.storage import AdlsStorage
+from util.async_storage import read_many
+from util.instrumentation import record_metrics
+from util.lazy_import import lazy_import
+
+pl = lazy_import('polars')
+pa = lazy_import('pyarrow')
+pq = lazy_import('pyarrow.parquet')
+deltalake = lazy_import('deltalake')
+
+"""
+Local disk cache of delta data files for reads on warm instances.
+
+Data files of a delta table are never changed once written, so a file downloaded by one invocation can be read by
+every later invocation on the same instance. Only the delta log is read from ADLS2 to find the data files of the
+version. Files missing in the cache are downloaded in parallel with util.async_storage, and every file is read
+with memory mapping, so Arrow buffers point at the page cache instead of a copy on the heap.
+
+Files are keyed by their path in the container. ParquetCacheMaxMB caps the size of ParquetCacheDir and the least
+recently used files are evicted first. The modification time of a cached file is its last use, so the order
+survives a restart of the worker. Hits, misses and bytes not downloaded are recorded on the read step.
+Tables of the local and memory backends are already on local disk and are read with pl.read_delta. Tables with
+reader features such as deletion vectors or column mapping are read with pl.read_delta as well.
+ParquetCacheEnabled=false turns the cache off.
+"""
+
+DEFAULT_CACHE_MAX_MB = 1024
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'fpl_parquet_cache')
+# Reader features that do not change how data files are read, e.g. timestampNtz of naive datetime columns
+SUPPORTED_READER_FEATURES = {'timestampNtz', 'v2Checkpoint', 'vacuumProtocolCheck'}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class ParquetCache:
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0, 'bytes_downloaded': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_cache_path(self, path: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(path.encode()).hexdigest() + '.parquet')
+
+    def fetch(self, storage, paths: List[str]) -> Tuple[List[str], Dict[str, int]]:
+        """
+        Return local paths of data files, downloading the files missing in the cache.
+
+        Args:
+            storage: The storage backend from util.storage.
+            paths (List[str]): Paths of the data files in the container.
+
+        Returns:
+            Tuple[List[str], Dict[str, int]]: Paths of the cached files in the order of paths, and hits, misses and
+            bytes saved of this fetch.
+        """
+        cache_paths = [self.get_cache_path(path) for path in paths]
+        missing_paths = []
+        fetch_stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0}
+        with self._lock:
+            for path, cache_path in zip(paths, cache_paths):
+                if os.path.exists(cache_path):
+                    os.utime(cache_path)
+                    fetch_stats['hits'] += 1
+                    fetch_stats['bytes_saved'] += os.path.getsize(cache_path)
+                else:
+                    missing_paths.append(path)
+                    fetch_stats['misses'] += 1
+            for name, value in fetch_stats.items():
+                self.stats[name] += value
+
+        if missing_paths:
+            for path, content in zip(missing_paths, read_many(storage, missing_paths)):
+                cache_path = self.get_cache_path(path)
+                # Written to a temporary file first, so a concurrent reader never maps a partial file
+                temporary_path = f"{cache_path}.{threading.get_ident()}.tmp"
+                with open(temporary_path, 'wb') as cache_file:
+                    cache_file.write(content)
+                os.replace(temporary_path, cache_path)
+                with self._lock:
+                    self.stats['bytes_downloaded'] += len(content)
+            self.evict(keep=set(cache_paths))
+        return cache_paths, fetch_stats
+
+    def evict(self, keep: set) -> None:
+        """
+        Remove least recently used files until the cache fits in max_bytes. Files of the current read are kept.
+        """
+        with self._lock:
+            cached_files = []
+            for file_name in os.listdir(self.cache_dir):
+                if not file_name.endswith('.parquet'):
+                    continue
+                cache_path = os.path.join(self.cache_dir, file_name)
+                try:
+                    file_stat = os.stat(cache_path)
+                except FileNotFoundError:
+                    # Evicted by a worker process sharing the cache directory
+                    continue
+                cached_files.append((file_stat.st_mtime, file_stat.st_size, cache_path))
+
+            total_bytes = sum(size for _, size, _ in cached_files)
+            for _, size, cache_path in sorted(cached_files):
+                if total_bytes <= self.max_bytes:
+                    break
+                if cache_path in keep:
+                    continue
+                try:
+                    os.remove(cache_path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+                self.stats['evictions'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {**self.stats, 'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else None}
+
+
+def get_parquet_cache() -> Optional[ParquetCache]:
+    """
+    Return the cache of this instance. None when ParquetCacheEnabled is false.
+    """
+    global _cache
+    if (os.getenv("ParquetCacheEnabled") or 'true').lower() == 'false':
+        return None
+    with _cache_lock:
+        if _cache is None:
+            max_bytes = int(float(os.getenv("ParquetCacheMaxMB") or DEFAULT_CACHE_MAX_MB) * 1024 * 1024)
+            _cache = ParquetCache(os.getenv("ParquetCacheDir") or DEFAULT_CACHE_DIR, max_bytes)
+    return _cache
+
+
+def is_cached_backend(storage) -> bool:
+    return isinstance(storage, AdlsStorage)
+
+
+def is_supported_protocol(protocol) -> bool:
+    # Reader version 2 is column mapping, reader version 3 lists its reader features
+    if protocol.min_reader_version == 2:
+        return False
+    return set(protocol.reader_features or []) <= SUPPORTED_READER_FEATURES
+
+
+def read_cached_file(cache_path: str, partition_values: Dict[str, Any], schema: 'pa.Schema', columns: Optional[List[str]]) -> 'pa.Table':
+    """
+    Read a cached data file with memory mapping and conform it to the table schema.
+    Partition columns are not stored in data files and columns added later by schema evolution are missing in older files.
+    """
+    file_columns = set(pq.read_schema(cache_path, memory_map=True).names)
+    read_columns = [name for name in (columns or schema.names) if name in file_columns]
+    table = pq.read_table(cache_path, columns=read_columns, memory_map=True)
+    arrays = []
+    for field in (schema.field(name) for name in (columns or schema.names)):
+        if field.name in file_columns:
+            arrays.append(table.column(field.name).cast(field.type))
+        else:
+            arrays.append(pa.array([partition_values.get(field.name)] * table.num_rows).cast(field.type))
+    return pa.table(arrays, schema=pa.schema([schema.field(name) for name in (columns or schema.names)]))
+
+
+def read_delta_cached(storage, path: str, version: Optional[int] = None, columns: Optional[List[str]] = None) -> 'pl.DataFrame':
+    """
+    Read a delta table with its data files served from the local parquet cache.
+
+    Args:
+        storage: The storage backend from util.storage.
+        path (str): The path of the delta table in the container. Example value is bronze/current_season_history.
+        version (Optional[int]): The version of the delta table. The latest version is read when not supplied.
+        columns (Optional[List[str]]): Columns to be read. Every column is read when not supplied.
+
+    Returns:
+        pl.DataFrame: The delta table.
+    """
+    table_path = storage.table_uri(path)
+    cache = get_parquet_cache()
+    if cache is None or not is_cached_backend(storage):
+        dataset = pl.read_delta(table_path, version=version, storage_options=storage.storage_options)
+        return dataset.select(columns) if columns else dataset
+
+    delta_table = deltalake.DeltaTable(table_path, version=version, storage_options=storage.storage_options)
+    if not is_supported_protocol(delta_table.protocol()):
+        logging.info(f"Delta table {path} has reader features, it is read without the parquet cache")
+        dataset = pl.read_delta(table_path, version=version, storage_options=storage.storage_options)
+        return dataset.select(columns) if columns else dataset
+
+    partition_columns = delta_table.metadata().partition_columns
+    # Partition columns last, the column order of pl.read_delta
+    table_schema = pa.schema(delta_table.schema().to_arrow())
+    schema = pa.schema([field for field in table_schema if field.name not in partition_columns] + [table_schema.field(name) for name in partition_columns])
+    add_actions = pa.table(delta_table.get_add_actions(flatten=True)).to_pylist()
+    file_paths = [f"{path}/{add_action['path']}" for add_action in add_actions]
+
+    cache_paths, fetch_stats = cache.fetch(storage, file_paths)
+    tables = []
+    for file_path, cache_path, add_action in zip(file_paths, cache_paths, add_actions):
+        partition_values = {name: add_action.get(f"partition.{name}") for name in partition_columns}
+        try:
+            tables.append(read_cached_file(cache_path, partition_values, schema, columns))
+        except FileNotFoundError:
+            # Another worker process sharing the cache directory evicted the file between fetch and read
+            logging.info(f"Cached file of {file_path} was evicted before it was read, it is fetched again")
+            cache_path = cache.fetch(storage, [file_path])[0][0]
+            tables.append(read_cached_file(cache_path, partition_values, schema, columns))
+    table = pa.concat_tables(tables) if tables else schema.empty_table().select(columns or schema.names)
+
+    record_metrics(
+        cache_hits=fetch_stats['hits'],
+        cache_misses=fetch_stats['misses'],
+        bytes_saved=fetch_stats['bytes_saved'],
+        cache_hit_rate=cache.get_stats()['hit_rate']
+    )
+    logging.info(f"Read {len(file_paths)} data files of {path} at version {delta_table.version()}, {fetch_stats['hits']} from parquet cache")
+    return pl.from_arrow(table)
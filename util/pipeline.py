@@ -0,0 +1,263 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+"""
+In-process pipeline runner.
+
+Stages are run in dependency order in a single process. The output of a stage is kept in memory in the
+pipeline context, so the next stage can use it instead of re-reading what has just been persisted.
+Every stage still writes its own layer, so a stage can always fall back to reading storage when the output
+of its dependency is not in memory (e.g. the dependency was not selected for this run).
+"""
+
+DEFAULT_STAGE_RETRIES = 0
+RETRY_DELAY_SECONDS = 5
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[['PipelineContext'], Any]
+    depends_on: List[str] = field(default_factory=list)
+    retries: Optional[int] = None
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str
+    attempts: int = 0
+    duration_ms: float = 0.0
+    rows: Optional[int] = None
+    error: Optional[str] = None
+
+
+class PipelineContext:
+    """
+    State shared by all stages of a run: request parameters, clients and credentials created once per run,
+    and the in-memory output of every stage that has completed.
+    """
+
+    def __init__(self, params: Dict[str, Any]):
+        self.params = params
+        self.outputs: Dict[str, Any] = {}
+        self._resources: Dict[str, Any] = {}
+
+    def get_resource(self, name: str, factory: Callable[[], Any]) -> Any:
+        """
+        Return a resource such as credentials or a storage client. The resource is created on first use.
+
+        Args:
+            name (str): The name of the resource.
+            factory (Callable[[], Any]): Function that creates the resource.
+
+        Returns:
+            Any: The resource shared by all stages of the run.
+        """
+        if name not in self._resources:
+            self._resources[name] = factory()
+        return self._resources[name]
+
+    def get_output(self, stage_name: str) -> Any:
+        """
+        Return the in-memory output of a completed stage.
+
+        Args:
+            stage_name (str): The name of the stage.
+
+        Returns:
+            Any: Output of the stage. Returns None if the stage has not been run in this process.
+        """
+        return self.outputs.get(stage_name)
+
+
+def match_stage(stage_name: str, selection: List[str]) -> bool:
+    """
+    Check if a stage is selected. A selection matches the full stage name or the stage group before ':'.
+    Example: 'bronze_to_silver' selects every bronze_to_silver:<data source> stage.
+
+    Args:
+        stage_name (str): The name of the stage.
+        selection (List[str]): Selected stage names or groups.
+
+    Returns:
+        bool: True if the stage is selected.
+    """
+    return stage_name in selection or stage_name.split(':')[0] in selection
+
+
+def select_stages(stages: List[Stage], selection: Optional[List[str]] = None) -> List[Stage]:
+    """
+    Select stages to be run and sort them in dependency order.
+
+    Args:
+        stages (List[Stage]): All stages of the pipeline.
+        selection (Optional[List[str]]): Selected stage names or groups. All stages are selected when empty.
+
+    Returns:
+        List[Stage]: Selected stages where every stage comes after its dependencies.
+    """
+    stage_by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dependency in stage.depends_on:
+            if dependency not in stage_by_name:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'")
+
+    if selection:
+        unknown_selection = [name for name in selection if not any(match_stage(stage.name, [name]) for stage in stages)]
+        if unknown_selection:
+            raise ValueError(f"Unknown stages {unknown_selection}. Available stages are {list(stage_by_name)}")
+        selected_names = {stage.name for stage in stages if match_stage(stage.name, selection)}
+    else:
+        selected_names = set(stage_by_name)
+
+    ordered_stages = []
+    visited = set()
+    visiting = set()
+
+    def visit(stage: Stage) -> None:
+        if stage.name in visited:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Dependency cycle found at stage '{stage.name}'")
+        visiting.add(stage.name)
+        for dependency in stage.depends_on:
+            visit(stage_by_name[dependency])
+        visiting.remove(stage.name)
+        visited.add(stage.name)
+        if stage.name in selected_names:
+            ordered_stages.append(stage)
+
+    for stage in stages:
+        visit(stage)
+
+    return ordered_stages
+
+
+def count_rows(output: Any) -> Optional[int]:
+    """
+    Count rows of a stage output. For a tuple, rows of the first element are counted, e.g. (dataframe, version).
+
+    Args:
+        output (Any): Output of a stage.
+
+    Returns:
+        Optional[int]: Number of rows. Returns None if the output is not a dataframe, table or list.
+    """
+    if isinstance(output, tuple) and output:
+        output = output[0]
+    if hasattr(output, 'height'):
+        return output.height
+    if hasattr(output, 'num_rows'):
+        return output.num_rows
+    if isinstance(output, list):
+        return len(output)
+    return None
+
+
+def run_stage(stage: Stage, context: PipelineContext, retries: int) -> StageResult:
+    """
+    Run a stage and retry it when it fails.
+
+    Args:
+        stage (Stage): The stage to be run.
+        context (PipelineContext): The pipeline context.
+        retries (int): Number of retries when the stage does not define its own.
+
+    Returns:
+        StageResult: Result of the stage.
+    """
+    max_attempts = 1 + (stage.retries if stage.retries is not None else retries)
+    start_time = time.perf_counter()
+    result = StageResult(name=stage.name, status=FAILED)
+
+    for attempt in range(1, max_attempts + 1):
+        result.attempts = attempt
+        try:
+            logging.info(f"Running stage {stage.name}, attempt {attempt} of {max_attempts}")
+            output = stage.run(context)
+            context.outputs[stage.name] = output
+            result.status = SUCCEEDED
+            result.rows = count_rows(output)
+            result.error = None
+            break
+        except Exception as e:
+            result.error = str(e)
+            logging.error(f"Stage {stage.name} failed on attempt {attempt}: {str(e)}")
+            if attempt < max_attempts:
+                time.sleep(RETRY_DELAY_SECONDS * attempt)
+
+    result.duration_ms = (time.perf_counter() - start_time) * 1000
+    logging.info(f"Stage {stage.name} {result.status} in {result.duration_ms:.1f} ms")
+
+    return result
+
+
+def run_pipeline(stages: List[Stage], context: PipelineContext, selection: Optional[List[str]] = None, retries: int = DEFAULT_STAGE_RETRIES) -> List[StageResult]:
+    """
+    Run selected stages in dependency order. A stage is skipped when one of its dependencies failed or was skipped,
+    so a failure does not stop stages that do not depend on it.
+
+    Args:
+        stages (List[Stage]): All stages of the pipeline.
+        context (PipelineContext): The pipeline context.
+        selection (Optional[List[str]]): Selected stage names or groups. All stages are run when empty.
+        retries (int): Number of retries for stages that do not define their own.
+
+    Returns:
+        List[StageResult]: Result of every selected stage in the order they were run.
+    """
+    results = {}
+
+    for stage in select_stages(stages, selection):
+        blocked_by = [
+            dependency for dependency in stage.depends_on
+            if dependency in results and results[dependency].status != SUCCEEDED
+        ]
+        if blocked_by:
+            logging.warning(f"Skipping stage {stage.name} because {blocked_by} did not succeed")
+            results[stage.name] = StageResult(name=stage.name, status=SKIPPED, error=f"Dependency {', '.join(blocked_by)} did not succeed")
+            continue
+
+        results[stage.name] = run_stage(stage, context, retries)
+
+    return list(results.values())
+
+
+def summarize_results(results: List[StageResult]) -> Dict[str, Any]:
+    """
+    Create a run summary.
+
+    Args:
+        results (List[StageResult]): Result of every stage.
+
+    Returns:
+        Dict[str, Any]: Overall status, total duration and the result of every stage.
+    """
+    statuses = [result.status for result in results]
+    summary = {
+        'status': SUCCEEDED if all(status == SUCCEEDED for status in statuses) else FAILED,
+        'duration_ms': round(sum(result.duration_ms for result in results), 1),
+        'succeeded': statuses.count(SUCCEEDED),
+        'failed': statuses.count(FAILED),
+        'skipped': statuses.count(SKIPPED),
+        'stages': [
+            {
+                'name': result.name,
+                'status': result.status,
+                'attempts': result.attempts,
+                'duration_ms': round(result.duration_ms, 1),
+                'rows': result.rows,
+                'error': result.error
+            }
+            for result in results
+        ]
+    }
+
+    return summary
@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import threading
+import functools
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+"""
+Opt-in profiling of a function invocation.
+
+A sampling profiler records the Python stack of the invoking thread at a fixed interval. Time spent inside
+polars or deltalake native code is attributed to the Python function that called it, e.g.
+detect_new_or_changed_rows. Allocations are traced with tracemalloc. The collapsed stacks, the allocation
+statistics and a top-N summary are uploaded to diagnostics/profiles/<function>/<timestamp>/ in storage.
+
+Profiling is enabled with the 'profile' request parameter or the ProfilingEnabled setting. Overhead is
+controlled with these settings:
+    ProfilingSampleRate       - fraction of invocations profiled when enabled by setting (default 1.0)
+    ProfilingIntervalMs       - stack sampling interval in milliseconds (default 10)
+    ProfilingMaxSeconds       - sampling stops after this many seconds (default 300)
+    ProfilingTraceAllocations - trace allocations with tracemalloc (default true)
+    ProfilingTracemallocFrames - frames kept per allocation (default 1)
+    ProfilingTopN             - number of entries in the summary (default 20)
+    ProfilingOutputPath       - local folder for artefacts instead of storage, for local runs
+"""
+
+DIAGNOSTICS_FOLDER = 'diagnostics/profiles'
+DEFAULT_SAMPLE_INTERVAL_MS = 10
+DEFAULT_MAX_SECONDS = 300
+DEFAULT_TRACEMALLOC_FRAMES = 1
+DEFAULT_TOP_N = 20
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+class StackSampler:
+    """
+    Sample the stack of one thread from a background thread.
+    """
+
+    def __init__(self, thread_id: int, interval_seconds: float, max_seconds: float):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop_event.wait(self.interval_seconds):
+            if time.monotonic() > deadline:
+                logging.info(f"Profiling stopped sampling after {self.max_seconds} seconds")
+                break
+            sample_start = time.perf_counter()
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            self.sampling_seconds += time.perf_counter() - sample_start
+
+
+def is_profiling_requested(req_params: Optional[Dict[str, str]] = None) -> bool:
+    """
+    Check if the invocation should be profiled. The request parameter always enables profiling,
+    the ProfilingEnabled setting enables it for a fraction of invocations based on ProfilingSampleRate.
+
+    Args:
+        req_params (Optional[Dict[str, str]]): The request parameters.
+
+    Returns:
+        bool: True if the invocation should be profiled.
+    """
+    if req_params is not None and str(req_params.get('profile', '')).lower() in TRUE_VALUES:
+        return True
+    if os.getenv("ProfilingEnabled", 'false').lower() not in TRUE_VALUES:
+        return False
+    return random.random() < float(os.getenv("ProfilingSampleRate", 1.0))
+
+
+def summarize_stacks(stacks: Counter, top_n: int) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Summarize sampled stacks into the functions with the most self and inclusive samples.
+
+    Args:
+        stacks (Counter): Number of samples per collapsed stack.
+        top_n (int): Number of functions to be returned.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: Top functions by self samples and by inclusive samples.
+    """
+    total_samples = sum(stacks.values()) or 1
+    self_samples = Counter()
+    inclusive_samples = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        self_samples[frames[-1]] += count
+        for frame in set(frames):
+            inclusive_samples[frame] += count
+
+    def top(counter: Counter) -> List[Dict[str, Any]]:
+        return [
+            {'function': frame, 'samples': count, 'percent': round(count * 100 / total_samples, 1)}
+            for frame, count in counter.most_common(top_n)
+        ]
+
+    return {'top_self': top(self_samples), 'top_inclusive': top(inclusive_samples)}
+
+
+def summarize_allocations(snapshot: tracemalloc.Snapshot, top_n: int) -> List[Dict[str, Any]]:
+    """
+    Summarize allocations still alive at the end of the invocation by source line.
+
+    Args:
+        snapshot (tracemalloc.Snapshot): Snapshot taken at the end of the invocation.
+        top_n (int): Number of source lines to be returned.
+
+    Returns:
+        List[Dict[str, Any]]: Source lines with the largest allocated size.
+    """
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__)
+    ])
+    return [
+        {'location': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+        for stat in snapshot.statistics('lineno')[:top_n]
+    ]
+
+
+def upload_profile(function_name: str, artefacts: Dict[str, str]) -> str:
+    """
+    Write profile artefacts to diagnostics folder in storage, or to ProfilingOutputPath for local runs.
+
+    Args:
+        function_name (str): The name of the profiled function.
+        artefacts (Dict[str, str]): File name and content of each artefact.
+
+    Returns:
+        str: The folder the artefacts were written to.
+    """
+    folder = f"{DIAGNOSTICS_FOLDER}/{function_name}/{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}"
+    local_output_path = os.getenv("ProfilingOutputPath")
+
+    if local_output_path:
+        folder = os.path.join(local_output_path, folder)
+        os.makedirs(folder, exist_ok=True)
+        for file_name, content in artefacts.items():
+            with open(os.path.join(folder, file_name), 'w') as artefact_file:
+                artefact_file.write(content)
+    else:
+        from util.storage import get_storage
+        storage = get_storage()
+        for file_name, content in artefacts.items():
+            storage.write_bytes(f"{folder}/{file_name}", content.encode())
+
+    logging.info(f"Profile artefacts have been written to {folder}")
+    return folder
+
+
+def run_with_profiling(function_name: str, func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a function under the sampling profiler and allocation tracer, then write the profile artefacts.
+    Failure to write the artefacts is logged and never fails the invocation.
+
+    Args:
+        function_name (str): The name used in the diagnostics folder.
+        func (Callable): The function to be profiled.
+
+    Returns:
+        Any: The return value of the function.
+    """
+    interval_seconds = float(os.getenv("ProfilingIntervalMs", DEFAULT_SAMPLE_INTERVAL_MS)) / 1000
+    max_seconds = float(os.getenv("ProfilingMaxSeconds", DEFAULT_MAX_SECONDS))
+    trace_allocations = os.getenv("ProfilingTraceAllocations", 'true').lower() in TRUE_VALUES and not tracemalloc.is_tracing()
+    top_n = int(os.getenv("ProfilingTopN", DEFAULT_TOP_N))
+
+    sampler = StackSampler(threading.get_ident(), interval_seconds, max_seconds)
+    if trace_allocations:
+        tracemalloc.start(int(os.getenv("ProfilingTracemallocFrames", DEFAULT_TRACEMALLOC_FRAMES)))
+
+    start_time = time.perf_counter()
+    start_cpu_time = time.process_time()
+    sampler.start()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sampler.stop()
+        wall_seconds = time.perf_counter() - start_time
+        cpu_seconds = time.process_time() - start_cpu_time
+
+        summary = {
+            'function': function_name,
+            'wall_seconds': round(wall_seconds, 3),
+            'cpu_seconds': round(cpu_seconds, 3),
+            'samples': sampler.samples,
+            'sample_interval_ms': interval_seconds * 1000,
+            'sampling_overhead_percent': round(sampler.sampling_seconds * 100 / wall_seconds, 2) if wall_seconds else 0.0
+        }
+        summary.update(summarize_stacks(sampler.stacks, top_n))
+        artefacts = {'cpu_stacks.txt': '\n'.join(f"{stack} {count}" for stack, count in sampler.stacks.most_common())}
+
+        if trace_allocations:
+            snapshot = tracemalloc.take_snapshot()
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            summary['python_allocated_peak_kb'] = round(peak_bytes / 1024, 1)
+            summary['top_allocations'] = summarize_allocations(snapshot, top_n)
+            artefacts['allocations.txt'] = '\n'.join(str(stat) for stat in snapshot.statistics('lineno'))
+
+        artefacts['summary.json'] = json.dumps(summary, indent=2)
+        logging.info(f"Profile summary for {function_name}: {json.dumps({key: summary[key] for key in ['wall_seconds', 'cpu_seconds', 'samples']})}")
+        for entry in summary['top_inclusive'][:5]:
+            logging.info(f"Profile top function: {entry['function']} {entry['percent']}%")
+
+        try:
+            upload_profile(function_name, artefacts)
+        except Exception as e:
+            logging.warning(f"Profile artefacts cannot be written: {str(e)}")
+
+
+def profile_invocation(func: Callable) -> Callable:
+    """
+    Decorator for the main function of an Azure function. The invocation is profiled when
+    'profile=true' is supplied in the request or profiling is enabled by setting.
+    """
+    function_name = func.__module__.split('.')[0]
+
+    @functools.wraps(func)
+    def wrapper(req, *args, **kwargs):
+        if not is_profiling_requested(getattr(req, 'params', None)):
+            return func(req, *args, **kwargs)
+
+        logging.info(f"Profiling invocation of {function_name}")
+        return run_with_profiling(function_name, func, req, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,201 @@
+import logging
+from typing import Dict, List, Optional
+from util.lazy_import import lazy_import
+
+pl = lazy_import('polars')
+deltalake = lazy_import('deltalake')
+
+"""
+Encoding of silver columns.
+
+Low-cardinality strings, e.g. season, status or position names, are stored as strings in delta: delta tables have
+no dictionary type and delta-rs cannot write dictionary arrays. The parquet writer of delta-rs already writes string
+columns dictionary encoded (RLE_DICTIONARY), so a repeated value is stored once per row group. In memory, readers
+cast these columns to pl.Enum with the stable categories of get_category_mappings, so group-bys and joins work on
+integer codes and every process maps a value to the same code. Columns whose values change every season, such as
+team names, are cast to pl.Categorical. decode_categories casts them back to strings before a delta write.
+
+Flags and timestamps that silver used to keep as formatted strings are stored as Boolean, Int64, Date and Datetime,
+see get_silver_types. Silver tables written before have these columns as strings, align_silver_table rewrites
+such a table once with the typed columns before the next write.
+"""
+
+SEASON_FIRST_YEAR = 2000
+SEASON_LAST_YEAR = 2050
+CATEGORICAL_COLUMNS = ['name', 'short_name']
+
+
+def get_category_mappings() -> Dict[str, List[str]]:
+    """
+    Return the stable categories of low-cardinality silver columns. New values are only ever appended to a list,
+    so the code of an existing value never changes.
+    """
+    return {
+        'season': [f"{year}/{year + 1}" for year in range(SEASON_FIRST_YEAR, SEASON_LAST_YEAR)],
+        'status': ['a', 'd', 'i', 'n', 's', 'u'],
+        'singular_name': ['Goalkeeper', 'Defender', 'Midfielder', 'Forward', 'Manager'],
+        'singular_name_short': ['GKP', 'DEF', 'MID', 'FWD', 'AM'],
+        'plural_name': ['Goalkeepers', 'Defenders', 'Midfielders', 'Forwards', 'Managers'],
+        'plural_name_short': ['GKP', 'DEF', 'MID', 'FWD', 'AM']
+    }
+
+
+def get_silver_types(data_source: str) -> Dict[str, 'pl.DataType']:
+    """
+    Return the typed silver columns of a data source that bronze holds as strings.
+
+    Args:
+        data_source (str): The value of data source to be processed.
+
+    Returns:
+        Dict[str, pl.DataType]: Data type keyed by column.
+    """
+    inserted_timestamp = {'row_inserted_timestamp': pl.Datetime("us")}
+    manager_columns = {
+        f"mng_{column}": pl.Int64
+        for column in ['clean_sheets', 'draw', 'goals_scored', 'loss', 'underdog_draw', 'underdog_win', 'win']
+    }
+    silver_types = {
+        'current_season_history': {
+            'was_home': pl.Boolean,
+            'modified': pl.Boolean,
+            **manager_columns,
+            **inserted_timestamp
+        },
+        'player_metadata': {
+            'can_select': pl.Boolean,
+            'can_transact': pl.Boolean,
+            'has_temporary_code': pl.Boolean,
+            'in_dreamteam': pl.Boolean,
+            'removed': pl.Boolean,
+            'special': pl.Boolean,
+            'birth_date': pl.Date,
+            'team_join_date': pl.Date,
+            'news_added': pl.Datetime("us", "UTC"),
+            **manager_columns,
+            **inserted_timestamp
+        },
+        'team_metadata': {'unavailable': pl.Boolean, **inserted_timestamp},
+        'position_metadata': {'ui_shirt_specific': pl.Boolean, **inserted_timestamp}
+    }
+    profile_timestamps = {'inserted_timestamp': pl.Datetime("us"), 'updated_timestamp': pl.Datetime("us")}
+    silver_types['cdz2_player_profile'] = profile_timestamps
+    silver_types['cdz2_player_profile_scd2'] = {**profile_timestamps, 'valid_from': pl.Datetime("us")}
+    silver_types['past_season_history'] = silver_types['current_season_history']
+    silver_types['history_past'] = inserted_timestamp
+    return silver_types.get(data_source, {})
+
+
+def convert_string_column(column_name: str, dtype: 'pl.DataType') -> 'pl.Expr':
+    """
+    Convert a string column to its silver data type. 'null', the null value of staging, becomes null.
+    """
+    column = pl.col(column_name).replace("null", None)
+    if dtype == pl.Boolean:
+        return column.str.to_lowercase().replace_strict({'true': True, 'false': False}, default=None, return_dtype=pl.Boolean)
+    elif dtype == pl.Date:
+        return column.str.slice(0, 10).str.to_date("%Y-%m-%d", strict=False)
+    elif isinstance(dtype, pl.Datetime):
+        return column.str.to_datetime(time_unit="us", time_zone=dtype.time_zone, strict=False)
+    return column.cast(dtype, strict=False)
+
+
+def convert_silver_types(df: 'pl.DataFrame', data_source: str) -> 'pl.DataFrame':
+    """
+    Convert the string columns of a data source to their silver data types. Columns already typed are not changed.
+
+    Args:
+        df (pl.DataFrame): Dataset with columns converted by convert_column_datatype.
+        data_source (str): The value of data source to be processed.
+
+    Returns:
+        pl.DataFrame: Dataset with typed silver columns.
+    """
+    conversions = [
+        convert_string_column(column_name, dtype).alias(column_name)
+        for column_name, dtype in get_silver_types(data_source).items()
+        if df.schema.get(column_name) == pl.String
+    ]
+    return df.with_columns(conversions) if conversions else df
+
+
+def encode_categories(df: 'pl.DataFrame') -> 'pl.DataFrame':
+    """
+    Cast low-cardinality string columns to pl.Enum with their stable categories, or pl.Categorical for columns without.
+    A column with a value missing in its categories is cast to pl.Categorical, so a new value never fails a read.
+    """
+    category_mappings = get_category_mappings()
+    conversions = []
+    for column_name, dtype in df.schema.items():
+        if dtype != pl.String:
+            continue
+        if column_name in category_mappings:
+            categories = category_mappings[column_name]
+            if df.get_column(column_name).drop_nulls().is_in(categories).all():
+                conversions.append(pl.col(column_name).cast(pl.Enum(categories)))
+            else:
+                logging.warning(f"Column {column_name} has values missing in its categories. It is encoded as categorical")
+                conversions.append(pl.col(column_name).cast(pl.Categorical))
+        elif column_name in CATEGORICAL_COLUMNS:
+            conversions.append(pl.col(column_name).cast(pl.Categorical))
+    return df.with_columns(conversions) if conversions else df
+
+
+def decode_categories(df: 'pl.DataFrame') -> 'pl.DataFrame':
+    """
+    Cast pl.Enum and pl.Categorical columns back to strings, which delta-rs can write.
+    """
+    conversions = [
+        pl.col(column_name).cast(pl.String)
+        for column_name, dtype in df.schema.items()
+        if isinstance(dtype, (pl.Enum, pl.Categorical))
+    ]
+    return df.with_columns(conversions) if conversions else df
+
+
+def align_silver_table(table_path: str, storage_options: dict, data_source: str, app_id: Optional[str] = None) -> bool:
+    """
+    Rewrite a silver table whose typed columns are still strings, so rows with typed columns can be appended.
+    The table is rewritten once, later calls only read the schema.
+
+    Args:
+        table_path (str): The path of the silver delta table.
+        storage_options (dict): Credentials to access ADLS2.
+        data_source (str): The value of data source of the table.
+        app_id (Optional[str]): Transaction app id of the watermark of the table, kept in the rewrite commit.
+
+    Returns:
+        bool: True if the table has been rewritten.
+    """
+    try:
+        delta_table = deltalake.DeltaTable(table_path, storage_options=storage_options)
+    except deltalake.exceptions.TableNotFoundError:
+        return False
+
+    table_schema = pl.scan_delta(table_path, storage_options=storage_options).collect_schema()
+    string_columns = [
+        column_name for column_name, dtype in get_silver_types(data_source).items()
+        if table_schema.get(column_name) == pl.String and dtype != pl.String
+    ]
+    if not string_columns:
+        return False
+
+    watermark = delta_table.transaction_version(app_id) if app_id else None
+    commit_properties = None
+    if watermark is not None:
+        commit_properties = deltalake.CommitProperties(app_transactions=[deltalake.Transaction(app_id=app_id, version=watermark)])
+
+    dataset = convert_silver_types(pl.read_delta(table_path, storage_options=storage_options), data_source)
+    partition_columns = delta_table.metadata().partition_columns
+    dataset.write_delta(
+        table_path,
+        mode="overwrite",
+        storage_options=storage_options,
+        delta_write_options={
+            "schema_mode": "overwrite",
+            "commit_properties": commit_properties,
+            **({"partition_by": partition_columns} if partition_columns else {})
+        }
+    )
+    logging.info(f"Silver table {table_path} has been rewritten with typed columns {string_columns}")
+    return True
@@ -0,0 +1,213 @@
+import os
+import logging
+import tempfile
+import threading
+from typing import Dict, List, Optional
+from util.common_func import create_storage_options
+
+"""
+Storage backends used by every function.
+
+A backend covers file operations on the container (list, read, write, rename, delete) and the URI and
+storage options of delta tables. The backend is selected with the StorageBackend setting:
+    adls   - Azure Data Lake Storage Gen2 container (default)
+    local  - folder on local disk given by LocalStorageRoot, to run the whole pipeline on a laptop
+    memory - files kept in process memory, used in tests. Delta tables are written to a temporary folder
+             because delta-rs does not share an in-memory object store between table instances.
+All paths are relative to the container root, e.g. landing/raw_fpl_player_metadata_17022025.json or bronze/player_metadata.
+content_encoding of write_bytes is stored as Content-Encoding of the file in ADLS2 and ignored by the other backends.
+The adls backend connects with StorageConnectionString instead of DefaultAzureCredential when it is set.
+Operations that can run in parallel go through the async counterpart of a backend in util.async_storage.
+"""
+
+DEFAULT_LOCAL_STORAGE_ROOT = 'local_storage'
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+class AdlsStorage:
+    def __init__(self, account_name: str, container_name: str, account_url: Optional[str] = None, storage_options: Optional[dict] = None, connection_string: Optional[str] = None):
+        self.account_name = account_name
+        self.container_name = container_name
+        self.account_url = account_url or f"https://{account_name}.dfs.core.windows.net"
+        self.connection_string = connection_string
+        self.root_uri = f"abfss://{container_name}@{account_name}.dfs.core.windows.net"
+        self._storage_options = storage_options
+        self._file_system_client = None
+
+    @property
+    def storage_options(self) -> dict:
+        if self._storage_options is None:
+            self._storage_options = create_storage_options(os.getenv('KeyVault'))
+        return self._storage_options
+
+    @property
+    def file_system_client(self):
+        if self._file_system_client is None:
+            from azure.storage.filedatalake import DataLakeServiceClient
+            if self.connection_string:
+                service_client = DataLakeServiceClient.from_connection_string(self.connection_string)
+            else:
+                from azure.identity import DefaultAzureCredential
+                service_client = DataLakeServiceClient(account_url=self.account_url, credential=DefaultAzureCredential())
+            self._file_system_client = service_client.get_file_system_client(self.container_name)
+        return self._file_system_client
+
+    def table_uri(self, path: str) -> str:
+        return f"{self.root_uri}/{path}"
+
+    def list(self, prefix: str) -> List[str]:
+        from azure.core.exceptions import ResourceNotFoundError
+        try:
+            return [path.name for path in self.file_system_client.get_paths(path=prefix.rstrip('/')) if not path.is_directory]
+        except ResourceNotFoundError:
+            return []
+
+    def exists(self, path: str) -> bool:
+        return self.file_system_client.get_file_client(path).exists()
+
+    def read_bytes(self, path: str) -> bytes:
+        return self.file_system_client.get_file_client(path).download_file().readall()
+
+    def write_bytes(self, path: str, data: bytes, content_encoding: Optional[str] = None) -> None:
+        from azure.storage.filedatalake import ContentSettings
+        content_settings = ContentSettings(content_encoding=content_encoding) if content_encoding else None
+        self.file_system_client.get_file_client(path).upload_data(data, overwrite=True, content_settings=content_settings)
+
+    def rename(self, source_path: str, destination_path: str) -> None:
+        # Rename is a metadata operation in ADLS2 with hierarchical namespace, the file is not copied
+        directory = os.path.dirname(destination_path)
+        if directory:
+            self.file_system_client.create_directory(directory)
+        self.file_system_client.get_file_client(source_path).rename_file(f"{self.container_name}/{destination_path}")
+
+    def delete(self, path: str) -> None:
+        self.file_system_client.get_file_client(path).delete_file()
+
+
+class LocalStorage:
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.root_uri = self.root
+        self.storage_options = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    def _full_path(self, path: str) -> str:
+        return os.path.join(self.root, path)
+
+    def table_uri(self, path: str) -> str:
+        return f"{self.root_uri}/{path}"
+
+    def list(self, prefix: str) -> List[str]:
+        paths = []
+        for directory, _, file_names in os.walk(self._full_path(prefix)):
+            for file_name in file_names:
+                paths.append(os.path.relpath(os.path.join(directory, file_name), self.root).replace(os.sep, '/'))
+        return sorted(paths)
+
+    def exists(self, path: str) -> bool:
+        return os.path.isfile(self._full_path(path))
+
+    def read_bytes(self, path: str) -> bytes:
+        with open(self._full_path(path), 'rb') as source_file:
+            return source_file.read()
+
+    def write_bytes(self, path: str, data: bytes, content_encoding: Optional[str] = None) -> None:
+        full_path = self._full_path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as target_file:
+            target_file.write(data)
+
+    def rename(self, source_path: str, destination_path: str) -> None:
+        full_destination_path = self._full_path(destination_path)
+        os.makedirs(os.path.dirname(full_destination_path), exist_ok=True)
+        os.replace(self._full_path(source_path), full_destination_path)
+
+    def delete(self, path: str) -> None:
+        os.remove(self._full_path(path))
+
+
+class MemoryStorage:
+    def __init__(self, delta_root: Optional[str] = None):
+        self.files: Dict[str, bytes] = {}
+        self.root_uri = delta_root or tempfile.mkdtemp(prefix='fpl_memory_storage_')
+        self.storage_options = {}
+        self._lock = threading.Lock()
+
+    def table_uri(self, path: str) -> str:
+        return f"{self.root_uri}/{path}"
+
+    def list(self, prefix: str) -> List[str]:
+        prefix = prefix.rstrip('/') + '/' if prefix else ''
+        return sorted(path for path in self.files if path.startswith(prefix))
+
+    def exists(self, path: str) -> bool:
+        return path in self.files
+
+    def read_bytes(self, path: str) -> bytes:
+        return self.files[path]
+
+    def write_bytes(self, path: str, data: bytes, content_encoding: Optional[str] = None) -> None:
+        with self._lock:
+            self.files[path] = bytes(data)
+
+    def rename(self, source_path: str, destination_path: str) -> None:
+        with self._lock:
+            self.files[destination_path] = self.files.pop(source_path)
+
+    def delete(self, path: str) -> None:
+        with self._lock:
+            del self.files[path]
+
+
+def create_storage(backend_name: str):
+    """
+    Create a storage backend from settings.
+
+    Args:
+        backend_name (str): Either adls, local or memory.
+
+    Returns:
+        Storage backend.
+    """
+    if backend_name == 'adls':
+        return AdlsStorage(
+            os.getenv("StorageAccountName"),
+            os.getenv("StorageAccountContainer"),
+            account_url=os.getenv("DataLakeUrl"),
+            connection_string=os.getenv("StorageConnectionString")
+        )
+    elif backend_name == 'local':
+        return LocalStorage(os.getenv("LocalStorageRoot") or DEFAULT_LOCAL_STORAGE_ROOT)
+    elif backend_name == 'memory':
+        return MemoryStorage()
+
+    error_msg = f"Storage backend - '{backend_name}' does not exists. Input could be either adls or local or memory"
+    logging.error(error_msg)
+    raise ValueError(error_msg)
+
+
+def get_storage():
+    """
+    Return the storage backend of this instance. The backend is created from StorageBackend on first use
+    and shared by every function, so the memory backend keeps its files across stages of a run.
+
+    Returns:
+        Storage backend.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage(os.getenv("StorageBackend", "adls"))
+            logging.info(f"Using {type(_storage).__name__} storage backend")
+    return _storage
+
+
+def set_storage(storage) -> None:
+    """
+    Replace the storage backend, e.g. with MemoryStorage in tests. None resets it to StorageBackend.
+    """
+    global _storage
+    with _storage_lock:
+        _storage = storage
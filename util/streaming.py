@@ -0,0 +1,149 @@
+from __future__ import annotations
+import logging
+from typing import Callable, Iterator, Optional
+from util.lazy_import import lazy_import
+from util.delta_writer import open_delta_table
+
+pl = lazy_import('polars')
+pa = lazy_import('pyarrow')
+ds = lazy_import('pyarrow.dataset')
+deltalake = lazy_import('deltalake')
+
+"""
+Bounded memory execution between delta tables.
+
+Record batches are read from a pyarrow dataset, transformed one batch at a time with polars
+and streamed into the delta writer, so the whole table is never materialized in memory.
+The batch size is derived from a memory budget and the in-memory row size of a sample.
+"""
+
+DEFAULT_MEMORY_BUDGET_MB = 256
+
+# Copies of a batch alive at the same time: arrow batch from scan, polars frame, transformed frame and writer buffer
+BATCH_MEMORY_MULTIPLIER = 4
+
+MIN_BATCH_SIZE = 1_024
+MAX_BATCH_SIZE = 1_048_576
+
+
+def estimate_row_size(dataset: ds.Dataset, filter: Optional[ds.Expression] = None) -> int:
+    """
+    Estimate in-memory bytes per row from a sample of the dataset.
+    Parquet metadata is not used because dictionary encoded string columns are much smaller on disk than in memory.
+
+    Args:
+        dataset (ds.Dataset): The parquet dataset to be scanned.
+        filter (Optional[ds.Expression]): Filter pushed down into the scan.
+
+    Returns:
+        int: Estimated bytes per row. Returns 1 KB when the dataset has no rows.
+    """
+    sample = dataset.head(MIN_BATCH_SIZE, filter=filter)
+
+    if sample.num_rows == 0:
+        return 1_024
+
+    return max(sample.nbytes // sample.num_rows, 1)
+
+
+def calculate_batch_size(dataset: ds.Dataset, memory_budget_bytes: int, filter: Optional[ds.Expression] = None) -> int:
+    """
+    Calculate the number of rows per record batch that fits in the memory budget.
+
+    Args:
+        dataset (ds.Dataset): The parquet dataset to be scanned.
+        memory_budget_bytes (int): Memory budget for the batches in flight.
+        filter (Optional[ds.Expression]): Filter pushed down into the scan.
+
+    Returns:
+        int: Number of rows per record batch.
+    """
+    row_size = estimate_row_size(dataset, filter)
+    batch_size = memory_budget_bytes // (row_size * BATCH_MEMORY_MULTIPLIER)
+    batch_size = min(max(batch_size, MIN_BATCH_SIZE), MAX_BATCH_SIZE)
+    logging.info(f"Estimated row size {row_size} bytes. Using batch size {batch_size} rows for memory budget {memory_budget_bytes} bytes")
+
+    return batch_size
+
+
+def scan_batches(dataset: ds.Dataset, batch_size: int, filter: Optional[ds.Expression] = None) -> Iterator[pa.RecordBatch]:
+    """
+    Scan record batches from a dataset one fragment at a time without read ahead.
+    Threaded scan and parquet pre-buffering are disabled, otherwise the scanner decodes batches ahead of the consumer.
+
+    Args:
+        dataset (ds.Dataset): The parquet dataset to be scanned.
+        batch_size (int): Number of rows per record batch.
+        filter (Optional[ds.Expression]): Filter pushed down into the scan.
+
+    Returns:
+        Iterator[pa.RecordBatch]: Record batches from the dataset.
+    """
+    return dataset.to_batches(
+        batch_size=batch_size,
+        filter=filter,
+        batch_readahead=1,
+        fragment_readahead=1,
+        fragment_scan_options=ds.ParquetFragmentScanOptions(pre_buffer=False),
+        use_threads=False
+    )
+
+
+def transform_batches(batches: Iterator[pa.RecordBatch], transform: Callable[[pl.DataFrame], pl.DataFrame]) -> Optional[pa.RecordBatchReader]:
+    """
+    Apply a polars transformation to each record batch lazily.
+
+    Args:
+        batches (Iterator[pa.RecordBatch]): Source record batches.
+        transform (Callable[[pl.DataFrame], pl.DataFrame]): Transformation applied to each batch.
+
+    Returns:
+        Optional[pa.RecordBatchReader]: Reader over transformed batches. Returns None if there is no row in the source.
+    """
+    def transformed_batches() -> Iterator[pa.RecordBatch]:
+        for batch in batches:
+            if batch.num_rows == 0:
+                continue
+            yield from transform(pl.from_arrow(batch)).to_arrow().to_batches()
+
+    transformed = transformed_batches()
+    first_batch = next(transformed, None)
+    if first_batch is None:
+        return None
+
+    def all_batches() -> Iterator[pa.RecordBatch]:
+        yield first_batch
+        for batch in transformed:
+            yield batch.cast(first_batch.schema) if batch.schema != first_batch.schema else batch
+
+    return pa.RecordBatchReader.from_batches(first_batch.schema, all_batches())
+
+
+def write_batches_to_delta(reader: pa.RecordBatchReader, table_path: str, storage_options: dict, memory_budget_bytes: int, batch_size: int, commit_properties: Optional[deltalake.CommitProperties] = None) -> int:
+    """
+    Stream record batches into a delta table in a single commit.
+    Row groups are flushed every batch and parquet files are closed before the writer buffer grows beyond the memory budget.
+
+    Args:
+        reader (pa.RecordBatchReader): Record batches to be written.
+        table_path (str): The path of the target delta table.
+        storage_options (dict): Credentials to access ADLS2.
+        memory_budget_bytes (int): Memory budget for the batches in flight.
+        batch_size (int): Number of rows per record batch, used as parquet row group size.
+        commit_properties (Optional[deltalake.CommitProperties]): Commit properties such as watermark transaction.
+
+    Returns:
+        int: The version committed by the write.
+    """
+    delta_table = open_delta_table(table_path, storage_options)
+    deltalake.write_deltalake(
+        table_path if delta_table is None else delta_table,
+        reader,
+        mode="append",
+        storage_options=storage_options,
+        target_file_size=max(memory_budget_bytes // BATCH_MEMORY_MULTIPLIER, 1_048_576),
+        writer_properties=deltalake.WriterProperties(max_row_group_size=batch_size),
+        commit_properties=commit_properties
+    )
+    logging.info(f"Record batches have been streamed into {table_path}")
+    return 0 if delta_table is None else delta_table.version()
@@ -0,0 +1,264 @@
+from __future__ import annotations
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+from util.lazy_import import lazy_import
+
+pl = lazy_import('polars')
+pa = lazy_import('pyarrow')
+ds = lazy_import('pyarrow.dataset')
+deltalake = lazy_import('deltalake')
+
+"""
+Watermark store for incremental loads between delta tables.
+
+The last source version consumed by a target table is stored in the target table itself
+as a delta transaction identifier (app id + version). The watermark is committed in the same
+commit as the data, so a rerun for a source version that has already been consumed is a no-op.
+"""
+
+CDF_COLUMNS = ['_change_type', '_commit_version', '_commit_timestamp']
+
+
+def create_watermark_app_id(target_layer: str, data_source: str) -> str:
+    """
+    Create the transaction app id used to track the watermark of a target table.
+
+    Args:
+        target_layer (str): The layer of the target delta table. Example value is silver.
+        data_source (str): The value of data source to be processed.
+
+    Returns:
+        str: Transaction app id. Example value is silver/current_season_history.
+    """
+    return f"{target_layer}/{data_source}"
+
+
+def get_watermark(target_table_path: str, app_id: str, storage_options: dict) -> Optional[int]:
+    """
+    Get the last source delta version consumed by a target delta table.
+
+    Args:
+        target_table_path (str): The path of the target delta table.
+        app_id (str): The transaction app id of the watermark.
+        storage_options (dict): Credentials to access ADLS2.
+
+    Returns:
+        Optional[int]: The source version consumed by the target table. Returns None if the target
+                       table does not exist or has never been loaded incrementally.
+    """
+    try:
+        target_table = deltalake.DeltaTable(target_table_path, storage_options=storage_options)
+    except deltalake.exceptions.TableNotFoundError:
+        logging.info(f"Delta table {target_table_path} does not exist. No watermark found for {app_id}")
+        return None
+
+    watermark = target_table.transaction_version(app_id)
+    logging.info(f"Watermark for {app_id} is {watermark}")
+
+    return watermark
+
+
+def create_watermark_commit_properties(app_id: str, source_version: int) -> deltalake.CommitProperties:
+    """
+    Create commit properties that record the source version consumed by a target table commit.
+
+    Args:
+        app_id (str): The transaction app id of the watermark.
+        source_version (int): The source delta version consumed by the commit.
+
+    Returns:
+        CommitProperties: Commit properties to be passed to the delta writer.
+    """
+    return deltalake.CommitProperties(app_transactions=[deltalake.Transaction(app_id=app_id, version=source_version)])
+
+
+def commit_watermark(target_table_path: str, app_id: str, source_version: int, storage_options: dict, dataset: Optional[pl.DataFrame] = None) -> bool:
+    """
+    Commit the watermark of a target table without adding rows, e.g. when every new source row has been quarantined,
+    so the same source rows are not read again by the next load.
+
+    Args:
+        target_table_path (str): The path of the target delta table.
+        app_id (str): The transaction app id of the watermark.
+        source_version (int): The source delta version consumed.
+        storage_options (dict): Credentials to access ADLS2.
+        dataset (Optional[pl.DataFrame]): Rows with the schema of the target table, used to create the table when
+                                          it does not exist yet.
+
+    Returns:
+        bool: True if the watermark has been committed. False if the target table does not exist and no dataset is supplied.
+    """
+    try:
+        empty_table = deltalake.DeltaTable(target_table_path, storage_options=storage_options).to_pyarrow_dataset().schema.empty_table()
+    except deltalake.exceptions.TableNotFoundError:
+        if dataset is None:
+            logging.warning(f"Delta table {target_table_path} does not exist. Watermark {source_version} of {app_id} is not committed")
+            return False
+        empty_table = dataset.head(0).to_arrow()
+
+    deltalake.write_deltalake(
+        target_table_path,
+        empty_table,
+        mode="append",
+        storage_options=storage_options,
+        commit_properties=create_watermark_commit_properties(app_id, source_version)
+    )
+    logging.info(f"Watermark for {app_id} has been committed at source version {source_version} without rows")
+
+    return True
+
+
+def is_change_data_feed_enabled(delta_table: deltalake.DeltaTable) -> bool:
+    """
+    Check if change data feed is enabled for a delta table.
+
+    Args:
+        delta_table (DeltaTable): The source delta table.
+
+    Returns:
+        bool: True if the table property delta.enableChangeDataFeed is set to true.
+    """
+    configuration = delta_table.metadata().configuration
+    return configuration.get('delta.enableChangeDataFeed', 'false').lower() == 'true'
+
+
+def read_change_data_feed(delta_table: deltalake.DeltaTable, since_version: int, current_version: int) -> pl.DataFrame:
+    """
+    Read rows inserted into a delta table after a version by using the change data feed.
+
+    Args:
+        delta_table (DeltaTable): The source delta table.
+        since_version (int): The last version that has been consumed.
+        current_version (int): The version to read up to.
+
+    Returns:
+        pl.DataFrame: Rows inserted between since_version (exclusive) and current_version (inclusive).
+    """
+    change_reader = delta_table.load_cdf(starting_version=since_version + 1, ending_version=current_version)
+    change_df = pl.from_arrow(pa.table(change_reader))
+    inserted_df = change_df.filter(pl.col('_change_type') == 'insert').drop(CDF_COLUMNS)
+
+    return inserted_df
+
+
+def read_commit_actions(filesystem, version: int) -> List[dict]:
+    """
+    Read the actions of one commit of the delta log. The filesystem is the pyarrow filesystem of the table root.
+    """
+    with filesystem.open_input_stream(f"_delta_log/{version:020d}.json") as commit_file:
+        return [json.loads(line) for line in commit_file.read().decode().splitlines() if line.strip()]
+
+
+def get_files_added_since(delta_table: deltalake.DeltaTable, since_version: int, storage_options: dict, filesystem=None) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    Find the data files with rows added after a version from the commits of the delta log.
+    Only add actions with dataChange true are new rows. Files written by optimize or other rewrites have dataChange
+    false and hold rows that are already in other files, so they are left out. A file removed again with dataChange
+    true, e.g. by a delete or an overwrite, is left out, while a file removed by a later compaction is still read,
+    its rows have not been consumed yet.
+    When a commit file is missing, e.g. cleaned up after a checkpoint, the active files of both versions are compared.
+
+    Args:
+        delta_table (DeltaTable): The source delta table loaded at the version to read up to.
+        since_version (int): The last version that has been consumed.
+        storage_options (dict): Credentials to access ADLS2.
+        filesystem: The pyarrow filesystem of the table root. The filesystem of the table dataset is used when not supplied.
+
+    Returns:
+        Dict[str, Dict[str, Optional[str]]]: Partition values keyed by relative path of data files added after since_version.
+    """
+    filesystem = filesystem or delta_table.to_pyarrow_dataset().filesystem
+    added_files = {}
+    try:
+        for version in range(since_version + 1, delta_table.version() + 1):
+            for action in read_commit_actions(filesystem, version):
+                # Paths in the delta log are URL encoded, e.g. season=2024%2F2025
+                if 'add' in action and action['add'].get('dataChange', True):
+                    added_files[unquote(action['add']['path'])] = action['add'].get('partitionValues') or {}
+                elif 'remove' in action and action['remove'].get('dataChange', True):
+                    added_files.pop(unquote(action['remove']['path']), None)
+        return added_files
+    except FileNotFoundError as e:
+        logging.warning(f"Delta log of {delta_table.table_uri} cannot be read from version {since_version + 1}. Comparing active files instead. Error: {e}")
+
+    current_actions = pa.record_batch(delta_table.get_add_actions(flatten=True)).to_pylist()
+    previous_table = deltalake.DeltaTable(delta_table.table_uri, version=since_version, storage_options=storage_options)
+    previous_files = set(pa.record_batch(previous_table.get_add_actions(flatten=True)).column('path').to_pylist())
+    return {
+        action['path']: {key.removeprefix('partition.'): value for key, value in action.items() if key.startswith('partition.')}
+        for action in current_actions
+        if action['path'] not in previous_files and action.get('data_change', True)
+    }
+
+
+def create_partition_expression(partition_values: Dict[str, Optional[str]], schema: pa.Schema) -> ds.Expression:
+    """
+    Create the expression of the partition columns of a data file, which are not stored in the file itself.
+    """
+    expression = ds.scalar(True)
+    for column_name, value in partition_values.items():
+        field = ds.field(column_name)
+        if value is None:
+            expression = expression & field.is_null()
+        else:
+            expression = expression & (field == pa.scalar(value).cast(schema.field(column_name).type))
+    return expression
+
+
+def scan_files_added_since(delta_table: deltalake.DeltaTable, since_version: int, storage_options: dict) -> ds.Dataset:
+    """
+    Create a pyarrow dataset that only contains data files added after a version.
+
+    Args:
+        delta_table (DeltaTable): The source delta table loaded at the version to read up to.
+        since_version (int): The last version that has been consumed.
+        storage_options (dict): Credentials to access ADLS2.
+
+    Returns:
+        ds.Dataset: Dataset over the new data files.
+    """
+    delta_dataset = delta_table.to_pyarrow_dataset()
+    new_files = get_files_added_since(delta_table, since_version, storage_options, delta_dataset.filesystem)
+    new_fragments = [
+        delta_dataset.format.make_fragment(path, delta_dataset.filesystem, partition_expression=create_partition_expression(partition_values, delta_dataset.schema))
+        for path, partition_values in sorted(new_files.items())
+    ]
+    logging.info(f"{len(new_fragments)} new data files found in {delta_table.table_uri} since version {since_version}")
+
+    return ds.FileSystemDataset(new_fragments, delta_dataset.schema, delta_dataset.format, delta_dataset.filesystem)
+
+
+def read_delta_changes(source_table_path: str, since_version: int, storage_options: dict) -> Tuple[pl.DataFrame, int]:
+    """
+    Read rows added to a source delta table after the watermark version.
+    Change data feed is used when it is enabled on the source table, otherwise new files are found from the delta log.
+
+    Args:
+        source_table_path (str): The path of the source delta table.
+        since_version (int): The last source version that has been consumed.
+        storage_options (dict): Credentials to access ADLS2.
+
+    Returns:
+        Tuple[pl.DataFrame, int]: New rows and the source version they were read up to.
+    """
+    source_table = deltalake.DeltaTable(source_table_path, storage_options=storage_options)
+    current_version = source_table.version()
+
+    if current_version <= since_version:
+        logging.info(f"No new version in {source_table_path}. Current version {current_version}, watermark {since_version}")
+        return pl.from_arrow(pa.schema(source_table.schema().to_arrow()).empty_table()), current_version
+
+    if is_change_data_feed_enabled(source_table):
+        try:
+            new_rows = read_change_data_feed(source_table, since_version, current_version)
+            logging.info(f"Read {new_rows.height} rows from change data feed of {source_table_path} between version {since_version} and {current_version}")
+            return new_rows, current_version
+        except Exception as e:
+            logging.warning(f"Change data feed cannot be read for {source_table_path}. Reading new files from delta log. Error: {e}")
+
+    new_rows = pl.from_arrow(scan_files_added_since(source_table, since_version, storage_options).to_table())
+    logging.info(f"Read {new_rows.height} rows from delta log of {source_table_path} between version {since_version} and {current_version}")
+
+    return new_rows, current_version
@@ -0,0 +1,104 @@
+import json
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, List
+
+"""
+Queues used to fan work out to queue triggered functions.
+
+On Azure, messages are sent through the queue output binding of the HTTP function and every message
+triggers one invocation of the worker function. Concurrency of the workers is set by extensions.queues.batchSize
+in host.json, per instance. LocalQueue is a stand-in with the same send interface that runs the workers in threads
+of the current process, so a fan-out can run on a laptop together with the local storage backend.
+"""
+
+# Same as maxDequeueCount of Azure queue trigger. A message failing more often is moved to the poison list.
+MAX_DEQUEUE_COUNT = 5
+RETRY_POLL_SECONDS = 0.05
+
+
+class BindingQueue:
+    """
+    Collect messages and send them through a queue output binding (func.Out[List[str]]).
+    """
+
+    def __init__(self, output_binding):
+        self.output_binding = output_binding
+        self.messages: List[str] = []
+
+    def send_messages(self, messages: List[Dict[str, Any]]) -> None:
+        self.messages.extend(json.dumps(message) for message in messages)
+
+    def flush(self) -> None:
+        # The output binding can only be set once per invocation, so all messages are set together
+        self.output_binding.set(self.messages)
+        logging.info(f"Sent {len(self.messages)} messages to queue")
+
+
+class LocalQueue:
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self.poison_messages: List[Dict[str, Any]] = []
+
+    def send_messages(self, messages: List[Dict[str, Any]]) -> None:
+        for message in messages:
+            # Messages are serialized like on Azure, so a worker never shares objects with the sender
+            self._queue.put((json.dumps(message), 1))
+
+    def flush(self) -> None:
+        logging.info(f"{self._queue.qsize()} messages in local queue")
+
+    def run_workers(self, handler: Callable[[Dict[str, Any]], Any], worker_count: int) -> int:
+        """
+        Process every message with handler in worker_count threads until the queue is empty.
+        A failed message is put back and retried up to MAX_DEQUEUE_COUNT times.
+
+        Args:
+            handler (Callable[[Dict[str, Any]], Any]): The function processing one message.
+            worker_count (int): Number of messages processed concurrently.
+
+        Returns:
+            int: Number of messages processed successfully.
+        """
+        processed = []
+        in_flight = [0]
+        lock = threading.Lock()
+
+        def work() -> None:
+            while True:
+                try:
+                    with lock:
+                        body, dequeue_count = self._queue.get_nowait()
+                        in_flight[0] += 1
+                except queue.Empty:
+                    with lock:
+                        if in_flight[0] == 0:
+                            return
+                    # A message in flight might be put back for retry
+                    time.sleep(RETRY_POLL_SECONDS)
+                    continue
+                try:
+                    handler(json.loads(body))
+                    with lock:
+                        processed.append(body)
+                except Exception as e:
+                    logging.error(f"Message failed on attempt {dequeue_count}: {str(e)}")
+                    if dequeue_count < MAX_DEQUEUE_COUNT:
+                        self._queue.put((body, dequeue_count + 1))
+                    else:
+                        with lock:
+                            self.poison_messages.append(json.loads(body))
+                finally:
+                    with lock:
+                        in_flight[0] -= 1
+
+        threads = [threading.Thread(target=work, name=f"queue-worker-{index}") for index in range(max(worker_count, 1))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        logging.info(f"Local queue processed {len(processed)} messages, {len(self.poison_messages)} poison messages")
+        return len(processed)